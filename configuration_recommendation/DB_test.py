@@ -8,10 +8,11 @@ import re
 import paramiko
 import configparser
 import subprocess
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable
 import shutil
 import psycopg2
 from psycopg2 import sql
+import telemetry
 
 
 
@@ -219,9 +220,10 @@ def apply_pg_knobs(plan_knobs) -> List[str]:
 
         # Restart PostgreSQL to make all parameters take effect
         try:
-            subprocess.run(["sudo", "systemctl", "restart", "postgresql"], check=True)
+            with telemetry.stage('restart'):
+                subprocess.run(["sudo", "systemctl", "restart", "postgresql"], check=True)
+                time.sleep(5)  # Wait for the database restart to complete
             notes.append("PostgreSQL restarted successfully")
-            time.sleep(5)  # Wait for the database restart to complete
         except subprocess.CalledProcessError as e:
             error_msg = f"Failed to restart PostgreSQL: {e}"
             notes.append(error_msg)
@@ -231,6 +233,15 @@ def apply_pg_knobs(plan_knobs) -> List[str]:
         conn.close()
     return notes
 
+def apply_plan(plan: Dict[str, Any]) -> None:
+    # Knobs (with the restart), then indexes and matviews; each step is timed separately
+    with telemetry.stage('apply.knobs'):
+        apply_pg_knobs(plan.get('knobs', {}))
+    with telemetry.stage('apply.indexes'):
+        ensure_indexes(plan.get('indexes', []))
+    with telemetry.stage('apply.matviews'):
+        ensure_matviews(plan.get('matviews', []))
+
 def ensure_indexes(indexes: List[Dict[str, Any]]) -> List[str]:
     if not indexes:
         return []
@@ -321,11 +332,11 @@ def _run_sql_file(conn, sql_path: str) -> float:
     end = time.time()
     return end - start
 
-def test_by_job(plan: Dict[str, Any], query_dir: Optional[str] = None, log_file: Optional[str] = None) -> float:
+def test_by_job(plan: Dict[str, Any], query_dir: Optional[str] = None, log_file: Optional[str] = None, on_ready: Optional[Callable[[], None]] = None) -> float:
     # PostgreSQL version: apply knobs/indexes/matviews, then run SQL files in JOB workload
-    apply_pg_knobs(plan.get('knobs', {}) )
-    ensure_indexes(plan.get('indexes', []))
-    ensure_matviews(plan.get('matviews', []))
+    apply_plan(plan)
+    if on_ready:
+        on_ready()
 
     if not query_dir:
         query_dir = os.getenv('JOB_QUERY_DIR', '')
@@ -348,11 +359,11 @@ def test_by_job(plan: Dict[str, Any], query_dir: Optional[str] = None, log_file:
     return total_time
 
     
-def test_by_tpcc(plan: Dict[str, Any],  clients: int = 32, duration: int = 120, report_interval: int = 60) -> float:
+def test_by_tpcc(plan: Dict[str, Any],  clients: int = 32, duration: int = 120, report_interval: int = 60, on_ready: Optional[Callable[[], None]] = None) -> float:
     # Apply changes then run pgbench as a stand-in workload and parse TPS
-    apply_pg_knobs(plan.get('knobs', {}))
-    ensure_indexes(plan.get('indexes', []))
-    ensure_matviews(plan.get('matviews', []))
+    apply_plan(plan)
+    if on_ready:
+        on_ready()
 
     params = _load_pg_conn_params()
     env = os.environ.copy()
@@ -382,11 +393,11 @@ def test_by_tpcc(plan: Dict[str, Any],  clients: int = 32, duration: int = 120,
         return 0.0
     
 
-def test_by_sysbench(plan: Dict[str, Any], threads: int = 32, duration: int = 120, report_interval: int = 60, tables: int = 50, table_size: int = 1000000, log_file: Optional[str] = None) -> float:
+def test_by_sysbench(plan: Dict[str, Any], threads: int = 32, duration: int = 120, report_interval: int = 60, tables: int = 50, table_size: int = 1000000, log_file: Optional[str] = None, on_ready: Optional[Callable[[], None]] = None) -> float:
     # Apply changes then run sysbench (pgsql) and parse TPS
-    apply_pg_knobs(plan.get('knobs', {}))
-    ensure_indexes(plan.get('indexes', []))
-    ensure_matviews(plan.get('matviews', []))
+    apply_plan(plan)
+    if on_ready:
+        on_ready()
 
     params = _load_pg_conn_params()
     command = [
@@ -417,11 +428,11 @@ def test_by_sysbench(plan: Dict[str, Any], threads: int = 32, duration: int = 12
 def unknown_benchmark(name):
     print(f"Unknown benchmark: {name}")
 
-def test_by_tpcds(plan: Dict[str, Any], query_dir: Optional[str] = None, log_file: Optional[str] = None) -> float:
+def test_by_tpcds(plan: Dict[str, Any], query_dir: Optional[str] = None, log_file: Optional[str] = None, on_ready: Optional[Callable[[], None]] = None) -> float:
     # PostgreSQL version: apply knobs/indexes/matviews, then run TPC-DS SQL files
-    apply_pg_knobs(plan.get('knobs', {}))
-    ensure_indexes(plan.get('indexes', []))
-    ensure_matviews(plan.get('matviews', []))
+    apply_plan(plan)
+    if on_ready:
+        on_ready()
 
     if not query_dir:
         query_dir = os.getenv('TPCDS_QUERY_DIR', '')
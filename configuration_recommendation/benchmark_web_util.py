@@ -0,0 +1,83 @@
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from web_util import extract_text_stream
+
+
+def extract_text_bs4(html_src):
+    """ The previous BeautifulSoup-based extraction, kept as the benchmark baseline. """
+    parsed = BeautifulSoup(html_src, features="html.parser")
+    for script in parsed(["script", "style"]):
+        script.extract()
+    lines = [line.strip() for line in parsed.get_text().splitlines()]
+    clean_lines = []
+    for line in lines:
+        clean_lines += [part.strip() for part in line.split("  ")]
+    return [line for line in clean_lines if len(line) > 2]
+
+
+def synthetic_page(sections=400):
+    """ A documentation-like page: navigation, sidebar, inline scripts, prose and tables. """
+    nav = '<nav><ul>' + ''.join(f'<li><a href="/p{i}">Chapter {i}</a></li>' for i in range(200)) + '</ul></nav>'
+    body = []
+    for i in range(sections):
+        body.append(f'<h2>19.{i} Parameter group {i}</h2>')
+        body.append(f'<p>shared_buffers ({i}) sets the amount of memory the database server uses for shared '
+                    f'memory buffers. The default is typically 128 megabytes.</p>')
+        body.append('<script>window.dataLayer.push({"event": "view", "section": %d});</script>' % i)
+        body.append('<table>' + ''.join(f'<tr><td>knob_{i}_{j}</td><td>{j * 8}MB</td></tr>' for j in range(5)) + '</table>')
+    main = '\n'.join(body)
+    return ('<html><head><title>Server Configuration</title><style>body{margin:0}</style></head><body>'
+            f'<header>Site header</header>{nav}<main>{main}</main>'
+            '<aside>Related pages</aside><footer>Copyright</footer></body></html>').encode('utf-8')
+
+
+def _load_fixtures(paths):
+    files = []
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, '*.htm*'))) if os.path.isdir(path) else [path]
+    fixtures = []
+    for name in files:
+        with open(name, 'rb') as f:
+            fixtures.append((os.path.basename(name), f.read()))
+    return fixtures or [('synthetic.html', synthetic_page())]
+
+
+def _measure(fn, html_src, repeat):
+    tracemalloc.start()
+    lines = fn(html_src)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(html_src)
+    return (time.perf_counter() - start) / repeat, peak, len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark HTML text extraction on saved pages')
+    parser.add_argument('paths', nargs='*', help='HTML files or directories of saved pages (default: a synthetic page)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max_lines', type=int, default=100, help='line limit for the early-stop variant')
+    args = parser.parse_args()
+
+    variants = [
+        ('bs4', extract_text_bs4),
+        ('stream', lambda src: extract_text_stream([src])),
+        (f'stream<= {args.max_lines}', lambda src: extract_text_stream([src], max_lines=args.max_lines)),
+    ]
+    print(f"{'fixture':<28}{'variant':<14}{'KB':>8}{'ms':>10}{'MB/s':>8}{'peak KB':>10}{'lines':>8}")
+    for name, html_src in _load_fixtures(args.paths):
+        for label, fn in variants:
+            elapsed, peak, n = _measure(fn, html_src, args.repeat)
+            print(f"{name[:27]:<28}{label:<14}{len(html_src) / 1024:>8.0f}{elapsed * 1000:>10.1f}"
+                  f"{len(html_src) / elapsed / 1e6:>8.1f}{peak / 1024:>10.0f}{n:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+import json
+import os
+import time
+from typing import Any, Dict
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    """Replace the checkpoint at path atomically.
+
+    The state is written to <path>.tmp, synced to disk and renamed over the
+    old checkpoint, so a crash at any point leaves either the previous or
+    the new checkpoint, never a partial one.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        # default=str: a stray non-JSON value in a stats delta must not lose the checkpoint
+        json.dump({'version': CHECKPOINT_VERSION, 'saved_at': time.time(), **state}, f,
+                  ensure_ascii=False, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    version = state.pop('version', None)
+    if version != CHECKPOINT_VERSION:
+        raise ValueError(f"Unknown checkpoint version '{version}'. Supported: [{CHECKPOINT_VERSION}]")
+    return state
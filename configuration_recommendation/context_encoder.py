@@ -0,0 +1,152 @@
+import json
+import math
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+# Resolved on the first count_tokens call: loading the encoding can download
+# its BPE file, which the default json context format never needs
+_ENCODING = None
+_ENCODING_LOADED = False
+
+
+# List sections are ranked by the first of these fields their rows have
+RANK_KEYS = ('total_exec_time_ms', 'calls', 'idx_scan', 'est_rows', 'total_bytes', 'samples')
+
+
+def _get_encoding():
+    global _ENCODING, _ENCODING_LOADED
+    if not _ENCODING_LOADED:
+        try:
+            import tiktoken
+            _ENCODING = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # tiktoken is optional; fall back to ~4 characters per token
+            _ENCODING = None
+        _ENCODING_LOADED = True
+    return _ENCODING
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _num(value, digits: int) -> str:
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer() and abs(value) < 1e15):
+        return str(int(value))
+    if 0.9 < abs(value) < 1:
+        # Ratios close to 1 (hit ratios): keep the significant digits of 1 - x
+        digits += int(-math.log10(1 - abs(value)))
+    return f"{value:.{digits}g}"
+
+
+def _cell(value, digits: int, max_text: int) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)):
+        return _num(value, digits)
+    if isinstance(value, str):
+        text = re.sub(r'\s+', ' ', value).strip().replace('|', '/')
+        return text if len(text) <= max_text else text[:max_text - 3] + '...'
+    if isinstance(value, list):
+        if value and isinstance(value[0], dict):
+            return ';'.join('/'.join(_cell(v, digits, max_text) for v in item.values()) for item in value)
+        return ','.join(_cell(v, digits, max_text) for v in value)
+    if isinstance(value, dict):
+        parts = []
+        for k, v in value.items():
+            if isinstance(v, dict):
+                parts.append(f"{k}:" + '/'.join(_cell(x, digits, max_text) for x in v.values()))
+            else:
+                parts.append(f"{k}={_cell(v, digits, max_text)}")
+        return ';'.join(parts)
+    return str(value)
+
+
+def _header(key: str, sample) -> str:
+    # Nested records are flattened into one cell; name their fields once in the header
+    if isinstance(sample, list) and sample and isinstance(sample[0], dict):
+        return f"{key}[{'/'.join(sample[0].keys())}]"
+    if isinstance(sample, dict) and sample and isinstance(next(iter(sample.values())), dict):
+        return f"{key}{{name:{'/'.join(next(iter(sample.values())).keys())}}}"
+    return key
+
+
+def _rank(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    key = next((k for k in RANK_KEYS if rows and k in rows[0]), None)
+    if key is None:
+        return rows
+    return sorted(rows, key=lambda r: -(r.get(key) or 0))
+
+
+def _table(name: str, rows: List[Dict[str, Any]], k: int, digits: int, max_text: int) -> List[str]:
+    cols = list(dict.fromkeys(c for r in rows for c in r))
+    shown = f"top {k} of {len(rows)}" if k < len(rows) else f"{len(rows)} rows"
+    out = [f"## {name} ({shown})", '|'.join(_header(c, next((r[c] for r in rows if r.get(c)), None)) for c in cols)]
+    for r in rows[:k]:
+        out.append('|'.join(_cell(r.get(c), digits, max_text) for c in cols))
+    return out
+
+
+def _section(name: str, value, k: Optional[int], digits: int, max_text: int) -> List[str]:
+    if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        return _table(name, value, len(value) if k is None else k, digits, max_text)
+    if isinstance(value, dict):
+        scalars = {key: v for key, v in value.items() if not isinstance(v, (dict, list))}
+        out = [f"## {name}"]
+        if scalars:
+            out.append(', '.join(f"{key}={_cell(v, digits, max_text)}" for key, v in scalars.items()))
+        for key, v in value.items():
+            if isinstance(v, dict) and v and all(isinstance(x, dict) for x in v.values()):
+                out += _table(f"{name}.{key}", [{'name': n, **x} for n, x in v.items()], len(v), digits, max_text)
+            elif isinstance(v, list) and v and all(isinstance(x, dict) for x in v):
+                out += _table(f"{name}.{key}", v, len(v), digits, max_text)
+            elif isinstance(v, (dict, list)):
+                out.append(f"{key}: {_cell(v, digits, max_text)}")
+        return out
+    return [f"## {name}", _cell(value, digits, max_text)]
+
+
+def encode_context(payload: Dict[str, Any], token_budget: int = 0, digits: int = 3,
+                   max_text: int = 400) -> Tuple[str, Dict[str, Any]]:
+    """Encode a get_features task payload as compact text for a prompt.
+
+    List sections become '|'-separated tables ranked by RANK_KEYS; numbers
+    keep `digits` significant digits and text cells are cut at max_text
+    characters. With token_budget > 0 the largest list section is shortened
+    until the whole context fits (or every list is down to one row).
+
+    Returns (text, stats) where stats maps each section to its token count
+    and kept/total rows, plus 'total_tokens'.
+    """
+    sections = {k: (_rank(v) if isinstance(v, list) and v and all(isinstance(x, dict) for x in v) else v)
+                for k, v in payload.items() if k != 'task'}
+    keep = {k: len(v) for k, v in sections.items() if isinstance(v, list) and v and isinstance(v[0], dict)}
+
+    rendered = {k: '\n'.join(_section(k, v, keep.get(k), digits, max_text)) for k, v in sections.items()}
+    tokens = {k: count_tokens(t) for k, t in rendered.items()}
+    while token_budget and sum(tokens.values()) > token_budget:
+        shrinkable = [k for k in keep if keep[k] > 1]
+        if not shrinkable:
+            break
+        largest = max(shrinkable, key=lambda k: tokens[k])
+        keep[largest] = max(1, int(keep[largest] * 0.75))
+        rendered[largest] = '\n'.join(_section(largest, sections[largest], keep[largest], digits, max_text))
+        tokens[largest] = count_tokens(rendered[largest])
+
+    text = '\n'.join(rendered.values())
+    stats: Dict[str, Any] = {
+        k: {'tokens': tokens[k], **({'rows': keep[k], 'total_rows': len(sections[k])} if k in keep else {})}
+        for k in rendered
+    }
+    stats['total_tokens'] = count_tokens(text)
+    return text, stats
+
+
+def json_tokens(payload: Dict[str, Any]) -> int:
+    """Token count of the indented-JSON form, for comparison with encode_context."""
+    return count_tokens(json.dumps(payload, ensure_ascii=False, indent=2))
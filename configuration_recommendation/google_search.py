@@ -1,91 +1,253 @@
 import argparse
-import hashlib
+import http.client
 import json
 import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urljoin, urlsplit
 import pandas as pd
-from googleapiclient.discovery import build
-from urllib.request import urlopen
-from web_util import extract_text
+from web_util import extract_text_stream, MAX_PARSE_BYTES
+from search_cache import SearchCache
+from line_ranker import rank_lines
+import telemetry
 import configparser
 
 config = configparser.ConfigParser()
 config.read('../config.ini')
 
+# REST endpoint behind googleapiclient's customsearch v1; overridable for local testing
+CSE_ENDPOINT = config.get('configuration recommender', 'cse_endpoint', fallback='').strip() \
+    or 'https://www.googleapis.com/customsearch/v1'
+FETCH_WORKERS = int(config.get('configuration recommender', 'fetch_workers', fallback='') or 8)
+FETCH_TIMEOUT = 5
+# Per-page bounds: bytes downloaded and lines kept (pages are cached with at most this many lines)
+MAX_DOWNLOAD_BYTES = int(float(config.get('configuration recommender', 'max_download_mb', fallback='') or 4) * 1024 * 1024)
+MAX_PAGE_LINES = int(config.get('configuration recommender', 'max_page_lines', fallback='') or 500)
+# Lines gathered per requested line before ranking picks the best line_limit
+RANK_POOL_FACTOR = int(config.get('configuration recommender', 'rank_pool_factor', fallback='') or 5)
+CACHE_TTL_HOURS = float(config.get('configuration recommender', 'cache_ttl_hours', fallback='') or 7 * 24)
+CACHE_MAX_MB = float(config.get('configuration recommender', 'cache_max_mb', fallback='') or 256)
+
+
+class HttpClient:
+    """ Minimal keep-alive HTTP(S) client: one persistent connection per host and thread. """
+
+    def __init__(self, timeout=FETCH_TIMEOUT, max_redirects=5):
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+        self.bytes_received = 0
+
+    def _connection(self, scheme, netloc):
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = conns[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def _drop(self, scheme, netloc):
+        conn = self._local.conns.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _open(self, url):
+        """ Send a GET for url following redirects; returns (connection key, response) with the body unread. """
+        for _ in range(self.max_redirects + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                raise ValueError(f'Unsupported URL scheme: {url}')
+            path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+            headers = {'User-Agent': 'Mozilla/5.0 (compatible; IDSTune)', 'Connection': 'keep-alive'}
+            # A pooled connection may have been closed by the server; retry once on a fresh one
+            for attempt in range(2):
+                conn = self._connection(parts.scheme, parts.netloc)
+                try:
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    break
+                except (http.client.HTTPException, ConnectionError) as err:
+                    self._drop(parts.scheme, parts.netloc)
+                    if attempt:
+                        raise err
+                except Exception:
+                    self._drop(parts.scheme, parts.netloc)
+                    raise
+            key = (parts.scheme, parts.netloc)
+            if response.status == 200:
+                return key, response
+            response.read()
+            if response.will_close:
+                self._drop(*key)
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                url = urljoin(url, response.getheader('Location'))
+                continue
+            raise http.client.HTTPException(f'HTTP {response.status} for {url}')
+        raise http.client.HTTPException(f'Too many redirects for {url}')
+
+    def iter_body(self, url, max_bytes=None, chunk_size=64 * 1024, cancel=None):
+        """ GET url and yield its body in chunks, stopping after max_bytes or once cancel (an Event) is set.
+
+        If the body is not read to the end (limit reached, cancelled or the
+        consumer stopped early) the connection is discarded instead of reused.
+        """
+        key, response = self._open(url)
+        received = 0
+        complete = False
+        try:
+            while (not max_bytes or received < max_bytes) and not (cancel is not None and cancel.is_set()):
+                chunk = response.read(min(chunk_size, max_bytes - received) if max_bytes else chunk_size)
+                if not chunk:
+                    complete = True
+                    break
+                received += len(chunk)
+                with self._lock:
+                    self.bytes_received += len(chunk)
+                yield chunk
+        finally:
+            if not complete or response.will_close:
+                self._drop(*key)
+
+    def get(self, url, max_bytes=None):
+        """ GET url following redirects; returns the body bytes (at most max_bytes) or raises on error. """
+        return b''.join(self.iter_body(url, max_bytes))
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+        self._local = threading.local()
+
+
+def iter_google_results(query_one, api_key, cse_id, client=None, endpoint=CSE_ENDPOINT):
+    """ Lazily page through the search engine results for query_one.
+
+    Each result page (10 items) is requested only when the consumer asks
+    for items beyond the previous one, so stopping early saves API calls.
+
+    Returns:
+        A generator of search result items.
+    """
+    client = client or HttpClient()
+    for start in range(1, 100, 10):
+        print(f'Retrieving results starting from index {start}')
+        params = {'q': query_one, 'cx': cse_id, 'key': api_key, 'start': start, 'lr': 'lang_en', 'dateRestrict': 'y1'}
+        page = json.loads(client.get(f'{endpoint}?{urlencode(params)}'))
+        items = page.get('items', [])
+        yield from items
+        if not items or 'nextPage' not in page.get('queries', {}):
+            return
+
+
 def google_query(query_one, api_key, cse_id):
     """ Uses specified search engine to query_one, returns results. 
     
     Returns:
         A list of search result items.
     """
-    query_service = build(
-        "customsearch", "v1", developerKey=api_key)
-    all_results = []
-    for start in range(1, 100, 10):
-        print(f'Retrieving results starting from index {start}')
-        query_results = query_service.cse().list(
-            q=query_one, cx=cse_id, start=start, lr='lang_en', 
-            dateRestrict='y1').execute()
-        all_results += query_results['items']
-    return all_results
+    return list(iter_google_results(query_one, api_key, cse_id))
 
-def get_web_text(url):
+def get_web_text(url, client=None):
     """ Extract text passages from given URL body. 
     
     Returns:
         Lines from Web site or None if not retrievable.
     """
+    return _fetch_page(url, client or HttpClient(), None)
+
+
+def _fetch_page(url, client, cache, cancel=None):
+    """ Lines of url from the page cache, downloading (and caching) them on a miss; None if the download failed or was cancelled. """
+    if cache is not None:
+        lines = cache.get_page(url)
+        if lines is not None:
+            return lines
+    if cancel is not None and cancel.is_set():
+        return None
     try:
-        html_src = urlopen(url, timeout=5).read()
-        print(f'Retrieved url {url}')
-        return extract_text(html_src)
-    except:
-        return []
+        # Parse while downloading; stops reading once enough lines were extracted
+        lines = extract_text_stream(client.iter_body(url, MAX_DOWNLOAD_BYTES, cancel=cancel), MAX_PAGE_LINES,
+                                    min(MAX_PARSE_BYTES, MAX_DOWNLOAD_BYTES))
+    except Exception:
+        # Failed downloads are not cached, so the next search retries them
+        return None
+    if cancel is not None and cancel.is_set():
+        # Possibly cut short; a partial page must not be cached
+        return None
+    print(f'Retrieved url {url}: {len(lines)} lines')
+    if cache is not None:
+        cache.put_page(url, lines)
+    return lines
+
+
+def fetch_pages(urls, client=None, workers=FETCH_WORKERS, cache=None):
+    """ Download and extract pages concurrently, yielding (url, lines) in input order.
+
+    lines is None for pages that could not be downloaded.
+
+    At most `workers` pages are in flight; urls is consumed lazily, so when the
+    caller stops iterating no further URLs (or result pages) are requested.
+    Closing the generator cancels the downloads still in flight and waits for
+    their threads, so client can be closed right after.
+    Pages found in cache are not downloaded again.
+    """
+    client = client or HttpClient()
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='fetch')
+    cancel = threading.Event()
+    pending = deque()
+    urls = iter(urls)
+    try:
+        while True:
+            while len(pending) < max(1, workers):
+                url = next(urls, None)
+                if url is None:
+                    break
+                pending.append((url, pool.submit(_fetch_page, url, client, cache, cancel)))
+            if not pending:
+                return
+            url, future = pending.popleft()
+            yield url, future.result()
+    finally:
+        cancel.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+
 
 def can_parse(result):
     """ Returns true iff the search result can be used. """
     return True if not '.pdf' in result['link'] else False
 
 
-def _resolve_cache_file(keyword, line_limit, cache_dir):
-    """Build a deterministic cache file path for a keyword and line limit."""
-    cache_key = f'{keyword}|{line_limit}'
-    file_name = hashlib.md5(cache_key.encode('utf-8')).hexdigest() + '.json'
-    return os.path.join(cache_dir, file_name)
+_CACHES = {}
 
 
-def _load_cached_lines(cache_file):
-    """Load cached lines if cache file exists and has valid format."""
-    if not os.path.exists(cache_file):
-        return None
-    try:
-        with open(cache_file, 'r', encoding='utf-8') as fp:
-            cached = json.load(fp)
-        if isinstance(cached, list):
-            print(f'Cache hit: {cache_file}')
-            return cached
-    except Exception as err:
-        print(f'Failed to load cache {cache_file}: {err}')
-    return None
-
-
-def _save_cached_lines(cache_file, lines):
-    """Persist lines to cache file."""
-    try:
-        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
-        with open(cache_file, 'w', encoding='utf-8') as fp:
-            json.dump(lines, fp, ensure_ascii=False)
-        print(f'Cache saved: {cache_file}')
-    except Exception as err:
-        print(f'Failed to save cache {cache_file}: {err}')
+def get_search_cache(cache_dir):
+    """ Shared SearchCache stored under cache_dir (one per directory and process). """
+    path = os.path.abspath(os.path.join(cache_dir, 'search_cache.sqlite'))
+    if path not in _CACHES:
+        _CACHES[path] = SearchCache(path, ttl=CACHE_TTL_HOURS * 3600, max_bytes=int(CACHE_MAX_MB * 1024 * 1024))
+    return _CACHES[path]
 
-def search_lines(keyword, line_limit, api_key=None, cse_id=None):
-    """Search pages via Google CSE and return extracted text lines.
+
+def search_lines(keyword, line_limit, api_key=None, cse_id=None, domain=None):
+    """Search pages via Google CSE and return the most relevant extracted text lines.
+
+    Up to RANK_POOL_FACTOR * line_limit candidate lines are collected across
+    the result pages, then ranked against keyword and domain (rank_lines).
 
     Args:
         keyword: Search keyword or query string.
         line_limit: Maximum number of lines to return (int).
         api_key: Optional Google API key. Falls back to env var GOOGLE_API_KEY.
         cse_id: Optional Programmable Search Engine ID. Falls back to env var GOOGLE_CSE_ID.
+        domain: Optional tuning domain (e.g. 'knob tuning') used as secondary ranking context.
 
     Returns:
         A list of strings (extracted text lines), capped by line_limit.
@@ -94,40 +256,46 @@ def search_lines(keyword, line_limit, api_key=None, cse_id=None):
     cse_id = cse_id or config['configuration recommender']['google_cse_id']
     cache_dir = config['configuration recommender'].get('cache_dir', '').strip()
     line_limit = int(line_limit)
+    pool_size = line_limit * max(1, RANK_POOL_FACTOR)
 
-    if cache_dir:
-        cache_file = _resolve_cache_file(keyword, line_limit, cache_dir)
-        cached_lines = _load_cached_lines(cache_file)
-        if cached_lines is not None:
-            return cached_lines[:line_limit]
-    else:
-        cache_file = None
+    cache = get_search_cache(cache_dir) if cache_dir else None
+    if cache is not None:
+        cached_pages = cache.lines_for_query(keyword, pool_size)
+        if cached_pages is not None:
+            print(f'Cache hit: {keyword}')
+            pool = [line for lines in cached_pages for line in lines][:pool_size]
+            return rank_lines(pool, keyword, line_limit, domain)
 
     if not api_key or not cse_id:
         raise ValueError('Provide api_key and cse_id or set env GOOGLE_API_KEY and GOOGLE_CSE_ID')
 
-    items = google_query(keyword, api_key, cse_id)
+    client = HttpClient()
+    urls = (result['link'] for result in iter_google_results(keyword, api_key, cse_id, client)
+            if result.get('link') and can_parse(result))
     results = []
-    for docid, result in enumerate(items):
-        url = result.get('link')
-        if not url:
-            continue
-        print(url)
-        if can_parse(result):
-            print('Processing document')
-            lines = get_web_text(url)
-            for line in lines:
-                results.append(line)
-                if len(results) >= line_limit:
-                    if cache_file:
-                        _save_cached_lines(cache_file, results)
-                    return results
-        else:
-            print('Did not process document')
-
-    if cache_file:
-        _save_cached_lines(cache_file, results)
-    return results
+    fetched = []
+    exhausted = True
+    pages = fetch_pages(urls, client, cache=cache)
+    try:
+        for url, lines in pages:
+            if lines is None:
+                # Not cached; recording it in the query would make every later lookup a miss
+                continue
+            print(f'Processed {url}')
+            fetched.append(url)
+            results.extend(lines)
+            if len(results) >= pool_size:
+                exhausted = False
+                break
+    finally:
+        # Stops and waits for in-flight downloads before their connections are closed and counted
+        pages.close()
+        client.close()
+        telemetry.count(bytes_received=client.bytes_received)
+
+    if cache is not None:
+        cache.put_query(keyword, fetched, exhausted)
+    return rank_lines(results[:pool_size], keyword, line_limit, domain)
 
 
 def main():
@@ -143,16 +311,11 @@ def main():
     # Write Google query_one results into file
     items = google_query(args.query_one, args.key, args.cse)
     rows = []
-    for docid, result in enumerate(items):
-        url = result['link']
+    urls = [result['link'] for result in items if can_parse(result)]
+    for docid, (url, lines) in enumerate(fetch_pages(urls)):
         print(url)
-        if can_parse(result):
-            print('Processing document')
-            lines = get_web_text(url)
-            for line in lines:
-                rows.append([docid, line])
-        else:
-            print('Did not process document')
+        for line in lines or []:
+            rows.append([docid, line])
     data = pd.DataFrame(rows, columns=['filenr', 'sentence'])
     data.to_csv(args.out_path, index=False)
 
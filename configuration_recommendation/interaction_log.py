@@ -0,0 +1,319 @@
+import argparse
+import atexit
+import copy
+import gzip
+import hashlib
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# -----------------------------
+# Record encoders (run on the writer thread)
+# -----------------------------
+
+class PromptDedupEncoder:
+    """llm_call records reference message bodies by content hash.
+
+    Each distinct body is written once per log segment as a 'prompt' record,
+    so repeated schema/context text costs a hash instead of its full size.
+    """
+
+    def __init__(self) -> None:
+        self.seen = set()
+
+    def reset(self) -> None:
+        self.seen = set()
+
+    def encode(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if record.get('type') != 'llm_call':
+            return [record]
+        out = []
+        messages = []
+        for message in record.get('messages', []):
+            text = message['content']
+            digest = hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+            if digest not in self.seen:
+                self.seen.add(digest)
+                out.append({'type': 'prompt', 'hash': digest, 'text': text})
+            messages.append({'role': message['role'], 'hash': digest})
+        out.append({**record, 'messages': messages})
+        return out
+
+
+def _item_key(item: Any) -> str:
+    return json.dumps(item, sort_keys=True, ensure_ascii=False)
+
+
+def plan_delta(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Top-level diff: dicts by key (set/unset), lists by item (add/remove), other values replaced."""
+    delta = {}
+    for key in set(old) | set(new):
+        if key not in new:
+            delta[key] = {'drop': True}
+            continue
+        a, b = old.get(key), new[key]
+        if a == b:
+            continue
+        if isinstance(a, dict) and isinstance(b, dict):
+            d = {}
+            changed = {k: v for k, v in b.items() if k not in a or a[k] != v}
+            removed = [k for k in a if k not in b]
+            if changed:
+                d['set'] = changed
+            if removed:
+                d['unset'] = removed
+            delta[key] = d
+        elif isinstance(a, list) and isinstance(b, list):
+            old_keys = {_item_key(x) for x in a}
+            new_keys = {_item_key(x) for x in b}
+            d = {}
+            added = [x for x in b if _item_key(x) not in old_keys]
+            removed = [x for x in a if _item_key(x) not in new_keys]
+            if added:
+                d['add'] = added
+            if removed:
+                d['remove'] = removed
+            delta[key] = d
+        else:
+            delta[key] = {'replace': b}
+    return delta
+
+
+def apply_plan_delta(plan: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    plan = copy.deepcopy(plan)
+    for key, d in delta.items():
+        if d.get('drop'):
+            plan.pop(key, None)
+        elif 'replace' in d:
+            plan[key] = d['replace']
+        elif 'set' in d or 'unset' in d:
+            target = plan.setdefault(key, {})
+            target.update(d.get('set', {}))
+            for k in d.get('unset', []):
+                target.pop(k, None)
+        else:
+            removed = {_item_key(x) for x in d.get('remove', [])}
+            plan[key] = [x for x in plan.get(key, []) if _item_key(x) not in removed] + d.get('add', [])
+    return plan
+
+
+class PlanDeltaEncoder:
+    """'plan' records become one plan_snapshot per log segment, then plan_delta records."""
+
+    def __init__(self) -> None:
+        self.last: Optional[Dict[str, Any]] = None
+
+    def reset(self) -> None:
+        self.last = None
+
+    def encode(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if record.get('type') != 'plan':
+            return [record]
+        plan = record.pop('plan')
+        meta = {k: v for k, v in record.items() if k != 'type'}
+        if self.last is None:
+            out = {'type': 'plan_snapshot', **meta, 'plan': plan}
+        else:
+            out = {'type': 'plan_delta', **meta, 'delta': plan_delta(self.last, plan)}
+        self.last = plan
+        return [out]
+
+
+# -----------------------------
+# Writer
+# -----------------------------
+
+class JsonlLog:
+    """Append-only JSONL log written by a background thread.
+
+    write() only enqueues; encoding, serialisation and file I/O happen on the
+    writer thread. When the file exceeds max_bytes it is gzip-compressed to
+    <path>.1.gz (older segments shift to .2.gz ... .<backups>.gz) and the
+    encoder is reset, so every segment can be read on its own.
+
+    profiler, if set (workload_compression/profiling.py), profiles encoding
+    and writing of each record as the stage log_write.<file name>.
+    """
+
+    def __init__(self, path: str, encoder=None, max_bytes: int = 64 * 1024 * 1024, backups: int = 5) -> None:
+        self.path = path
+        self.encoder = encoder
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.errors = 0
+        self.profiler = None
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f'log-{os.path.basename(self.path)}',
+                                                    daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+        self._queue.put(record)
+
+    def _run(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        f = open(self.path, 'a', encoding='utf-8')
+        try:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    self._queue.task_done()
+                    break
+                profiled = self.profiler.scope(f'log_write.{os.path.basename(self.path)}') if self.profiler else nullcontext()
+                try:
+                    with profiled:
+                        records = self.encoder.encode(record) if self.encoder else [record]
+                        for r in records:
+                            f.write(json.dumps(r, ensure_ascii=False, separators=(',', ':')) + '\n')
+                        # Batch whatever else is already queued before flushing
+                        if self._queue.empty():
+                            f.flush()
+                        if self.max_bytes and f.tell() >= self.max_bytes:
+                            f.close()
+                            self._rotate()
+                            f = open(self.path, 'a', encoding='utf-8')
+                except Exception as e:
+                    self.errors += 1
+                    if self.errors == 1:
+                        print(f"Warning: writing {self.path} failed: {e}")
+                finally:
+                    self._queue.task_done()
+        finally:
+            f.close()
+
+    def _rotate(self) -> None:
+        for i in range(self.backups - 1, 0, -1):
+            src = f'{self.path}.{i}.gz'
+            if os.path.exists(src):
+                os.replace(src, f'{self.path}.{i + 1}.gz')
+        if self.backups > 0:
+            with open(self.path, 'rb') as src, gzip.open(f'{self.path}.1.gz.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(f'{self.path}.1.gz.tmp', f'{self.path}.1.gz')
+        os.remove(self.path)
+        if self.encoder:
+            self.encoder.reset()
+
+    def flush(self) -> None:
+        """Block until everything queued so far has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+# -----------------------------
+# Reader
+# -----------------------------
+
+def segments(path: str) -> List[str]:
+    """All segments of a log, oldest first."""
+    rotated = []
+    i = 1
+    while os.path.exists(f'{path}.{i}.gz'):
+        rotated.append(f'{path}.{i}.gz')
+        i += 1
+    return rotated[::-1] + ([path] if os.path.exists(path) else [])
+
+
+def read_records(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (segment, record) across all segments of a log, oldest first."""
+    for seg in segments(path):
+        opener = gzip.open if seg.endswith('.gz') else open
+        with opener(seg, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash can leave a truncated last line
+                    continue
+                yield seg, record
+
+
+def iter_plans(path: str) -> Iterator[Dict[str, Any]]:
+    """Replay a plan log, yielding {'step', 'ts', 'agent', 'plan'} after every record.
+
+    step numbers the plan updates across all segments and sessions, from 1.
+    """
+    plan = None
+    step = 0
+    for _, record in read_records(path):
+        if record['type'] == 'plan_snapshot':
+            plan = record['plan']
+        elif record['type'] == 'plan_delta' and plan is not None:
+            plan = apply_plan_delta(plan, record['delta'])
+        else:
+            continue
+        step += 1
+        yield {'step': step, 'ts': record.get('ts'), 'agent': record.get('agent'), 'plan': plan}
+
+
+def iter_calls(path: str) -> Iterator[Dict[str, Any]]:
+    """Replay an LLM call log with message bodies restored from their prompt records."""
+    prompts: Dict[str, str] = {}
+    for _, record in read_records(path):
+        if record['type'] == 'prompt':
+            prompts[record['hash']] = record['text']
+        elif record['type'] == 'llm_call':
+            messages = [{'role': m['role'], 'content': prompts.get(m['hash'], f"<missing prompt {m['hash']}>")}
+                        for m in record.get('messages', [])]
+            yield {**record, 'messages': messages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect JSONL interaction logs (history/log, history/plan)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('plan', help='reconstruct plan states from a plan log')
+    p.add_argument('path', type=str)
+    p.add_argument('--step', type=int, default=None, help='plan state after this update (default: latest)')
+    p.add_argument('--list', action='store_true', help='list the recorded updates instead')
+    c = sub.add_parser('calls', help='print LLM calls with their prompts')
+    c.add_argument('path', type=str)
+    c.add_argument('--last', type=int, default=0, help='only the last N calls')
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        state = None
+        for state in iter_plans(args.path):
+            if args.list:
+                plan = state['plan']
+                print(f"{state['step']:>6}  {state['agent'] or '-':<20} knobs={len(plan.get('knobs', {}))} "
+                      f"indexes={len(plan.get('indexes', []))} matviews={len(plan.get('matviews', []))}")
+            if args.step is not None and state['step'] == args.step:
+                break
+        if state is None or (args.step is not None and state['step'] != args.step):
+            sys.exit(f"No plan state{' for step ' + str(args.step) if args.step is not None else ''} in {args.path}")
+        if not args.list:
+            print(json.dumps(state['plan'], indent=2, ensure_ascii=False))
+    else:
+        calls = list(iter_calls(args.path))
+        for call in calls[-args.last:] if args.last else calls:
+            print(f"=== {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(call['ts']))} {call.get('model')} "
+                  f"({call.get('elapsed_s', 0):.2f}s) ===")
+            for m in call['messages']:
+                print(f"--- {m['role']} ---\n{m['content']}")
+            print(f"--- output ---\n{call.get('output')}\n")
+
+
+if __name__ == '__main__':
+    main()
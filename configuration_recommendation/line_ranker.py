@@ -0,0 +1,94 @@
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+_TOKEN = re.compile(r"[a-z0-9_]+")
+_STOPWORDS = frozenset("""
+a an and are as at be by for from how in is it its of on or that the this to was were what when which with
+""".split())
+
+# Background vocabulary of each tuning domain, weighted below the search keyword
+DOMAIN_TERMS = {
+    'knob tuning': 'postgresql configuration parameter knob setting memory shared_buffers work_mem '
+                   'effective_cache_size checkpoint wal vacuum parallel performance',
+    'indexes recommendation': 'index indexes btree hash gin create scan column selectivity query performance',
+    'materialised views recommendation': 'materialized materialised view refresh aggregate join precompute query',
+    'optimization plan review': 'query plan explain cost estimate join scan configuration index performance',
+}
+
+
+def tokenize(text: str) -> List[str]:
+    # Identifiers such as shared_buffers stay one token
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def _bm25(docs: List[List[str]], weights: Dict[str, float], k1: float = 1.2, b: float = 0.75) -> np.ndarray:
+    """Weighted BM25 score of every tokenized line against the query term weights."""
+    vocab: Dict[str, int] = {}
+    rows, cols = [], []
+    for i, tokens in enumerate(docs):
+        for t in tokens:
+            rows.append(i)
+            cols.append(vocab.setdefault(t, len(vocab)))
+    n = len(docs)
+    scores = np.zeros(n)
+    query = {vocab[t]: w for t, w in weights.items() if t in vocab}
+    if not query or not rows:
+        return scores
+    # Sparse term counts as (line, term) -> tf
+    keys, tf = np.unique(np.array(rows, dtype=np.int64) * len(vocab) + np.array(cols), return_counts=True)
+    line, term = np.divmod(keys, len(vocab))
+    df = np.bincount(term, minlength=len(vocab))
+    length = np.bincount(np.array(rows), minlength=n).astype(float)
+    norm = k1 * (1 - b + b * length / max(length.mean(), 1e-9))
+    weight = np.zeros(len(vocab))
+    for t, w in query.items():
+        weight[t] = w * np.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+    hit = weight[term] > 0
+    np.add.at(scores, line[hit], weight[term[hit]] * tf[hit] * (k1 + 1) / (tf[hit] + norm[line[hit]]))
+    return scores
+
+
+def _shingles(tokens: List[str]) -> frozenset:
+    return frozenset(zip(tokens, tokens[1:])) if len(tokens) > 1 else frozenset(tokens)
+
+
+def rank_lines(lines: List[str], keyword: str, limit: int, domain: Optional[str] = None,
+               domain_weight: float = 0.3, min_tokens: int = 4, dedup_threshold: float = 0.8) -> List[str]:
+    """Top `limit` lines by relevance to keyword (and, more weakly, the tuning domain).
+
+    Lines are scored with BM25 over the candidate pool; lines shorter than
+    min_tokens (menus, buttons, cookie banners) are scaled down, and dropped
+    when they match nothing. Near duplicates, i.e. lines whose word-bigram
+    Jaccard similarity with an already chosen line reaches dedup_threshold,
+    are skipped.
+    """
+    docs = [tokenize(line) for line in lines]
+    weights: Dict[str, float] = {}
+    if domain:
+        for t in tokenize(DOMAIN_TERMS.get(domain, domain)):
+            weights[t] = domain_weight
+    for t in tokenize(keyword):
+        weights[t] = 1.0
+    lengths = np.array([len(d) for d in docs], dtype=float)
+    scores = _bm25(docs, weights) * np.minimum(1.0, lengths / min_tokens)
+
+    # Stable order: score, then original position (earlier pages first)
+    order = np.lexsort((np.arange(len(lines)), -scores))
+    chosen, seen, kept = [], set(), []
+    for i in order:
+        key = ' '.join(docs[i])
+        # Unmatched lines only pad the result, and never short boilerplate ones
+        if not key or key in seen or (scores[i] <= 0 and lengths[i] < min_tokens):
+            continue
+        sh = _shingles(docs[i])
+        if any(len(sh & other) >= dedup_threshold * len(sh | other) for other in kept):
+            continue
+        seen.add(key)
+        kept.append(sh)
+        chosen.append(lines[i])
+        if len(chosen) >= limit:
+            break
+    return chosen
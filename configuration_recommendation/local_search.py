@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import time
+import configparser
+from typing import Dict, List, Tuple, Optional
+
+import numpy as np
+
+from web_util import extract_text
+from line_ranker import tokenize
+
+config = configparser.ConfigParser()
+config.read('../config.ini')
+
+_TEXT_EXT = ('.txt', '.md', '.rst', '.sql', '.conf')
+_HTML_EXT = ('.html', '.htm', '.sgml', '.xml')
+INDEX_VERSION = 1
+
+
+def _document_lines(path: str) -> List[str]:
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if path.lower().endswith(_HTML_EXT):
+        # Local documents are trusted; parse them whole
+        return extract_text(raw, max_parse_bytes=None)
+    text = raw.decode('utf-8', errors='replace')
+    return [line.strip() for line in text.splitlines() if len(line.strip()) > 2]
+
+
+def _scan(doc_dir: str) -> List[Tuple[str, float, int]]:
+    files = []
+    for root, dirs, names in os.walk(doc_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(names):
+            if name.lower().endswith(_TEXT_EXT + _HTML_EXT):
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                files.append((os.path.relpath(path, doc_dir), st.st_mtime, st.st_size))
+    return files
+
+
+def build_index(doc_dir: str, index_dir: str) -> Dict[str, int]:
+    """Ingest every text/HTML document under doc_dir into a BM25 index in index_dir.
+
+    Each extracted line is one retrievable unit. On disk:
+      postings.npz  term_offsets, doc_ids, tfs (CSR by term), doc_len, line_offsets, line_source
+      lines.bin     UTF-8 text of all lines, sliced through line_offsets
+      meta.json     vocabulary, source files and the manifest used to detect changes
+    """
+    start = time.time()
+    manifest = _scan(doc_dir)
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doc_len = []
+    line_source = []
+    offsets = [0]
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, 'lines.bin.tmp'), 'wb') as blob:
+        for src, (rel, _, _) in enumerate(manifest):
+            for line in _document_lines(os.path.join(doc_dir, rel)):
+                tokens = tokenize(line)
+                if not tokens:
+                    continue
+                doc = len(doc_len)
+                counts: Dict[str, int] = {}
+                for t in tokens:
+                    counts[t] = counts.get(t, 0) + 1
+                for t, c in counts.items():
+                    postings.setdefault(t, []).append((doc, c))
+                doc_len.append(len(tokens))
+                line_source.append(src)
+                data = line.encode('utf-8')
+                blob.write(data)
+                offsets.append(offsets[-1] + len(data))
+
+    vocab = sorted(postings)
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum([len(postings[t]) for t in vocab], out=term_offsets[1:])
+    doc_ids = np.empty(term_offsets[-1], dtype=np.int32)
+    tfs = np.empty(term_offsets[-1], dtype=np.float32)
+    for i, t in enumerate(vocab):
+        p = np.array(postings[t], dtype=np.int64).reshape(-1, 2)
+        doc_ids[term_offsets[i]:term_offsets[i + 1]] = p[:, 0]
+        tfs[term_offsets[i]:term_offsets[i + 1]] = p[:, 1]
+
+    np.savez(os.path.join(index_dir, 'postings.tmp.npz'), term_offsets=term_offsets, doc_ids=doc_ids, tfs=tfs,
+             doc_len=np.array(doc_len, dtype=np.float32), line_offsets=np.array(offsets, dtype=np.int64),
+             line_source=np.array(line_source, dtype=np.int32))
+    with open(os.path.join(index_dir, 'meta.json.tmp'), 'w', encoding='utf-8') as f:
+        json.dump({'version': INDEX_VERSION, 'doc_dir': os.path.abspath(doc_dir), 'vocab': vocab,
+                   'sources': [m[0] for m in manifest], 'manifest': manifest}, f)
+    # Swap in the new index only once it is complete
+    for tmp, final in (('lines.bin.tmp', 'lines.bin'), ('postings.tmp.npz', 'postings.npz'), ('meta.json.tmp', 'meta.json')):
+        os.replace(os.path.join(index_dir, tmp), os.path.join(index_dir, final))
+    stats = {'documents': len(manifest), 'lines': len(doc_len), 'terms': len(vocab)}
+    print(f"Indexed {stats['documents']} documents, {stats['lines']} lines, {stats['terms']} terms "
+          f"in {time.time() - start:.1f}s -> {index_dir}")
+    return stats
+
+
+class LocalKnowledgeBase:
+    """BM25 retrieval over the lines of a build_index directory."""
+
+    def __init__(self, index_dir: str, k1: float = 1.2, b: float = 0.75) -> None:
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Index {index_dir} has version {meta.get('version')}, expected {INDEX_VERSION}")
+        self.meta = meta
+        self.terms = {t: i for i, t in enumerate(meta['vocab'])}
+        arrays = np.load(os.path.join(index_dir, 'postings.npz'))
+        self.term_offsets = arrays['term_offsets']
+        self.doc_ids = arrays['doc_ids']
+        self.tfs = arrays['tfs']
+        self.line_offsets = arrays['line_offsets']
+        self.line_source = arrays['line_source']
+        doc_len = arrays['doc_len']
+        self.n_docs = len(doc_len)
+        # BM25 length normalisation, precomputed per line
+        self.norm = k1 * (1 - b + b * doc_len / max(doc_len.mean(), 1e-9)) if self.n_docs else doc_len
+        self.k1 = k1
+        self.lines = np.memmap(os.path.join(index_dir, 'lines.bin'), dtype=np.uint8, mode='r') \
+            if self.line_offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+
+    def line(self, doc: int) -> str:
+        return bytes(self.lines[self.line_offsets[doc]:self.line_offsets[doc + 1]]).decode('utf-8')
+
+    def score(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for t in set(tokenize(query)):
+            i = self.terms.get(t)
+            if i is None:
+                continue
+            lo, hi = self.term_offsets[i], self.term_offsets[i + 1]
+            docs, tf = self.doc_ids[lo:hi], self.tfs[lo:hi]
+            idf = np.log(1 + (self.n_docs - (hi - lo) + 0.5) / ((hi - lo) + 0.5))
+            # Each line appears once per term, so plain fancy-index addition is safe
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + self.norm[docs])
+        return scores
+
+    def search(self, query: str, limit: int) -> List[Tuple[float, str, str]]:
+        """Top `limit` lines as (score, line, source document)."""
+        scores = self.score(query)
+        hits = np.flatnonzero(scores > 0)
+        if hits.size > limit:
+            hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+        hits = hits[np.lexsort((hits, -scores[hits]))]
+        return [(float(scores[d]), self.line(d), self.meta['sources'][self.line_source[d]]) for d in hits]
+
+
+def index_is_stale(doc_dir: str, index_dir: str) -> bool:
+    try:
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return True
+    return meta.get('version') != INDEX_VERSION or [list(m) for m in _scan(doc_dir)] != meta.get('manifest')
+
+
+_KB: Optional[LocalKnowledgeBase] = None
+
+
+def _knowledge_base() -> LocalKnowledgeBase:
+    global _KB
+    if _KB is None:
+        section = config['configuration recommender'] if config.has_section('configuration recommender') else {}
+        doc_dir = section.get('local_kb_dir', '').strip()
+        index_dir = section.get('local_kb_index', '').strip() or (os.path.join(doc_dir, '.bm25') if doc_dir else '')
+        if not index_dir:
+            raise ValueError('Set local_kb_dir (and optionally local_kb_index) in config.ini [configuration recommender]')
+        if doc_dir and index_is_stale(doc_dir, index_dir):
+            build_index(doc_dir, index_dir)
+        _KB = LocalKnowledgeBase(index_dir)
+    return _KB
+
+
+def search_lines(keyword, line_limit, api_key=None, cse_id=None, domain=None):
+    """Drop-in replacement for google_search.search_lines backed by the local index.
+
+    Lines are ranked by BM25 against keyword alone; domain is accepted for
+    signature compatibility.
+
+    Returns:
+        A list of strings (the best matching lines), capped by line_limit.
+    """
+    return [line for _, line, _ in _knowledge_base().search(keyword, int(line_limit))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the local BM25 knowledge base')
+    sub = parser.add_subparsers(dest='command', required=True)
+    b = sub.add_parser('build', help='index a directory of documents')
+    b.add_argument('doc_dir', type=str)
+    b.add_argument('index_dir', type=str)
+    q = sub.add_parser('query', help='query an index')
+    q.add_argument('index_dir', type=str)
+    q.add_argument('query', type=str)
+    q.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_index(args.doc_dir, args.index_dir)
+    else:
+        kb = LocalKnowledgeBase(args.index_dir)
+        start = time.perf_counter()
+        hits = kb.search(args.query, args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for score, line, source in hits:
+            print(f"{score:7.3f}  {source}: {line}")
+        print(f"{len(hits)} lines in {elapsed:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import threading
+import time
+import warnings
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import psycopg2
+
+from DB_test import _load_pg_conn_params
+
+
+# (metric, kind, SQL expression); counters are cumulative and summarised as
+# rates, gauges as levels. The expressions are combined into one SELECT per poll.
+_DB = "(SELECT {} FROM pg_stat_database WHERE datname = current_database())"
+_COMMON_METRICS = [
+    ('xact', 'counter', _DB.format('xact_commit + xact_rollback')),
+    ('blks_read', 'counter', _DB.format('blks_read')),
+    ('blks_hit', 'counter', _DB.format('blks_hit')),
+    ('tup_returned', 'counter', _DB.format('tup_returned')),
+    ('tup_written', 'counter', _DB.format('tup_inserted + tup_updated + tup_deleted')),
+    ('temp_files', 'counter', _DB.format('temp_files')),
+    ('temp_bytes', 'counter', _DB.format('temp_bytes')),
+    ('deadlocks', 'counter', _DB.format('deadlocks')),
+    ('buffers_clean', 'counter', "(SELECT buffers_clean FROM pg_stat_bgwriter)"),
+    ('maxwritten_clean', 'counter', "(SELECT maxwritten_clean FROM pg_stat_bgwriter)"),
+    ('active_backends', 'gauge', "(SELECT count(*) FROM pg_stat_activity WHERE state = 'active' AND pid <> pg_backend_pid())"),
+    ('waiting_backends', 'gauge', "(SELECT count(*) FROM pg_stat_activity WHERE state = 'active' AND wait_event IS NOT NULL AND pid <> pg_backend_pid())"),
+    ('lock_waits', 'gauge', "(SELECT count(*) FROM pg_locks WHERE NOT granted)"),
+    ('locks_held', 'gauge', "(SELECT count(*) FROM pg_locks WHERE granted)"),
+]
+# Checkpoint counters moved to pg_stat_checkpointer in PostgreSQL 17
+_CHECKPOINT_METRICS_16 = [
+    ('checkpoints_timed', 'counter', "(SELECT checkpoints_timed FROM pg_stat_bgwriter)"),
+    ('checkpoints_req', 'counter', "(SELECT checkpoints_req FROM pg_stat_bgwriter)"),
+    ('buffers_checkpoint', 'counter', "(SELECT buffers_checkpoint FROM pg_stat_bgwriter)"),
+    ('buffers_backend', 'counter', "(SELECT buffers_backend FROM pg_stat_bgwriter)"),
+]
+_CHECKPOINT_METRICS_17 = [
+    ('checkpoints_timed', 'counter', "(SELECT num_timed FROM pg_stat_checkpointer)"),
+    ('checkpoints_req', 'counter', "(SELECT num_requested FROM pg_stat_checkpointer)"),
+    ('buffers_checkpoint', 'counter', "(SELECT buffers_written FROM pg_stat_checkpointer)"),
+]
+# pg_stat_wal exists from PostgreSQL 14
+_WAL_METRICS = [
+    ('wal_bytes', 'counter', "(SELECT wal_bytes FROM pg_stat_wal)"),
+    ('wal_fpi', 'counter', "(SELECT wal_fpi FROM pg_stat_wal)"),
+    ('wal_buffers_full', 'counter', "(SELECT wal_buffers_full FROM pg_stat_wal)"),
+]
+
+_WAIT_EVENTS_SQL = """
+    SELECT wait_event_type || ':' || wait_event, count(*)
+    FROM pg_stat_activity
+    WHERE state = 'active' AND wait_event IS NOT NULL AND pid <> pg_backend_pid()
+    GROUP BY 1;
+"""
+
+
+def _metrics_for_version(version_num: int) -> List[Tuple[str, str, str]]:
+    metrics = list(_COMMON_METRICS)
+    metrics += _CHECKPOINT_METRICS_17 if version_num >= 170000 else _CHECKPOINT_METRICS_16
+    if version_num >= 140000:
+        metrics += _WAL_METRICS
+    return metrics
+
+
+class TimeSeries:
+    """Fixed-capacity array of samples (time + one column per metric).
+
+    When full, adjacent rows are merged pairwise (last counter value, mean
+    gauge value), halving the resolution instead of dropping the start of
+    the run; the first row keeps its time and counter values, the baseline
+    of every counter total.
+    Memory stays at capacity x (metrics + 1) floats.
+    """
+
+    def __init__(self, names: List[str], kinds: List[str], capacity: int = 512) -> None:
+        self.names = names
+        self.counter_mask = np.array([k == 'counter' for k in kinds])
+        self.capacity = max(4, capacity - capacity % 2)
+        self.data = np.full((self.capacity, len(names) + 1), np.nan)
+        self.size = 0
+        self.merges = 0
+
+    def append(self, t: float, values: List[Optional[float]]) -> None:
+        if self.size == self.capacity:
+            self._halve()
+        row = self.data[self.size]
+        row[0] = t
+        row[1:] = [np.nan if v is None else float(v) for v in values]
+        self.size += 1
+
+    def _halve(self) -> None:
+        pairs = self.data.reshape(self.capacity // 2, 2, -1)
+        merged = pairs[:, 1, :].copy()
+        gauges = np.concatenate(([False], ~self.counter_mask))
+        with warnings.catch_warnings():
+            # Columns that were never read (all NaN) stay NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            merged[:, gauges] = np.nanmean(pairs[:, :, gauges], axis=1)
+        # The first sample (time and counters) is the baseline of every counter total
+        merged[0, ~gauges] = pairs[0, 0, ~gauges]
+        self.data[:self.capacity // 2] = merged
+        self.data[self.capacity // 2:] = np.nan
+        self.size = self.capacity // 2
+        self.merges += 1
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.data[:self.size, 0], self.data[:self.size, 1:]
+
+
+def _stats(values: np.ndarray, times: np.ndarray) -> Dict[str, float]:
+    ok = ~np.isnan(values)
+    values, times = values[ok], times[ok]
+    if values.size == 0:
+        return {}
+    out = {
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'peak': float(values.max()),
+    }
+    # Least-squares slope per second; positive means growing during the run
+    if values.size >= 3 and times[-1] > times[0]:
+        out['trend_per_s'] = float(np.polyfit(times - times[0], values, 1)[0])
+    return out
+
+
+def summarize(series: TimeSeries, wait_events: Counter, top_waits: int = 10) -> Dict[str, Any]:
+    """Peaks, percentiles and trends of every metric over the sampled run."""
+    times, values = series.view()
+    summary: Dict[str, Any] = {
+        'samples': int(times.size),
+        'duration_s': float(times[-1] - times[0]) if times.size > 1 else 0.0,
+        'metrics': {},
+    }
+    if times.size == 0:
+        return summary
+    dt = np.diff(times)
+    for i, name in enumerate(series.names):
+        col = values[:, i]
+        if series.counter_mask[i]:
+            if times.size < 2:
+                continue
+            # Counter resets (e.g. pg_stat_reset) show up as negative steps
+            rates = np.clip(np.diff(col), 0, None) / np.where(dt > 0, dt, np.nan)
+            entry = {'total': float(np.nansum(np.clip(np.diff(col), 0, None)))}
+            entry.update({f'rate_{k}': v for k, v in _stats(rates, times[1:]).items()})
+        else:
+            entry = _stats(col, times)
+        if entry:
+            summary['metrics'][name] = entry
+    waited = sum(wait_events.values())
+    summary['wait_events'] = [
+        {'event': e, 'samples': n, 'share': n / waited} for e, n in wait_events.most_common(top_waits)
+    ]
+    return summary
+
+
+class MetricsSampler:
+    """Background thread polling server metrics while a benchmark runs.
+
+    Usage: sampler.start() once the plan is applied, sampler.stop() after
+    the run; stop() returns summarize() of the collected samples.
+    """
+
+    def __init__(self, interval: float = 1.0, capacity: int = 512, connect=None) -> None:
+        self.interval = interval
+        self.capacity = capacity
+        self._connect = connect or self._default_connect
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.series: Optional[TimeSeries] = None
+        self.wait_events: Counter = Counter()
+        self.errors = 0
+
+    @staticmethod
+    def _default_connect():
+        conn = psycopg2.connect(**_load_pg_conn_params())
+        conn.autocommit = True
+        return conn
+
+    def start(self) -> None:
+        if self._thread is not None:
+            self.stop()
+        conn = self._connect()
+        cur = conn.cursor()
+        cur.execute("SHOW server_version_num;")
+        metrics = _metrics_for_version(int(cur.fetchone()[0]))
+        cur.close()
+        self.series = TimeSeries([m[0] for m in metrics], [m[1] for m in metrics], self.capacity)
+        self.wait_events = Counter()
+        self.errors = 0
+        sql = "SELECT " + ",\n       ".join(m[2] for m in metrics) + ";"
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(conn, sql), name='metrics-sampler', daemon=True)
+        self._thread.start()
+
+    def _run(self, conn, sql: str) -> None:
+        start = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    if conn is None:
+                        conn = self._connect()
+                    cur = conn.cursor()
+                    cur.execute(sql)
+                    row = cur.fetchone()
+                    cur.execute(_WAIT_EVENTS_SQL)
+                    for event, n in cur.fetchall():
+                        self.wait_events[event] += n
+                    cur.close()
+                    self.series.append(time.monotonic() - start, list(row))
+                except Exception as e:
+                    self.errors += 1
+                    if self.errors == 1:
+                        print(f"Warning: metrics sampler poll failed: {e}")
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+                # Poll less often as the series merges, so rows stay evenly spaced
+                self._stop.wait(self.interval * 2 ** self.series.merges)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def stop(self) -> Dict[str, Any]:
+        if self._thread is None:
+            return {}
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        summary = summarize(self.series, self.wait_events)
+        summary['interval_s'] = self.interval * 2 ** self.series.merges
+        return summary
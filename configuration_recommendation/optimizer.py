@@ -1,10 +1,20 @@
 import os
 import json
+import argparse
 from openai import OpenAI
 from prompt_generator import *
+import profiling
 import  time
+import atexit
 from DB_test import *
 from google_search import search_lines
+from stat_snapshots import SnapshotRing
+from metrics_sampler import MetricsSampler
+from search_memo import SearchMemo
+from interaction_log import JsonlLog, PromptDedupEncoder, PlanDeltaEncoder
+from checkpoint import save_checkpoint, load_checkpoint
+import telemetry
+import threading
 import configparser
 
 
@@ -16,6 +26,18 @@ ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
 search_mode = config.get('configuration recommender', 'search_mode', fallback='OFF')  # Auto, On, OFF
 line_limit = config.getint('configuration recommender', 'line_limit', fallback=20)  # number of lines
+search_backend = (config.get('configuration recommender', 'search_backend', fallback='') or 'google').strip().lower()  # google, local
+if search_backend == 'local':
+    from local_search import search_lines
+elif search_backend != 'google':
+    raise ValueError(f"Unknown search_backend '{search_backend}'. Supported: ['google', 'local']")
+# Compute next round's searches while the benchmark runs (results lag the contexts by one round)
+search_prefetch = config.get('configuration recommender', 'search_prefetch', fallback='').strip().lower() in ('1', 'true', 'yes', 'on')
+# JSONL interaction logs (history/log: LLM calls, history/plan: plan updates), rotated and gzipped
+_log_max_bytes = int(float(config.get('configuration recommender', 'log_max_mb', fallback='') or 64) * 1024 * 1024)
+_log_backups = int(config.get('configuration recommender', 'log_backups', fallback='') or 5)
+llm_log = JsonlLog(os.path.join(ROOT_DIR, 'history', 'log'), PromptDedupEncoder(), _log_max_bytes, _log_backups)
+plan_log = JsonlLog(os.path.join(ROOT_DIR, 'history', 'plan'), PlanDeltaEncoder(), _log_max_bytes, _log_backups)
 # Initialize OpenAI client
 client = OpenAI(
             api_key=config['LLM']['api_key'], 
@@ -37,35 +59,38 @@ def call_llm(prompt1, prompt2, model=config['LLM']['model'], fallback="GPT-4.1")
     )
     end_time = time.time()
     elapsed_time = end_time - start_time
-    messages=[
-        {"role": "system", "content": prompt1},
-        {"role": "user", "content": prompt2}
-    ]
-
-    history_log_path = os.path.join(ROOT_DIR, 'history', 'log')
-    os.makedirs(os.path.dirname(history_log_path), exist_ok=True)
-    with open(history_log_path, "a", encoding="utf-8") as f:
-        # Save input messages
-        f.write("=== Input Messages ===\n")
-        f.write(json.dumps(messages, indent=2, ensure_ascii=False))
-        f.write("\n\n")
-
-        # Save output
-        f.write("=== Output ===\n")
-        for choice in response.choices:
-            output = choice.message.content
-            f.write(output + "\n")
-        f.write("\n" + "="*40 + "\n\n")
-
-        # Save call time
-        f.write(f"=== LLM Call Time ===\n")
-        f.write(f"Elapsed time: {elapsed_time:.2f}s\n")
-        f.write("\n" + "="*40 + "\n\n")
-
-    return response.choices[0].message.content
+    usage = getattr(response, 'usage', None)
+    output = response.choices[0].message.content
+    telemetry.count(
+        prompt_tokens=usage.prompt_tokens if usage else 0,
+        completion_tokens=usage.completion_tokens if usage else 0,
+        bytes_sent=len(prompt1.encode('utf-8')) + len(prompt2.encode('utf-8')),
+        bytes_received=len((output or '').encode('utf-8')),
+    )
+    llm_log.write({
+        "type": "llm_call",
+        "ts": start_time,
+        "model": model,
+        "messages": [
+            {"role": "system", "content": prompt1},
+            {"role": "user", "content": prompt2}
+        ],
+        "output": output,
+        "elapsed_s": round(elapsed_time, 3),
+        "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens} if usage else None,
+    })
 
+    return output
 
-def search_web(domain):
+
+def _search_web(domain):
+    # Searches computed ahead by the prefetch thread overlap the benchmark; keep them apart
+    background = threading.current_thread() is not threading.main_thread()
+    with telemetry.stage('prefetch.search' if background else 'search', domain):
+        return _run_search(domain)
+
+
+def _run_search(domain):
     mode = str(search_mode).strip().lower()
     if mode == "auto":
         prompt1, prompt2 = get_search_prompt_auto(domain)
@@ -78,7 +103,7 @@ def search_web(domain):
             search_result = []
             for keyword in result.get("keywords", []):
                 try:
-                    search_result.append(search_lines(keyword, line_limit))
+                    search_result.append(search_lines(keyword, line_limit, domain=domain))
                 except Exception:
                     search_result.append([])
             return search_result
@@ -94,57 +119,75 @@ def search_web(domain):
         search_result = []
         for keyword in result.get("keywords", []):
             try:
-                search_result.append(search_lines(keyword, line_limit))
+                search_result.append(search_lines(keyword, line_limit, domain=domain))
             except Exception:
                 search_result.append([])
         return search_result
     else:
         return None
-       
+
+
+search_memo = SearchMemo(_search_web, lambda domain: get_context_store().context(domain))
+
+
+def search_web(domain):
+    # The contexts are fixed within a round, so one search per (domain, context) is enough
+    if str(search_mode).strip().lower() not in ("auto", "on"):
+        return None
+    return search_memo.get(domain)
+
+
 def param_tuner(current_plan=None):
-    search_result = search_web("knob tuning")
-    question_analyzer, prompt_get_question_analysis = get_question_analysis_prompt("knob tuning", search_result, current_plan)
-    return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "KnobTuner")
+    with telemetry.stage('agent', 'KnobTuner'):
+        search_result = search_web("knob tuning")
+        question_analyzer, prompt_get_question_analysis = get_question_analysis_prompt("knob tuning", search_result, current_plan)
+        return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "KnobTuner")
 
 
 def index_recommender(current_plan=None):
-    search_result = search_web("indexes recommendation")
-    question_analyzer, prompt_get_question_analysis = get_question_analysis_prompt("indexes recommendation", search_result, current_plan)
-    return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "IndexRecommender")
+    with telemetry.stage('agent', 'IndexRecommender'):
+        search_result = search_web("indexes recommendation")
+        question_analyzer, prompt_get_question_analysis = get_question_analysis_prompt("indexes recommendation", search_result, current_plan)
+        return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "IndexRecommender")
 
 
 def matview_recommender(current_plan=None):
-    search_result = search_web("materialised views recommendation")
-    question_analyzer, prompt_get_question_analysis = get_question_analysis_prompt("materialised views recommendation", search_result, current_plan)
-    return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "MatViewRecommender")
+    with telemetry.stage('agent', 'MatViewRecommender'):
+        search_result = search_web("materialised views recommendation")
+        question_analyzer, prompt_get_question_analysis = get_question_analysis_prompt("materialised views recommendation", search_result, current_plan)
+        return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "MatViewRecommender")
 
 def param_tuner_revise(comments, original_recommendation, current_plan=None):
-    search_result = search_web("knob tuning")
-    question_analyzer, prompt_get_question_analysis = revision_prompt("knob tuning", comments, original_recommendation, search_result, current_plan)
-    return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "KnobTuner")
+    with telemetry.stage('agent', 'KnobTuner.revise'):
+        search_result = search_web("knob tuning")
+        question_analyzer, prompt_get_question_analysis = revision_prompt("knob tuning", comments, original_recommendation, search_result, current_plan)
+        return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "KnobTuner")
 
 
 def index_recommender_revise(comments, original_recommendation, current_plan=None):
-    search_result = search_web("indexes recommendation")
-    question_analyzer, prompt_get_question_analysis = revision_prompt("indexes recommendation", comments, original_recommendation, search_result, current_plan)
-    return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "IndexRecommender")
+    with telemetry.stage('agent', 'IndexRecommender.revise'):
+        search_result = search_web("indexes recommendation")
+        question_analyzer, prompt_get_question_analysis = revision_prompt("indexes recommendation", comments, original_recommendation, search_result, current_plan)
+        return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "IndexRecommender")
 
 
 def matview_recommender_revise(comments, original_recommendation, current_plan=None):
-    search_result = search_web("materialised views recommendation")
-    question_analyzer, prompt_get_question_analysis = revision_prompt("materialised views recommendation", comments, original_recommendation, search_result, current_plan)
-    return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "MatViewRecommender")
+    with telemetry.stage('agent', 'MatViewRecommender.revise'):
+        search_result = search_web("materialised views recommendation")
+        question_analyzer, prompt_get_question_analysis = revision_prompt("materialised views recommendation", comments, original_recommendation, search_result, current_plan)
+        return safe_parse(call_llm(question_analyzer, prompt_get_question_analysis), "MatViewRecommender")
 
 def control_node(plan, current_plan=None, history=None):
-    search_result = search_web("optimization plan review")
-    voter, cons_prompt = get_consensus_prompt(json.dumps(plan, ensure_ascii=False), search_result, current_plan, history)
-    try:
-        return json.loads(call_llm(voter, cons_prompt))
-    except Exception as e:
-        # Fallback: accept plan if it has recommendations
-        print(f"Controller LLM call failed: {e}. Using fallback logic.")
-        has_recommendations = bool(plan.get("knobs")) or bool(plan.get("indexes")) or bool(plan.get("matviews"))
-        return {"opinion": "Accept" if has_recommendations else "Reject", "revisions": []}
+    with telemetry.stage('controller'):
+        search_result = search_web("optimization plan review")
+        voter, cons_prompt = get_consensus_prompt(json.dumps(plan, ensure_ascii=False), search_result, current_plan, history)
+        try:
+            return json.loads(call_llm(voter, cons_prompt))
+        except Exception as e:
+            # Fallback: accept plan if it has recommendations
+            print(f"Controller LLM call failed: {e}. Using fallback logic.")
+            has_recommendations = bool(plan.get("knobs")) or bool(plan.get("indexes")) or bool(plan.get("matviews"))
+            return {"opinion": "Accept" if has_recommendations else "Reject", "revisions": []}
 
 
 def safe_parse(text, agent):
@@ -156,6 +199,7 @@ def safe_parse(text, agent):
         return {"agent": agent, "items": [], "rationale": text}
 
 
+@profiling.scoped('plan_merge')
 def merge_plan(plan, rec):
     # print(plan)
     # print(rec)
@@ -196,16 +240,8 @@ def merge_plan(plan, rec):
                 existing_queries.add(query)
 
 
-    plan_log_path = os.path.join(ROOT_DIR, 'history', 'plan')
-    os.makedirs(os.path.dirname(plan_log_path), exist_ok=True)
-    with open(plan_log_path, "a", encoding="utf-8") as f:
-        # Save input messages
-        f.write("=== Plan Updated ===\n")
-        f.write(json.dumps(plan, indent=2, ensure_ascii=False))
-        f.write("\n\n")
-    
-    # print(plan)
-    # exit(0)
+    # The writer thread diffs against the previous plan; hand it a copy
+    plan_log.write({"type": "plan", "ts": time.time(), "agent": agent, "plan": json.loads(json.dumps(plan))})
 
 
 def run_framework(max_iters, previous_plan=None, history=None):
@@ -247,81 +283,220 @@ def run_framework(max_iters, previous_plan=None, history=None):
     return plan
 
 
+BENCHMARKS = ['TPC-C', 'TPC-DS', 'Sysbench', 'JOB']
+
+
+def run_benchmark(benchmark, plan, query_dir=None, log_file=None, snapshots=None, round_id=None, sampler=None,
+                  on_start=None):
+    """Apply the plan and run the benchmark; returns (result, pg_stat delta of the run).
+
+    The start snapshot is taken and the metrics sampler started once the plan
+    has been applied, so index and matview builds are not counted in the
+    round's delta. The sampler summary is stored under delta['run_metrics'].
+    on_start, if given, is called at the same point (e.g. to start prefetching).
+    The time from that point until the benchmark returns is recorded as the
+    'benchmark' telemetry stage.
+    """
+    ready_at = []
+
+    def on_ready():
+        ready_at.append(time.perf_counter())
+        if snapshots is not None:
+            snapshots.begin_round(round_id)
+        if sampler is not None:
+            try:
+                sampler.start()
+            except Exception as e:
+                print(f"Warning: metrics sampler failed to start: {e}")
+        if on_start is not None:
+            on_start()
+    completed = False
+    try:
+        if benchmark == "TPC-C":
+            result = test_by_tpcc(plan, on_ready=on_ready)
+        elif benchmark == "TPC-DS":
+            result = test_by_tpcds(plan, query_dir, log_file, on_ready=on_ready)
+        elif benchmark == "Sysbench":
+            result = test_by_sysbench(plan, log_file=log_file, on_ready=on_ready)
+        elif benchmark == "JOB":
+            result = test_by_job(plan, query_dir, log_file, on_ready=on_ready)
+        else:
+            raise ValueError(f"Unknown benchmark '{benchmark}'. Supported: {BENCHMARKS}")
+        completed = True
+    finally:
+        # A failed run must not leave the polling thread (and its connection) behind
+        run_metrics = sampler.stop() if sampler is not None else None
+        if snapshots is not None and not completed:
+            snapshots.abort_round()
+    if ready_at:
+        telemetry.get_telemetry().record('benchmark', time.perf_counter() - ready_at[0], benchmark)
+
+    delta = None
+    if snapshots is not None:
+        try:
+            delta = snapshots.end_round(round_id)
+        except Exception as e:
+            print(f"Warning: pg_stat snapshot failed: {e}")
+    if run_metrics:
+        delta = delta or {'round': round_id}
+        delta['run_metrics'] = run_metrics
+    return result, delta
+
+
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', type=str, choices=list(profiling.MODES),
+                        default=(config.get('configuration recommender', 'profile', fallback='') or 'off').strip().lower(),
+                        help='profile every stage (full: cProfile + tracemalloc, sample: stack sampling only)')
+    parser.add_argument('--profile_dir', type=str,
+                        default=config.get('configuration recommender', 'profile_dir', fallback='') or os.path.join(ROOT_DIR, 'history', 'profile', time.strftime('%Y%m%d-%H%M%S')),
+                        help='where .pstats files and allocation/sample reports are written')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue the session saved in the checkpoint instead of starting over')
+    parser.add_argument('--checkpoint', type=str,
+                        default=config.get('configuration recommender', 'checkpoint_path', fallback='') or os.path.join(ROOT_DIR, 'history', 'checkpoint.json'),
+                        help='loop state written after the baseline and after every round')
+    args = parser.parse_args()
+
     benchmark = config.get('configuration recommender', 'benchmark', fallback='')  # TPC-C, TPC-DS, Sysbench, JOB
     total_time_limit = config.getint('configuration recommender', 'total_time_limit', fallback=0)  # seconds
     query_dir = config.get('configuration recommender', 'query_dir', fallback=None)
     log_file = config.get('configuration recommender', 'log_file', fallback=None)
 
+    if benchmark not in BENCHMARKS:
+        print(f"Unknown benchmark: {benchmark}. Supported: {BENCHMARKS}")
+        exit(1)
+
     print(f"Starting optimization for benchmark: {benchmark}")
     print(f"Query directory: {query_dir}")
     print(f"Total time limit: {total_time_limit}s, Max iterations per round: {config.getint('configuration recommender', 'max_iterations', fallback=1)}")
     
-    # Initialize: reset stats and extract baseline features
-    print("\n=== Initialization ===")
-    print("Resetting configurations...")
-    drop_all_materialized_views()
-    reset_indexes_to_original()
-    #restore_postgres_config()
-    print("Resetting pg_stat_statements...")
-    reset_pgstat_statements()
-    
-    # Run baseline test to populate statistics
-    print("Running baseline test...")
-    baseline_plan = {"knobs": {}, "indexes": [], "matviews": []}
-    if benchmark == "TPC-C":
-        baseline_result = test_by_tpcc(baseline_plan)
-    elif benchmark == "TPC-DS":
-        baseline_result = test_by_tpcds(baseline_plan, query_dir, log_file)
-    elif benchmark == "Sysbench":
-        baseline_result = test_by_sysbench(baseline_plan, log_file)
-    elif benchmark == "JOB":
-        baseline_result = test_by_job(baseline_plan, query_dir, log_file)
-    else:
-        print(f"Unknown benchmark: {benchmark}")
-        exit(1)
-    
-    print(f"Baseline result: {baseline_result}")
-    
-    # Extract features based on baseline workload statistics
-    print("Extracting workload features...")
-    refresh_context()
-    
-    start_time = time.time()
-    iteration_count = 0
-    previous_plan = None  # First round has no previous plan
-    history = []  # Memory window: list of {"round": N, "plan": {...}, "result": X}
+    # Profiles per stage (telemetry stages, prompt rendering, plan merging, log writing); reports rewritten every round
+    profiler = profiling.configure(args.profile, args.profile_dir)
+    if profiler is not None:
+        atexit.register(profiling.close)
+        llm_log.profiler = plan_log.profiler = profiler
+        print(f"Profiling ({args.profile}) to {args.profile_dir}")
+
+    # Per-stage wall time, tokens and bytes: history/telemetry.jsonl, history/telemetry.prom, table at exit
+    session_telemetry = telemetry.configure(
+        os.path.join(ROOT_DIR, 'history', 'telemetry.jsonl'),
+        price_prompt_1k=float(config.get('LLM', 'price_prompt_1k', fallback='') or 0),
+        price_completion_1k=float(config.get('LLM', 'price_completion_1k', fallback='') or 0),
+        profiler=profiler,
+    )
+    session_telemetry.round = 0
+    atexit.register(lambda: print("\n=== Telemetry ===\n" + session_telemetry.table()))
+
+    # Recent pg_stat snapshots; each round's delta feeds the next round's features
+    snapshots = SnapshotRing(int(config.get('configuration recommender', 'snapshot_ring_size', fallback='') or 8))
+    # Polls server metrics during each run; sampler_interval = 0 disables it
+    sampler_interval = float(config.get('configuration recommender', 'sampler_interval', fallback='') or 1.0)
+    sampler = MetricsSampler(sampler_interval) if sampler_interval > 0 else None
     memory_window_size = config.getint('configuration recommender', 'memory_window_size', fallback=3)
-    
+
+    def write_checkpoint():
+        # Everything the loop needs to continue; rewritten atomically after the baseline and every round
+        try:
+            save_checkpoint(args.checkpoint, {
+                "benchmark": benchmark,
+                "iteration_count": iteration_count,
+                "baseline_result": baseline_result,
+                "previous_plan": previous_plan,
+                "history": history,
+                "round_delta": round_delta,
+                "elapsed": time.time() - start_time,
+            })
+        except Exception as e:
+            print(f"Warning: writing checkpoint {args.checkpoint} failed: {e}")
+
+    if args.resume:
+        try:
+            state = load_checkpoint(args.checkpoint)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Cannot resume from {args.checkpoint}: {e}")
+            exit(1)
+        if state["benchmark"] != benchmark:
+            print(f"Checkpoint is for benchmark {state['benchmark']}, config.ini says {benchmark}")
+            exit(1)
+        print(f"\n=== Resuming after round {state['iteration_count']} ===")
+        iteration_count = state["iteration_count"]
+        baseline_result = state["baseline_result"]
+        previous_plan = state["previous_plan"]
+        history = state["history"]
+        round_delta = state["round_delta"]
+        start_time = time.time() - state["elapsed"]
+        session_telemetry.round = iteration_count
+        print(f"Baseline result: {baseline_result}")
+
+        # The database may have lost the plan (crash, failed restart); bring it back the way a round does
+        if previous_plan:
+            print("Re-applying the last accepted plan...")
+            apply_plan(previous_plan)
+
+        print("Extracting workload features...")
+        with telemetry.stage('feature_refresh'):
+            refresh_context(round_delta)
+    else:
+        # Initialize: reset stats and extract baseline features
+        print("\n=== Initialization ===")
+        print("Resetting configurations...")
+        drop_all_materialized_views()
+        reset_indexes_to_original()
+        #restore_postgres_config()
+        print("Resetting pg_stat_statements...")
+        reset_pgstat_statements()
+
+        # Run baseline test to populate statistics
+        print("Running baseline test...")
+        baseline_plan = {"knobs": {}, "indexes": [], "matviews": []}
+        baseline_result, round_delta = run_benchmark(benchmark, baseline_plan, query_dir, log_file, snapshots, 0, sampler)
+
+        print(f"Baseline result: {baseline_result}")
+
+        # Extract features based on baseline workload statistics
+        print("Extracting workload features...")
+        with telemetry.stage('feature_refresh'):
+            refresh_context(round_delta)
+
+        start_time = time.time()
+        iteration_count = 0
+        previous_plan = None  # First round has no previous plan
+        history = []  # Memory window: list of {"round": N, "plan": {...}, "result": X}
+        write_checkpoint()
+
     while True:
         iteration_count += 1
         print(f"\n=== Optimization Round {iteration_count} ===")
+        search_memo.new_round(iteration_count)
+        session_telemetry.round = iteration_count
         
         # Generate optimization plan based on current features
         print("Generating optimization plan...")
         final_plan = run_framework(config.getint('configuration recommender', 'max_iterations', fallback=1), previous_plan, history)
         
         print(f"Testing optimized plan (round {iteration_count})...")
-        if benchmark == "TPC-C":
-            result = test_by_tpcc(final_plan)
-        elif benchmark == "TPC-DS":
-            result = test_by_tpcds(final_plan, query_dir, log_file)
-        elif benchmark == "Sysbench":
-            result = test_by_sysbench(final_plan, log_file)
-        elif benchmark == "JOB":
-            result = test_by_job(final_plan, query_dir, log_file)
-        else:
-            print("Unknown benchmark:", benchmark)
-            break
+        prefetch = (lambda: search_memo.prefetch(DOMAIN_TASKS)) if search_prefetch else None
+        result, round_delta = run_benchmark(benchmark, final_plan, query_dir, log_file, snapshots, iteration_count, sampler,
+                                            on_start=prefetch)
         
         print(f"Optimization result: {result} (baseline: {baseline_result})")
         improvement = ((baseline_result - result) / baseline_result * 100) if baseline_result > 0 else 0
         print(f"Improvement: {improvement:.2f}%")
+        prefix_report = get_context_store().prefix_tracker.report()
+        if prefix_report:
+            print(f"Prompt prefix reuse: {prefix_report}")
+        if str(search_mode).strip().lower() in ("auto", "on"):
+            print(f"Web search: {search_memo.report()}")
         
         # Extract features for next iteration
         print("Refreshing features for next iteration...")
-        refresh_context()
+        with telemetry.stage('feature_refresh'):
+            refresh_context(round_delta)
+        session_telemetry.write_prometheus(os.path.join(ROOT_DIR, 'history', 'telemetry.prom'))
+        if profiler is not None:
+            profiler.dump()
 
         plan_out_path = os.path.join(ROOT_DIR, 'optimization_plan.json')
         with open(plan_out_path, "a", encoding="utf-8") as f:
@@ -344,6 +519,7 @@ if __name__ == "__main__":
         # Keep only the most recent N entries
         if len(history) > memory_window_size:
             history = history[-memory_window_size:]
+        write_checkpoint()
 
         if total_time_limit and (current_time - start_time) > total_time_limit:
                 print("Time limit exceeded, stopping optimization.")
@@ -1,9 +1,11 @@
 import os
+import sys
 import json
+import string
 import configparser
-import importlib.util
-from typing import Dict, Any
+from typing import Dict, Any, Optional, List, Set, Tuple
 import psycopg2
+from context_encoder import encode_context, count_tokens
 
 tasks = [
     ("indexes_recommendation", "index_context"),
@@ -12,34 +14,100 @@ tasks = [
     ("optimization_plan_review", "review_context")
 ]
 
-index_context = matview_context = knob_context = review_context = ""
-
-for task_name, var_name in tasks:
-    file_path = fr"../workload_compression/{task_name}_features.json"
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-            if var_name == "index_context":
-                index_context = content
-            elif var_name == "matview_context":
-                matview_context = content
-            elif var_name == "knob_context":
-                knob_context = content
-            elif var_name == "review_context":
-                review_context = content
-            print(f"Loaded {task_name} features from {file_path}")
-    except FileNotFoundError:
-        print(f"Warning: Features file not found for task: {task_name}. This will be extracted on first run.")
-        print(f"Expected path: {os.path.abspath(file_path)}")
-
-    except FileNotFoundError:
-        print(f"File not found for task: {task_name}")
+# question domain -> feature task
+DOMAIN_TASKS = {
+    'indexes recommendation': 'indexes_recommendation',
+    'materialised views recommendation': 'materialised_views_recommendation',
+    'knob tuning': 'knob_tuning',
+    'optimization plan review': 'optimization_plan_review',
+}
 
 db_metric = "latency"
 
+# Template fields by how often they change, for prompt_order = cache: schema
+# features change once per refresh, the others on every round or call
+SCHEMA_FIELDS = ['content']
+ROUND_FIELDS = ['current_configuration', 'memory_window', 'original_recommendation', 'syn_report',
+                'comments', 'search_result']
+
 _PROMPT_DIR = os.path.join(os.path.dirname(__file__), "..", "prompt_template")
 _SPECIALIST_PROMPT_PATH = os.path.join(_PROMPT_DIR, "Prompt_Specialist_Agent")
 _SUPERVISOR_PROMPT_PATH = os.path.join(_PROMPT_DIR, "Prompt_Supervisor_Agent")
+_FEATURES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'workload_compression'))
+_CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'config.ini')
+
+# workload_compression is not a package; its modules (get_features, profiling) are imported from its directory
+if _FEATURES_DIR not in sys.path:
+    sys.path.append(_FEATURES_DIR)
+import profiling
+
+
+# -----------------------------
+# Prompt templates
+# -----------------------------
+
+class PromptTemplate:
+    """A str.format template split once into static text and dynamic fields.
+
+    parts is a list of (literal text, field name or None, format spec,
+    conversion); render(**values) returns the same string as
+    text.format(**values) without re-parsing the template.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.parts: List[Tuple[str, Optional[str], str, Optional[str]]] = list(string.Formatter().parse(text))
+        self.fields = [p[1] for p in self.parts if p[1] is not None]
+
+    def render(self, **values) -> str:
+        out = []
+        for literal, field, spec, conversion in self.parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 's':
+                value = str(value)
+            elif conversion == 'a':
+                value = ascii(value)
+            out.append(format(value, spec or ''))
+        return ''.join(out)
+
+    def label(self, field: str) -> str:
+        """Section name of a field: the text right before it, e.g. 'Workload Features'."""
+        before = ''
+        for literal, name, _, _ in self.parts:
+            before += literal
+            if name == field:
+                break
+            before = ''
+        lines = [l.strip() for l in before.splitlines() if l.strip()]
+        return lines[-1].rstrip(':').strip() if lines else field
+
+    def render_ordered(self, tiers: List[List[str]], **values) -> str:
+        """Render with the fields listed in `tiers` moved after the instructions.
+
+        The instruction text keeps only the fields not in any tier, so it is
+        identical across calls; the moved fields follow as labelled sections,
+        tier by tier, which keeps the longest possible common prefix between
+        consecutive prompts for provider-side prompt caching.
+        """
+        moved = [f for tier in tiers for f in tier if f in self.fields]
+        out = []
+        for literal, field, spec, conversion in self.parts:
+            out.append(literal)
+            if field is None:
+                continue
+            if field in moved:
+                out.append("(given below)")
+            else:
+                out.append(PromptTemplate('{' + field + ('!' + conversion if conversion else '')
+                                          + (':' + spec if spec else '') + '}').render(**values))
+        for field in dict.fromkeys(moved):
+            out.append(f"\n\n{self.label(field)}:\n{values[field]}")
+        return ''.join(out)
 
 
 def _load_prompt_json(path: str, label: str) -> Any:
@@ -53,32 +121,131 @@ def _load_prompt_json(path: str, label: str) -> Any:
         raise ValueError(f"{label} is not valid JSON: {path}") from exc
 
 
-_SPECIALIST_TEMPLATES = _load_prompt_json(_SPECIALIST_PROMPT_PATH, "Prompt_Specialist_Agent")
-_SUPERVISOR_TEMPLATES = _load_prompt_json(_SUPERVISOR_PROMPT_PATH, "Prompt_Supervisor_Agent")
+# Parsed on first use: domain -> {kind: PromptTemplate}, and the supervisor templates
+_SPECIALIST_TEMPLATES: Optional[Dict[str, Dict[str, PromptTemplate]]] = None
+_SUPERVISOR_TEMPLATES: Optional[Dict[str, PromptTemplate]] = None
 
 
-def _get_specialist_template(question_domain: str, template_kind: str = "analysis") -> str:
+def _load_templates() -> None:
+    global _SPECIALIST_TEMPLATES, _SUPERVISOR_TEMPLATES
+    specialist = _load_prompt_json(_SPECIALIST_PROMPT_PATH, "Prompt_Specialist_Agent")
+    supervisor = _load_prompt_json(_SUPERVISOR_PROMPT_PATH, "Prompt_Supervisor_Agent")
+    _SPECIALIST_TEMPLATES = {
+        domain: ({kind: PromptTemplate(text) for kind, text in entry.items()} if isinstance(entry, dict)
+                 else {"analysis": PromptTemplate(entry)})
+        for domain, entry in specialist.items()
+    }
+    _SUPERVISOR_TEMPLATES = (
+        {kind: PromptTemplate(text) for kind, text in supervisor.items() if isinstance(text, str)}
+        if isinstance(supervisor, dict) else {}
+    )
+
+
+def _get_specialist_template(question_domain: str, template_kind: str = "analysis") -> PromptTemplate:
+    if _SPECIALIST_TEMPLATES is None:
+        _load_templates()
     try:
-        entry = _SPECIALIST_TEMPLATES[question_domain]
+        return _SPECIALIST_TEMPLATES[question_domain][template_kind]
     except KeyError as exc:
         raise NotImplementedError from exc
 
-    if isinstance(entry, dict):
-        try:
-            return entry[template_kind]
-        except KeyError as exc:
-            raise NotImplementedError from exc
 
-    if template_kind == "analysis":
-        return entry
+def _get_supervisor_template() -> PromptTemplate:
+    if _SUPERVISOR_TEMPLATES is None:
+        _load_templates()
+    if "consensus" in _SUPERVISOR_TEMPLATES:
+        return _SUPERVISOR_TEMPLATES["consensus"]
+    raise ValueError("Prompt_Supervisor_Agent must contain a 'consensus' template")
 
-    raise NotImplementedError
 
+_SEARCH_AUTO_TEMPLATE = PromptTemplate("""
+    Task Overview:
+    You are an expert database tuning agent. You are preparing to tune the system for {domain}.
 
-def _get_supervisor_template() -> str:
-    if isinstance(_SUPERVISOR_TEMPLATES, dict) and "consensus" in _SUPERVISOR_TEMPLATES:
-        return _SUPERVISOR_TEMPLATES["consensus"]
-    raise ValueError("Prompt_Supervisor_Agent must contain a 'consensus' template")
+    Context: 
+    {context}
+
+    Goal:
+    Determine if you possess sufficient **external domain knowledge** (e.g., best practices, formulas, hardware-specific recommendations, documentation) to tune the items in the context effectively.
+    Do NOT worry about specific metric values (e.g., current CPU load), as those will be provided by the system.
+    Focus ONLY on whether you need to search for **principles, manuals, or community experiences** regarding the parameters or errors mentioned.
+
+    Output Format:
+    Return a strictly valid JSON object.
+    {{
+        "sufficient": "True" or "False",  // Return "False" if you need to search for external docs/blogs.
+        "keywords": ["keyword1", "keyword2"] // Provide 2-3 specific search queries if "sufficient" is "False".
+    }}
+
+    Example:
+    Context: "Tuning target: explicit_defaults_for_timestamp in MySQL 5.7"
+    Output:
+    {{
+        "sufficient": "False",
+        "keywords": ["MySQL 5.7 explicit_defaults_for_timestamp deprecated behavior", "MySQL 5.7 timestamp best practices"]
+    }}
+    """)
+
+_SEARCH_ON_TEMPLATE = PromptTemplate("""
+    Task Overview:
+    You are given a context describing the current tuning scenario. 
+    Your task is to generate concise and relevant search keywords that would help retrieve any missing information required for effective {domain}.
+    Note that some items in the current context only contain their names and meanings, their detailed content will be provided later during actual execution.
+    Context: {context}
+    Output Format:
+    - Output must be a valid JSON object.
+    - The object must contain:
+        - "keywords": a list of search keywords (only if "sufficient" is "False"). Each keyword should be concise and directly related to the missing information needed for effective {domain}.
+    Example:
+    {{
+        "keywords": ["PostgreSQL OLAP performance tuning", "Indexing strategies for OLAP workloads"]
+    }}
+    """)
+
+
+class PrefixTracker:
+    """Common prefix between consecutive prompts of the same kind.
+
+    A provider can only reuse its prompt cache up to the first differing
+    character, so the shared prefix is the cacheable part of a call.
+    """
+
+    def __init__(self) -> None:
+        self._last: Dict[str, str] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def observe(self, key: str, text: str) -> Optional[int]:
+        """Record a prompt; returns the characters shared with the previous one of this key."""
+        prev = self._last.get(key)
+        self._last[key] = text
+        if prev is None:
+            return None
+        shared = len(os.path.commonprefix([prev, text]))
+        st = self._stats.setdefault(key, {'calls': 0, 'shared_chars': 0, 'total_chars': 0, 'shared_tokens': 0})
+        st['calls'] += 1
+        st['shared_chars'] += shared
+        st['total_chars'] += len(text)
+        st['shared_tokens'] += count_tokens(text[:shared])
+        return shared
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            key: {
+                'calls': st['calls'],
+                'shared_ratio': st['shared_chars'] / max(st['total_chars'], 1),
+                'mean_shared_tokens': st['shared_tokens'] / st['calls'],
+            }
+            for key, st in self._stats.items()
+        }
+
+    def report(self) -> str:
+        return "; ".join(f"{k}: {v['shared_ratio']:.0%} shared (~{v['mean_shared_tokens']:.0f} tokens)"
+                         for k, v in sorted(self.summary().items()))
+
+
+# -----------------------------
+# Database helpers
+# -----------------------------
 
 def reset_pgstat_statements():
     conn_str = _build_pg_conn_str()
@@ -107,7 +274,7 @@ def reset_pgstat_statements():
 def _build_pg_conn_str() -> str:
     cfg = configparser.ConfigParser()
     # config.ini is one level up from this file
-    cfg.read(os.path.join(os.path.dirname(__file__), '..', 'config.ini'), encoding='utf-8')
+    cfg.read(_CONFIG_PATH, encoding='utf-8')
     section = 'configuration recommender'
     host = cfg.get(section, 'PG_Host', fallback='')
     port = cfg.get(section, 'PG_Port', fallback='5432')
@@ -119,77 +286,177 @@ def _build_pg_conn_str() -> str:
     return f"host={host} port={port} user={user} password={password} dbname={dbname}"
 
 
-def refresh_context() -> Dict[str, Any]:
-    """
-    Re-extract features for all tasks and refresh in-memory contexts.
-    Returns a dict with status info per task.
-    """
-    global index_context, matview_context, knob_context, review_context
+def _get_features_module():
+    # Imported on first use from workload_compression (on sys.path, see above)
+    import get_features
+    return get_features
 
-    # Load extraction function dynamically to avoid package path issues
-    gf_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'workload_compression', 'get_features.py'))
-    spec = importlib.util.spec_from_file_location("get_features_module", gf_path)
-    if spec is None or spec.loader is None:
-        raise ImportError("Unable to load workload_compression/get_features.py")
-    get_features_module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(get_features_module)  # type: ignore[attr-defined]
 
-    conn_str = _build_pg_conn_str()
+# -----------------------------
+# Feature contexts
+# -----------------------------
+
+class ContextStore:
+    """Feature contexts of one database, loaded lazily and kept in memory.
 
-    results: Dict[str, Any] = {}
-    out_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'workload_compression'))
+    context(domain) reads {features_dir}/{task}_features.json the first time
+    the domain is used. refresh() re-extracts all tasks from the database
+    through a per-store FeatureCache and replaces the in-memory contexts.
+    Use one store per database (see get_context_store).
+    """
 
-    for task_name, var_name in tasks:
+    def __init__(self, conn_str: Optional[str] = None, features_dir: str = _FEATURES_DIR,
+                 config_path: str = _CONFIG_PATH) -> None:
+        self._conn_str = conn_str
+        self.features_dir = features_dir
+        cfg = configparser.ConfigParser()
+        cfg.read(config_path, encoding='utf-8')
+        section = 'configuration recommender'
+        self.context_format = (cfg.get(section, 'context_format', fallback='').strip() or 'json').lower()
+        self.token_budget = int(cfg.get(section, 'context_token_budget', fallback='') or 0)
+        self.digits = int(cfg.get(section, 'context_digits', fallback='') or 3)
+        # template: fields where the template puts them; cache: stable instructions,
+        # then schema features, then per-round data (see PromptTemplate.render_ordered)
+        self.prompt_order = (cfg.get(section, 'prompt_order', fallback='').strip() or 'template').lower()
+        if self.prompt_order not in ('template', 'cache'):
+            raise ValueError(f"Unknown prompt_order '{self.prompt_order}'. Supported: ['template', 'cache']")
+        self.prefix_tracker = PrefixTracker()
+        self._contexts: Dict[str, str] = {}
+        # Tasks whose features file was missing; not looked up again until refresh()
+        self._missing: Set[str] = set()
+        # Token count per section of the last encoded context of each task
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self._feature_cache = None
+
+    @property
+    def conn_str(self) -> str:
+        if self._conn_str is None:
+            self._conn_str = _build_pg_conn_str()
+        return self._conn_str
+
+    def _render(self, task_name: str, feats: Dict[str, Any]) -> str:
+        """Prompt text of a task payload: indented JSON, or the compact token-budgeted
+        encoding when context_format = compact in [configuration recommender]."""
+        if self.context_format != 'compact':
+            return json.dumps(feats, ensure_ascii=False, indent=2)
+        content, stats = encode_context(feats, token_budget=self.token_budget, digits=self.digits)
+        self.stats[task_name] = stats
+        print(f"{task_name} context: {stats['total_tokens']} tokens "
+              f"({', '.join(f'{k}={v}' for k, v in ((k, v['tokens']) for k, v in stats.items() if k != 'total_tokens'))})")
+        return content
+
+    def context(self, question_domain: str) -> str:
+        task_name = DOMAIN_TASKS.get(question_domain)
+        if task_name is None:
+            raise NotImplementedError
+        if task_name in self._missing:
+            return ""
+        if task_name not in self._contexts:
+            file_path = os.path.join(self.features_dir, f"{task_name}_features.json")
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    self._contexts[task_name] = self._render(task_name, json.load(f))
+                print(f"Loaded {task_name} features from {file_path}")
+            except FileNotFoundError:
+                print(f"Warning: Features file not found for task: {task_name}. This will be extracted on first run.")
+                print(f"Expected path: {os.path.abspath(file_path)}")
+                self._missing.add(task_name)
+                return ""
+        return self._contexts[task_name]
+
+    def refresh(self, round_delta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Re-extract features for all tasks and refresh in-memory contexts.
+        round_delta: per-round pg_stat deltas (stat_snapshots.SnapshotRing.end_round).
+        Returns a dict with status info per task.
+        """
+        results: Dict[str, Any] = {}
+        self._missing.clear()
+
+        # One shared catalog snapshot for all tasks; only relations whose
+        # catalog state changed since the last refresh are re-read
         try:
-            feats = get_features_module.extract_features(conn_str, task_name)  # type: ignore[attr-defined]
-            out_path = os.path.join(out_dir, f"{task_name}_features.json")
-            with open(out_path, 'w', encoding='utf-8') as f:
-                json.dump(feats, f, ensure_ascii=False, indent=2)
-
-            content = json.dumps(feats, ensure_ascii=False, indent=2)
-            if var_name == "index_context":
-                index_context = content
-            elif var_name == "matview_context":
-                matview_context = content
-            elif var_name == "knob_context":
-                knob_context = content
-            elif var_name == "review_context":
-                review_context = content
-            results[task_name] = {"ok": True, "path": out_path}
+            if self._feature_cache is None:
+                self._feature_cache = _get_features_module().FeatureCache()
+            all_feats = self._feature_cache.extract(self.conn_str, [t for t, _ in tasks], round_delta=round_delta)
         except Exception as e:
-            results[task_name] = {"ok": False, "error": str(e)}
+            return {task_name: {"ok": False, "error": str(e)} for task_name, _ in tasks}
 
-    return results
+        for task_name, _ in tasks:
+            try:
+                feats = all_feats[task_name]
+                out_path = os.path.join(self.features_dir, f"{task_name}_features.json")
+                content = json.dumps(feats, ensure_ascii=False, indent=2)
+                try:
+                    with open(out_path, 'r', encoding='utf-8') as f:
+                        changed = f.read() != content
+                except FileNotFoundError:
+                    changed = True
+                if changed:
+                    with open(out_path, 'w', encoding='utf-8') as f:
+                        f.write(content)
+                self._contexts[task_name] = self._render(task_name, feats)
+                results[task_name] = {"ok": True, "path": out_path, "changed": changed,
+                                      "tokens": self.stats.get(task_name, {}).get('total_tokens')}
+            except Exception as e:
+                results[task_name] = {"ok": False, "error": str(e)}
 
-def get_question_analysis_prompt(question_domain, search_result="None", current_plan=None):
-    question_analyzer = f"You are an experienced database administrators, skilled in database {question_domain}. "
-    # Select the appropriate context based on question_domain
-    if question_domain == 'knob tuning':
-        domain_context = knob_context
-    elif question_domain == 'indexes recommendation':
-        domain_context = index_context
-    elif question_domain == 'materialised views recommendation':
-        domain_context = matview_context
-    elif question_domain == 'optimization plan review':
-        domain_context = review_context
+        return results
+
+
+_STORES: Dict[str, ContextStore] = {}
+
+
+def get_context_store(name: str = "default", **kwargs) -> ContextStore:
+    """Named ContextStore, created with kwargs on first use."""
+    store = _STORES.get(name)
+    if store is None:
+        store = _STORES[name] = ContextStore(**kwargs)
+    return store
+
+
+@profiling.scoped('prompt_render')
+def _render_prompt(store: ContextStore, key: str, template: PromptTemplate, **values) -> str:
+    if store.prompt_order == 'cache':
+        prompt = template.render_ordered([SCHEMA_FIELDS, ROUND_FIELDS], **values)
     else:
-        raise NotImplementedError
+        prompt = template.render(**values)
+    store.prefix_tracker.observe(key, prompt)
+    return prompt
+
+
+def refresh_context(round_delta: Optional[Dict[str, Any]] = None, store: Optional[ContextStore] = None) -> Dict[str, Any]:
+    """Refresh the contexts of `store` (default: the default store); see ContextStore.refresh."""
+    return (store or get_context_store()).refresh(round_delta)
+
+
+# -----------------------------
+# Prompts
+# -----------------------------
 
+def _domain_config(question_domain, current_plan):
     # Extract domain-specific configuration from current plan
     if current_plan is None:
-        domain_config = "Default"
-    else:
-        if question_domain == 'knob tuning':
-            domain_config = json.dumps(current_plan.get('knobs', {}), ensure_ascii=False, indent=2) or "Default"
-        elif question_domain == 'indexes recommendation':
-            domain_config = json.dumps(current_plan.get('indexes', []), ensure_ascii=False, indent=2) or "Default"
-        elif question_domain == 'materialised views recommendation':
-            domain_config = json.dumps(current_plan.get('matviews', []), ensure_ascii=False, indent=2) or "Default"
-        else:
-            domain_config = "Default"
+        return "Default"
+    if question_domain == 'knob tuning':
+        return json.dumps(current_plan.get('knobs', {}), ensure_ascii=False, indent=2) or "Default"
+    elif question_domain == 'indexes recommendation':
+        return json.dumps(current_plan.get('indexes', []), ensure_ascii=False, indent=2) or "Default"
+    elif question_domain == 'materialised views recommendation':
+        return json.dumps(current_plan.get('matviews', []), ensure_ascii=False, indent=2) or "Default"
+    return "Default"
+
+
+def get_question_analysis_prompt(question_domain, search_result="None", current_plan=None, store=None):
+    question_analyzer = f"You are an experienced database administrators, skilled in database {question_domain}. "
+    store = store or get_context_store()
+    # Select the appropriate context based on question_domain
+    domain_context = store.context(question_domain)
+    domain_config = _domain_config(question_domain, current_plan)
 
     template = _get_specialist_template(question_domain, template_kind="analysis")
-    prompt_get_question_analysis = template.format(
+    prompt_get_question_analysis = _render_prompt(
+        store, f"analysis:{question_domain}", template,
         question_domain=question_domain,
         db_metric=db_metric,
         content=domain_context,
@@ -204,68 +471,52 @@ def _format_history_for_consensus(history: list) -> str:
     """
     if not history:
         return "No previous optimization history available."
-    
+
     formatted = []
     for entry in history:
         round_num = entry.get("round", "?")
         result = entry.get("result", "N/A")
         improvement = entry.get("improvement", 0)
         plan = entry.get("plan", {})
-        
+
         formatted.append(
             f"Round {round_num}: Result={result}, Improvement={improvement:.2f}%\n"
             f"Knobs: {json.dumps(plan.get('knobs', {}), ensure_ascii=False)}\n"
             f"Indexes: {len(plan.get('indexes', []))} items\n"
             f"MatViews: {len(plan.get('matviews', []))} items"
         )
-    
+
     return "\n\n".join(formatted)
 
-def get_consensus_prompt(syn_report, search_result="None", current_plan=None, history=None):
+def get_consensus_prompt(syn_report, search_result="None", current_plan=None, history=None, store=None):
     voter = f"You are an experienced database administrator, skilled in database optimization."
-    
+
     # Format history for memory window
     memory_window = _format_history_for_consensus(history)
-    
+
+    store = store or get_context_store()
     template = _get_supervisor_template()
-    cons_prompt = template.format(
+    cons_prompt = _render_prompt(
+        store, "consensus", template,
         syn_report=syn_report,
         search_result=search_result,
-        content=review_context,
+        content=store.context('optimization plan review'),
         current_configuration=json.dumps(current_plan, ensure_ascii=False, indent=2) if current_plan else "Default",
         memory_window=memory_window
     )
 
     return voter, cons_prompt
 
-def revision_prompt(question_domain, comments, original_recommendation, search_result="None", current_plan=None):
-    question_analyzer = f"You are an experienced database administrators, skilled in database {question_domain}. "     
+def revision_prompt(question_domain, comments, original_recommendation, search_result="None", current_plan=None, store=None):
+    question_analyzer = f"You are an experienced database administrators, skilled in database {question_domain}. "
+    store = store or get_context_store()
     # Select the appropriate context based on question_domain
-    if question_domain == 'knob tuning':
-        domain_context = knob_context
-    elif question_domain == 'indexes recommendation':
-        domain_context = index_context
-    elif question_domain == 'materialised views recommendation':
-        domain_context = matview_context
-    elif question_domain == 'optimization plan review':
-        domain_context = review_context
-    else:
-        raise NotImplementedError
-    
-    # Extract domain-specific configuration from current plan
-    if current_plan is None:
-        domain_config = "Default"
-    else:
-        if question_domain == 'knob tuning':
-            domain_config = json.dumps(current_plan.get('knobs', {}), ensure_ascii=False, indent=2) or "Default"
-        elif question_domain == 'indexes recommendation':
-            domain_config = json.dumps(current_plan.get('indexes', []), ensure_ascii=False, indent=2) or "Default"
-        elif question_domain == 'materialised views recommendation':
-            domain_config = json.dumps(current_plan.get('matviews', []), ensure_ascii=False, indent=2) or "Default"
-        else:
-            domain_config = "Default"
+    domain_context = store.context(question_domain)
+    domain_config = _domain_config(question_domain, current_plan)
+
     template = _get_specialist_template(question_domain, template_kind="revision")
-    prompt_get_question_analysis = template.format(
+    prompt_get_question_analysis = _render_prompt(
+        store, f"revision:{question_domain}", template,
         comments=comments,
         original_recommendation=original_recommendation,
         question_domain=question_domain,
@@ -282,76 +533,14 @@ def get_consensus_opinion_prompt(domain, syn_report):
         f"You should output in exactly the same format as '''Revisions: [proposed revision advice] '''"
     return opinion_prompt
 
-def get_search_prompt_auto(domain):
+def get_search_prompt_auto(domain, store=None):
     search_prompt = f"You are an experienced database administrator, skilled in database {domain}. "
-
-    if domain == 'knob tuning':
-        domain_context = knob_context
-    elif domain == 'indexes recommendation':
-        domain_context = index_context
-    elif domain == 'materialised views recommendation':
-        domain_context = matview_context
-    elif domain == 'optimization plan review':
-        domain_context = review_context
-    else:
-        raise NotImplementedError
-    
-    prompt = """
-    Task Overview:
-    You are an expert database tuning agent. You are preparing to tune the system for {domain}.
-
-    Context: 
-    {context}
-
-    Goal:
-    Determine if you possess sufficient **external domain knowledge** (e.g., best practices, formulas, hardware-specific recommendations, documentation) to tune the items in the context effectively.
-    Do NOT worry about specific metric values (e.g., current CPU load), as those will be provided by the system.
-    Focus ONLY on whether you need to search for **principles, manuals, or community experiences** regarding the parameters or errors mentioned.
-
-    Output Format:
-    Return a strictly valid JSON object.
-    {{
-        "sufficient": "True" or "False",  // Return "False" if you need to search for external docs/blogs.
-        "keywords": ["keyword1", "keyword2"] // Provide 2-3 specific search queries if "sufficient" is "False".
-    }}
-
-    Example:
-    Context: "Tuning target: explicit_defaults_for_timestamp in MySQL 5.7"
-    Output:
-    {{
-        "sufficient": "False",
-        "keywords": ["MySQL 5.7 explicit_defaults_for_timestamp deprecated behavior", "MySQL 5.7 timestamp best practices"]
-    }}
-    """.format(domain = domain, context=domain_context)
+    domain_context = (store or get_context_store()).context(domain)
+    prompt = _SEARCH_AUTO_TEMPLATE.render(domain=domain, context=domain_context)
     return search_prompt,prompt
 
-def get_search_prompt_on(domain):
+def get_search_prompt_on(domain, store=None):
     search_prompt = f"You are an experienced database administrator, skilled in database {domain}. "
-
-    if domain == 'knob tuning':
-        domain_context = knob_context
-    elif domain == 'indexes recommendation':
-        domain_context = index_context
-    elif domain == 'materialised views recommendation':
-        domain_context = matview_context
-    elif domain == 'optimization plan review':
-        domain_context = review_context
-    else:
-        raise NotImplementedError
-    
-    prompt ="""
-    Task Overview:
-    You are given a context describing the current tuning scenario. 
-    Your task is to generate concise and relevant search keywords that would help retrieve any missing information required for effective {domain}.
-    Note that some items in the current context only contain their names and meanings, their detailed content will be provided later during actual execution.
-    Context: {context}
-    Output Format:
-    - Output must be a valid JSON object.
-    - The object must contain:
-        - "keywords": a list of search keywords (only if "sufficient" is "False"). Each keyword should be concise and directly related to the missing information needed for effective {domain}.
-    Example:
-    {{
-        "keywords": ["PostgreSQL OLAP performance tuning", "Indexing strategies for OLAP workloads"]
-    }}
-    """.format(domain = domain, context=domain_context)
+    domain_context = (store or get_context_store()).context(domain)
+    prompt = _SEARCH_ON_TEMPLATE.render(domain=domain, context=domain_context)
     return search_prompt,prompt
@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url      TEXT PRIMARY KEY,
+    lines    TEXT NOT NULL,
+    bytes    INTEGER NOT NULL,
+    created  REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    keyword   TEXT PRIMARY KEY,
+    urls      TEXT NOT NULL,
+    exhausted INTEGER NOT NULL,
+    bytes     INTEGER NOT NULL,
+    created   REAL NOT NULL,
+    accessed  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed);
+CREATE INDEX IF NOT EXISTS queries_accessed ON queries (accessed);
+"""
+
+
+class SearchCache:
+    """SQLite store for web search results, shared by every keyword.
+
+    - queries: keyword -> ordered list of result URLs that were fetched, and
+      whether the search ran out of results (exhausted)
+    - pages: URL -> extracted lines, so a page found by two keywords is
+      downloaded and parsed once
+
+    Entries older than ttl seconds are ignored and purged; once the stored
+    size exceeds max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_bytes: int = 256 * 1024 * 1024) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Pages are written from the fetch pool threads; every access holds _lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.purge()
+
+    def _fresh(self, created: float) -> bool:
+        return not self.ttl or time.time() - created < self.ttl
+
+    def get_page(self, url: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self._conn.execute("SELECT lines, created FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None or not self._fresh(row[1]):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE pages SET accessed = ? WHERE url = ?", (time.time(), url))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put_page(self, url: str, lines: List[str]) -> None:
+        data = json.dumps(lines, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                               (url, data, len(data.encode('utf-8')), now, now))
+        self._evict()
+
+    def get_query(self, keyword: str) -> Optional[Tuple[List[str], bool]]:
+        """Cached (urls, exhausted) for keyword, or None when missing or expired."""
+        with self._lock:
+            row = self._conn.execute("SELECT urls, exhausted, created FROM queries WHERE keyword = ?",
+                                     (keyword,)).fetchone()
+            if row is None or not self._fresh(row[2]):
+                return None
+            self._conn.execute("UPDATE queries SET accessed = ? WHERE keyword = ?", (time.time(), keyword))
+        return json.loads(row[0]), bool(row[1])
+
+    def put_query(self, keyword: str, urls: List[str], exhausted: bool) -> None:
+        data = json.dumps(urls, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?, ?, ?)",
+                               (keyword, data, int(exhausted), len(data.encode('utf-8')), now, now))
+        self._evict()
+
+    def lines_for_query(self, keyword: str, line_limit: int) -> Optional[List[List[str]]]:
+        """Per-page lines of a cached search, if they can answer line_limit without the network.
+
+        A search cached for a larger line_limit serves any smaller one. Returns
+        None when the query, or one of its pages, is missing or expired, or when
+        the cached pages hold fewer than line_limit lines and the search had
+        more results left.
+        """
+        cached = self.get_query(keyword)
+        if cached is None:
+            return None
+        urls, exhausted = cached
+        pages, total = [], 0
+        for url in urls:
+            lines = self.get_page(url)
+            if lines is None:
+                return None
+            pages.append(lines)
+            total += len(lines)
+            if total >= line_limit:
+                return pages
+        return pages if exhausted else None
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(self._conn.execute(f"SELECT COALESCE(SUM(bytes), 0) FROM {t}").fetchone()[0]
+                       for t in ('pages', 'queries'))
+
+    def purge(self) -> None:
+        """Drop expired entries."""
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE created < ?", (cutoff,))
+            self._conn.execute("DELETE FROM queries WHERE created < ?", (cutoff,))
+
+    def _evict(self) -> None:
+        if not self.max_bytes or self.size() <= self.max_bytes:
+            return
+        self.purge()
+        # Evict least recently used entries of either table down to 90% of the budget
+        excess = self.size() - int(self.max_bytes * 0.9)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT 'pages', url, bytes, accessed FROM pages "
+                "UNION ALL SELECT 'queries', keyword, bytes, accessed FROM queries ORDER BY 4"
+            ).fetchall()
+            for table, key, nbytes, _ in rows:
+                if excess <= 0:
+                    break
+                column = 'url' if table == 'pages' else 'keyword'
+                self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+                excess -= nbytes
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
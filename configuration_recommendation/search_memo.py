@@ -0,0 +1,76 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+
+class SearchMemo:
+    """Per-round memo of search_web results keyed by (domain, context hash).
+
+    Within a round the domain contexts do not change, so every specialist,
+    revision and controller call for a domain reuses the first result.
+
+    prefetch(domains) computes results in a background thread, e.g. while the
+    benchmark of the current round runs. The next round takes a prefetched
+    result for a domain instead of searching on the critical path; it was
+    built from the context of the round before, which is the price of taking
+    search off the critical path.
+    """
+
+    def __init__(self, compute: Callable[[str], Any], context_of: Callable[[str], str]) -> None:
+        self._compute = compute
+        self._context_of = context_of
+        self._results: Dict[Tuple[str, str], Any] = {}
+        self._prefetched: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.round = 0
+        self.stats = {'hits': 0, 'misses': 0, 'prefetched': 0}
+
+    def _key(self, domain: str) -> Tuple[str, str]:
+        context = self._context_of(domain)
+        return domain, hashlib.sha1(str(context).encode('utf-8')).hexdigest()
+
+    def new_round(self, round_id: int) -> None:
+        """Forget the previous round's results; prefetched ones are kept for this round."""
+        with self._lock:
+            self._results.clear()
+            self.round = round_id
+            self.stats = {'hits': 0, 'misses': 0, 'prefetched': 0}
+
+    def get(self, domain: str) -> Any:
+        key = self._key(domain)
+        with self._lock:
+            if key in self._results:
+                self.stats['hits'] += 1
+                return self._results[key]
+            future = self._prefetched.pop(domain, None)
+        result = None
+        if future is not None:
+            try:
+                result = future.result()
+                self.stats['prefetched'] += 1
+            except Exception as e:
+                print(f"Warning: prefetched search for {domain} failed: {e}")
+                future = None
+        if future is None:
+            self.stats['misses'] += 1
+            result = self._compute(domain)
+        with self._lock:
+            self._results[key] = result
+        return result
+
+    def prefetch(self, domains: Iterable[str]) -> None:
+        """Start computing results for domains in the background (one at a time)."""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search-prefetch')
+        with self._lock:
+            for domain in domains:
+                # Results left unused from an earlier prefetch are replaced; running ones kept
+                pending = self._prefetched.get(domain)
+                if pending is None or pending.done():
+                    self._prefetched[domain] = self._pool.submit(self._compute, domain)
+
+    def report(self) -> str:
+        s = self.stats
+        return f"{s['hits']} memo hits, {s['prefetched']} prefetched, {s['misses']} searched"
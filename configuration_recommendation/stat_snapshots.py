@@ -0,0 +1,172 @@
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from DB_test import _get_pg_connection
+
+
+# Cumulative pg_stat_database counters tracked per round
+DB_COUNTERS = (
+    'xact_commit', 'xact_rollback', 'blks_read', 'blks_hit',
+    'tup_returned', 'tup_fetched', 'tup_inserted', 'tup_updated', 'tup_deleted',
+    'temp_files', 'temp_bytes', 'deadlocks', 'blk_read_time', 'blk_write_time',
+)
+INDEX_COUNTERS = ('idx_scan', 'idx_tup_read', 'idx_tup_fetch')
+STATEMENT_COUNTERS = ('calls', 'rows', 'total_exec_time', 'shared_blks_hit', 'shared_blks_read', 'temp_blks_written')
+
+
+class StatSnapshot:
+    """Point-in-time copy of the cumulative pg_stat counters."""
+
+    def __init__(self, label: str, captured_at: float, db: Dict[str, float],
+                 indexes: Dict[Tuple[str, str], Tuple], statements: Dict[int, Tuple]) -> None:
+        self.label = label
+        self.captured_at = captured_at
+        self.db = db
+        # (table, index) -> INDEX_COUNTERS
+        self.indexes = indexes
+        # queryid -> (query, *STATEMENT_COUNTERS)
+        self.statements = statements
+
+
+def capture_snapshot(conn, label: str = "") -> StatSnapshot:
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"""
+            SELECT {', '.join(DB_COUNTERS)}
+            FROM pg_stat_database
+            WHERE datname = current_database();
+            """
+        )
+        row = cur.fetchone()
+        db = dict(zip(DB_COUNTERS, row)) if row else {}
+
+        cur.execute(
+            f"""
+            SELECT relname, indexrelname, {', '.join(INDEX_COUNTERS)}
+            FROM pg_stat_user_indexes;
+            """
+        )
+        indexes = {(r[0], r[1]): tuple(r[2:]) for r in cur.fetchall()}
+
+        statements = {}
+        try:
+            cur.execute(
+                f"""
+                SELECT queryid, query, {', '.join(STATEMENT_COUNTERS)}
+                FROM pg_stat_statements
+                WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database());
+                """
+            )
+            statements = {r[0]: tuple(r[1:]) for r in cur.fetchall()}
+        except Exception as e:
+            # pg_stat_statements is optional for the round deltas
+            print(f"Warning: pg_stat_statements snapshot failed: {e}")
+            conn.rollback()
+        return StatSnapshot(label, time.time(), db, indexes, statements)
+    finally:
+        cur.close()
+
+
+def _diff(after, before):
+    # A counter that went backwards was reset in between; count from zero
+    d = (after or 0) - (before or 0)
+    return after or 0 if d < 0 else d
+
+
+def compute_delta(before: StatSnapshot, after: StatSnapshot, top_n: int = 100) -> Dict[str, Any]:
+    """Per-round counter deltas and rates between two snapshots."""
+    elapsed = max(after.captured_at - before.captured_at, 1e-9)
+
+    db = {k: _diff(after.db.get(k), before.db.get(k)) for k in DB_COUNTERS}
+    blocks = db['blks_read'] + db['blks_hit']
+    xacts = db['xact_commit'] + db['xact_rollback']
+    db.update({
+        'buffer_pool_hit_ratio': db['blks_hit'] / (blocks + 1e-9),
+        'blks_read_per_s': db['blks_read'] / elapsed,
+        'blks_hit_per_s': db['blks_hit'] / elapsed,
+        'xact_per_s': xacts / elapsed,
+        'tup_returned_per_s': db['tup_returned'] / elapsed,
+        'temp_bytes_per_s': db['temp_bytes'] / elapsed,
+    })
+
+    indexes = []
+    for key, vals in after.indexes.items():
+        prev = before.indexes.get(key, (0,) * len(INDEX_COUNTERS))
+        d = dict(zip(INDEX_COUNTERS, (_diff(a, b) for a, b in zip(vals, prev))))
+        indexes.append({'table': key[0], 'index': key[1], **d})
+
+    statements = []
+    for qid, vals in after.statements.items():
+        prev = before.statements.get(qid, (None,) + (0,) * len(STATEMENT_COUNTERS))
+        d = dict(zip(STATEMENT_COUNTERS, (_diff(a, b) for a, b in zip(vals[1:], prev[1:]))))
+        if not d['calls']:
+            continue
+        statements.append({
+            'query': vals[0],
+            'calls': d['calls'],
+            'rows': d['rows'],
+            'total_exec_time_ms': d['total_exec_time'],
+            'mean_exec_time_ms': d['total_exec_time'] / d['calls'],
+            'rows_per_call': d['rows'] / d['calls'],
+            'shared_blks_read': d['shared_blks_read'],
+            'shared_blks_hit': d['shared_blks_hit'],
+            'temp_blks_written': d['temp_blks_written'],
+        })
+    statements.sort(key=lambda s: -s['total_exec_time_ms'])
+
+    return {
+        'from': before.label,
+        'to': after.label,
+        'elapsed_s': elapsed,
+        'database': db,
+        'index_usage': indexes,
+        'top_queries': statements[:top_n],
+        'calls_per_query': (sum(s['calls'] for s in statements) / len(statements)) if statements else 0.0,
+    }
+
+
+class SnapshotRing:
+    """Recent snapshots and per-round deltas, bounded in memory.
+
+    Call begin_round() once the plan has been applied and end_round() when
+    the benchmark finishes; end_round() returns the round's delta.
+    """
+
+    def __init__(self, size: int = 8, connect=_get_pg_connection) -> None:
+        self.snapshots = deque(maxlen=size)
+        self.deltas = deque(maxlen=size)
+        self._connect = connect
+        self._open: Optional[StatSnapshot] = None
+
+    def capture(self, label: str) -> StatSnapshot:
+        conn = self._connect()
+        try:
+            snap = capture_snapshot(conn, label)
+        finally:
+            conn.close()
+        self.snapshots.append(snap)
+        return snap
+
+    def begin_round(self, round_id) -> None:
+        self._open = self.capture(f"round {round_id} start")
+
+    def end_round(self, round_id) -> Optional[Dict[str, Any]]:
+        if self._open is None:
+            return None
+        delta = compute_delta(self._open, self.capture(f"round {round_id} end"))
+        delta['round'] = round_id
+        self._open = None
+        self.deltas.append(delta)
+        return delta
+
+    def abort_round(self) -> None:
+        """Forget the open round (its run failed); no delta is recorded."""
+        self._open = None
+
+    def latest_delta(self) -> Optional[Dict[str, Any]]:
+        return self.deltas[-1] if self.deltas else None
+
+    def recent_deltas(self) -> List[Dict[str, Any]]:
+        return list(self.deltas)
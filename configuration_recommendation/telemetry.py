@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Optional, Tuple
+
+from interaction_log import JsonlLog
+
+
+COUNTERS = ('prompt_tokens', 'completion_tokens', 'bytes_sent', 'bytes_received')
+# Stage groups of the per-round table, in pipeline order
+ROUND_COLUMNS = ('feature_refresh', 'search', 'agent', 'controller', 'apply', 'restart', 'benchmark')
+# Stages run by background threads overlap the foreground ones; they are not part of round totals
+BACKGROUND_PREFIX = 'prefetch'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Stage:
+    __slots__ = ('name', 'detail', 'start', 'child_s') + COUNTERS
+
+    def __init__(self, name: str, detail: str) -> None:
+        self.name = name
+        self.detail = detail
+        self.start = time.perf_counter()
+        self.child_s = 0.0
+        for c in COUNTERS:
+            setattr(self, c, 0)
+
+
+class Telemetry:
+    """Wall time, tokens and bytes per pipeline stage.
+
+    Stages nest (a search inside an agent call, a restart inside knob
+    application); each record keeps both its wall time and its self time,
+    which excludes nested stages, so self times add up to the session time.
+    count() adds tokens/bytes to the innermost stage of the calling thread.
+
+    Every finished stage is appended to a JSONL file; prometheus_text() and
+    table() summarise the session.
+
+    With a profiler (workload_compression/profiling.py), every stage is also
+    a profiling scope named <name> or <name>.<detail>.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, price_prompt_1k: float = 0.0,
+                 price_completion_1k: float = 0.0, profiler=None) -> None:
+        self._log = JsonlLog(jsonl_path) if jsonl_path else None
+        self.profiler = profiler
+        if self._log is not None:
+            self._log.profiler = profiler
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.round: Optional[int] = None
+        self.price_prompt_1k = price_prompt_1k
+        self.price_completion_1k = price_completion_1k
+        # (name, detail) -> totals; (round, name) -> self seconds
+        self.totals: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.by_round: Dict[Tuple[Any, str], float] = defaultdict(float)
+        self.started = time.time()
+
+    def _stack(self) -> List[_Stage]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def stage(self, name: str, detail: str = ''):
+        stack = self._stack()
+        current = _Stage(name, detail)
+        stack.append(current)
+        profiled = self.profiler.scope(f'{name}.{detail}' if detail else name) if self.profiler else nullcontext()
+        try:
+            with profiled:
+                yield current
+        finally:
+            stack.pop()
+            wall = time.perf_counter() - current.start
+            if stack:
+                stack[-1].child_s += wall
+            self._finish(name, detail, wall, wall - current.child_s,
+                         {c: getattr(current, c) for c in COUNTERS})
+
+    def count(self, **counts: float) -> None:
+        """Add token/byte counts to the innermost open stage of this thread."""
+        stack = self._stack()
+        if not stack:
+            return
+        for key, value in counts.items():
+            setattr(stack[-1], key, getattr(stack[-1], key) + (value or 0))
+
+    def record(self, name: str, wall_s: float, detail: str = '', **counts: float) -> None:
+        """Record a stage timed by the caller (e.g. one spanning callbacks)."""
+        stack = self._stack()
+        if stack:
+            stack[-1].child_s += wall_s
+        self._finish(name, detail, wall_s, wall_s, {c: counts.get(c, 0) for c in COUNTERS})
+
+    def _finish(self, name: str, detail: str, wall: float, self_s: float, counts: Dict[str, float]) -> None:
+        with self._lock:
+            totals = self.totals[(name, detail)]
+            totals['calls'] += 1
+            totals['wall_s'] += wall
+            totals['self_s'] += self_s
+            for c, v in counts.items():
+                totals[c] += v
+            if not name.startswith(BACKGROUND_PREFIX):
+                self.by_round[(self.round, name.split('.')[0])] += self_s
+        if self._log is not None:
+            self._log.write({'ts': time.time(), 'round': self.round, 'stage': name, 'detail': detail,
+                             'wall_s': round(wall, 6), 'self_s': round(self_s, 6),
+                             **{c: v for c, v in counts.items() if v}})
+
+    def cost(self, totals: Dict[str, float]) -> float:
+        return (totals['prompt_tokens'] * self.price_prompt_1k + totals['completion_tokens'] * self.price_completion_1k) / 1000
+
+    def prometheus_text(self, prefix: str = 'idstune') -> str:
+        metrics = [
+            ('stage_seconds_total', 'Self wall time of the stage (nested stages excluded)', 'self_s'),
+            ('stage_wall_seconds_total', 'Wall time of the stage including nested stages', 'wall_s'),
+            ('stage_calls_total', 'Number of times the stage ran', 'calls'),
+            ('stage_prompt_tokens_total', 'LLM prompt tokens', 'prompt_tokens'),
+            ('stage_completion_tokens_total', 'LLM completion tokens', 'completion_tokens'),
+            ('stage_bytes_sent_total', 'Bytes sent (LLM requests)', 'bytes_sent'),
+            ('stage_bytes_received_total', 'Bytes received (LLM responses, web pages)', 'bytes_received'),
+        ]
+        with self._lock:
+            items = sorted((k, dict(v)) for k, v in self.totals.items())
+        out = []
+        for metric, help_text, key in metrics:
+            out.append(f'# HELP {prefix}_{metric} {help_text}')
+            out.append(f'# TYPE {prefix}_{metric} counter')
+            for (name, detail), totals in items:
+                labels = f'stage="{_escape(name)}"' + (f',detail="{_escape(detail)}"' if detail else '')
+                out.append(f'{prefix}_{metric}{{{labels}}} {totals.get(key, 0):g}')
+        return '\n'.join(out) + '\n'
+
+    def write_prometheus(self, path: str) -> None:
+        # Textfile-collector style: replace atomically so scrapers never see a partial file
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def table(self) -> str:
+        """End-of-session breakdown: one row per stage, then seconds per round and stage group."""
+        with self._lock:
+            items = sorted(((k, dict(v)) for k, v in self.totals.items()), key=lambda kv: -kv[1]['self_s'])
+            by_round = dict(self.by_round)
+        session = max(sum(t['self_s'] for (n, _), t in items if not n.startswith(BACKGROUND_PREFIX)), 1e-9)
+        priced = bool(self.price_prompt_1k or self.price_completion_1k)
+        header = f"{'stage':<34}{'calls':>7}{'total s':>10}{'share':>7}{'mean s':>9}{'prompt tok':>12}{'compl tok':>11}{'MB':>8}"
+        lines = [header + (f"{'cost':>9}" if priced else ''), '-' * (len(header) + (9 if priced else 0))]
+        for (name, detail), t in items:
+            label = f'{name}[{detail}]' if detail else name
+            row = (f"{label[:33]:<34}{int(t['calls']):>7}{t['self_s']:>10.1f}{t['self_s'] / session:>7.1%}"
+                   f"{t['wall_s'] / t['calls']:>9.2f}{int(t['prompt_tokens']):>12}{int(t['completion_tokens']):>11}"
+                   f"{(t['bytes_sent'] + t['bytes_received']) / 1e6:>8.2f}")
+            lines.append(row + (f"{self.cost(t):>9.3f}" if priced else ''))
+
+        rounds = sorted({r for r, _ in by_round}, key=lambda r: (r is None, r if r is not None else 0))
+        if rounds:
+            lines += ['', f"{'round':<8}" + ''.join(f'{c:>16}' for c in ROUND_COLUMNS) + f"{'total':>10}"]
+            for r in rounds:
+                cells = [by_round.get((r, c), 0.0) for c in ROUND_COLUMNS]
+                total = sum(v for (rr, _), v in by_round.items() if rr == r)
+                lines.append(f"{'-' if r is None else r!s:<8}" + ''.join(f'{v:>16.1f}' for v in cells) + f'{total:>10.1f}')
+        return '\n'.join(lines)
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+
+
+_default: Optional[Telemetry] = None
+
+
+def get_telemetry() -> Telemetry:
+    """Process-wide Telemetry; configure() replaces it with one that exports."""
+    global _default
+    if _default is None:
+        _default = Telemetry()
+    return _default
+
+
+def configure(jsonl_path: Optional[str] = None, **kwargs) -> Telemetry:
+    global _default
+    _default = Telemetry(jsonl_path, **kwargs)
+    return _default
+
+
+def stage(name: str, detail: str = ''):
+    return get_telemetry().stage(name, detail)
+
+
+def count(**counts: float) -> None:
+    get_telemetry().count(**counts)
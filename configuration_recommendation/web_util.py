@@ -1,26 +1,153 @@
-from bs4 import BeautifulSoup
+import codecs
+import re
+from html.parser import HTMLParser
+
+# Bytes of HTML handed to the parser per page; the rest is ignored
+MAX_PARSE_BYTES = 2 * 1024 * 1024
+# Characters fed to the parser at a time, so a line limit can stop parsing mid-chunk
+_FEED_SIZE = 16 * 1024
+
+# Content of these elements is never text
+_SKIP_TAGS = frozenset(['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'canvas', 'select', 'button'])
+# Page chrome rather than content (<form> is not: WebForms pages wrap the whole body in one)
+_BOILERPLATE_TAGS = frozenset(['nav', 'header', 'footer', 'aside', 'menu', 'dialog'])
+# Inside these a <header> holds the content's own heading, not site chrome
+_CONTENT_TAGS = frozenset(['article', 'main', 'section'])
+_BOILERPLATE_ROLES = frozenset(['navigation', 'banner', 'contentinfo', 'complementary', 'search', 'menu', 'dialog'])
+# Void elements never get an end tag, so they must not open a skipped region
+_VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                        'param', 'source', 'track', 'wbr'])
+# Tags that end the current line
+_BLOCK_TAGS = frozenset(['p', 'div', 'br', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'tr', 'td', 'th', 'table',
+                         'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote', 'section', 'article',
+                         'main', 'header', 'hr', 'title', 'body', 'figcaption', 'caption'])
+_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.I)
+
+
+class _TextExtractor(HTMLParser):
+    """Incremental HTML to lines, dropping scripts, styles and page chrome as it goes."""
+
+    def __init__(self, max_lines=None):
+        super().__init__(convert_charrefs=True)
+        self.max_lines = max_lines
+        self.lines = []
+        self.done = False
+        self._parts = []
+        self._skip = []
+        self._content_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _VOID_TAGS:
+            if tag in _BLOCK_TAGS and not self._skip:
+                self._flush()
+            return
+        if self._skip:
+            self._skip.append(tag)
+            return
+        role = dict(attrs).get('role') or ''
+        chrome = tag in _BOILERPLATE_TAGS and not (tag == 'header' and self._content_depth)
+        if tag in _SKIP_TAGS or chrome or role in _BOILERPLATE_ROLES:
+            self._flush()
+            self._skip.append(tag)
+            return
+        if tag in _CONTENT_TAGS:
+            self._content_depth += 1
+        if tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if self._skip:
+            # Pop back to the matching start tag; tolerates unclosed inner tags
+            if tag in self._skip:
+                while self._skip.pop() != tag:
+                    pass
+            return
+        if tag in _CONTENT_TAGS and self._content_depth:
+            self._content_depth -= 1
+        if tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._skip or self.done:
+            return
+        if '\n' in data:
+            pieces = data.split('\n')
+            self._parts.append(pieces[0])
+            for piece in pieces[1:]:
+                self._flush()
+                self._parts.append(piece)
+        else:
+            self._parts.append(data)
+
+    def _flush(self):
+        if not self._parts:
+            return
+        text = ''.join(self._parts)
+        self._parts = []
+        for part in text.split('  '):
+            part = part.strip()
+            if len(part) > 2:
+                self.lines.append(part)
+        if self.max_lines and len(self.lines) >= self.max_lines:
+            del self.lines[self.max_lines:]
+            self.done = True
+
+    def close(self):
+        super().close()
+        if not self.done:
+            self._flush()
+
+
+def extract_text_stream(chunks, max_lines=None, max_parse_bytes=MAX_PARSE_BYTES, encoding=None):
+    """ Extract text lines from HTML arriving in chunks (bytes or str).
+
+    Parsing stops as soon as max_lines lines exist or max_parse_bytes of
+    input have been consumed; the remaining chunks are never pulled.
+
+    Returns:
+        Lines from the page, in document order.
+    """
+    parser = _TextExtractor(max_lines)
+    decoder = None
+    parsed = 0
+    for chunk in chunks:
+        if max_parse_bytes and parsed + len(chunk) > max_parse_bytes:
+            chunk = chunk[:max_parse_bytes - parsed]
+        parsed += len(chunk)
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                found = _CHARSET.search(chunk[:4096])
+                charset = encoding or (found.group(1).decode('ascii') if found else 'utf-8')
+                try:
+                    decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+                except LookupError:
+                    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            chunk = decoder.decode(chunk)
+        for i in range(0, len(chunk), _FEED_SIZE):
+            parser.feed(chunk[i:i + _FEED_SIZE])
+            if parser.done:
+                break
+        if parser.done or (max_parse_bytes and parsed >= max_parse_bytes):
+            break
+    # Release a streaming source (e.g. an HTTP body) that was not read to the end
+    if hasattr(chunks, 'close'):
+        chunks.close()
+    parser.close()
+    return parser.lines
+
+
+def extract_text(html_src, max_lines=None, max_parse_bytes=MAX_PARSE_BYTES):
+    """ Extract text passages from given URL body.
 
-def extract_text(html_src):
-    """ Extract text passages from given URL body. 
-    
     Args:
         html_src: HTML source code for text extraction.
-        
+        max_lines: Stop once this many lines were extracted (None for all).
+        max_parse_bytes: Ignore the page beyond this many bytes.
+
     Returns:
         Lines from Web site or None if not retrievable.
     """
     try:
-        parsed = BeautifulSoup(html_src, features="html.parser")
-        for script in parsed(["script", "style"]):
-            script.extract()
-        text = parsed.get_text()
-        print(f'Parsed text with length {len(text)}.')
-        lines = [line.strip() for line in text.splitlines()]
-        clean_lines = []
-        for line in lines:
-            clean_lines += [part.strip() for part in line.split("  ")]
-        clean_lines = [line for line in clean_lines if len(line)>2]
-        print(f'Extracted {len(clean_lines)} lines')
-        return clean_lines
+        return extract_text_stream([html_src], max_lines, max_parse_bytes)
     except:
-        return []
\ No newline at end of file
+        return []
@@ -4,6 +4,19 @@ from schema_alter import *
 import json
 
 
+# split an iterable of lines into SQL statements terminated by ';'
+def iter_statements(lines):
+    buf=""
+    for line in lines:
+        buf+=line
+        while ";" in buf:
+            sql,buf=buf.split(";",1)
+            if sql.strip():
+                yield sql.strip()
+    if buf.strip():
+        yield buf.strip()
+
+
 class WP():
     def __init__(self) -> None:
         self.dbs=None
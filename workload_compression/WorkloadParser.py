@@ -1,189 +1,262 @@
 from Parserbase import *
+from workload_features import WorkloadFeatures, PREDICATE_TYPES
+from workload_sampler import sample_workload
+from access_graph import AccessGraph
+import profiling
+import atexit
 import configparser
 import os
 import sys
+import time
+import warnings
+from collections import deque
+
+AGG_PATTERN=re.compile(
+    r'\b(COUNT|SUM|AVG|MAX|MIN|STDDEV|VARIANCE|GROUP_CONCAT)\s*\(.*?\)',
+    re.IGNORECASE
+)
+
 class WP2(WP):
     def __init__(self) -> None:
         self.dbs=None
         pass
     
-    # workload analysis function
-    def parse_workload(self,workload_path):
-        if self.dbs==None:
-            print("fatal error: dbs not initialization correctly.")
-            return
-        else:
-            read_cnt=0
-            write_cnt=0
-            predicate_num=0
-            group_by_num=0
-            order_by_num=0
-            aggr_num=0
-            desc_num=0
-            non_agg_count=0
-            
-            tbl_dict={}
-            tbl_col_dict={}
-            predicate_dict={}
-            predicate_type=["=",">","<",">=","<="]
-            for i in predicate_type:
-                predicate_dict[i]=0
-            
-            # Set the output window environment to display all information
-            pd.set_option('max_colwidth',None)
-            df = pd.read_csv(workload_path, header=None,on_bad_lines='skip',sep = r'\s+\n',index_col=0,engine='python') 
-            # df=pd.read_csv("seats_workload.txt",header=None)
-            
-            tokens=""
-            for i in df.index.values:
-                tokens+=i
-                tokens+=" "
+    # read the workload file and split it into SQL statements
+    def read_workload(self,workload_path):
+        # Set the output window environment to display all information
+        pd.set_option('max_colwidth',None)
+        df = pd.read_csv(workload_path, header=None,on_bad_lines='skip',sep = r'\s+\n',index_col=0,engine='python') 
+        # df=pd.read_csv("seats_workload.txt",header=None)
         
-            # Using regular expressions to segment
-            sql_list=re.split('[\s]*;[\n]*[\s]*',tokens)
-            # token_list=re.split(r'[\(,;\s\)\n\t]+',tokens)
-            # print(sql_list[-3:])
-            for i in range(len(sql_list)):
-                import psqlparse
-                if sql_list[i]=="" or sql_list[i]==' ':
-                    continue
-                # print("i: ",sql_list[i])
-                real_tb_used=psqlparse.parse(sql_list[i]+";")[0].tables()
-                # print(real_tb_used)
-                for table_name in real_tb_used:
-                    if table_name not in tbl_dict.keys():
-                        tbl_dict[table_name]=1
-                        tbl_col_dict[table_name]={}
-                        tb_tmp=self.dbs.getTableByName(table_name)
-                        # print(table_name)
-                        for it in tb_tmp.col:
-                            tbl_col_dict[table_name][it.name]=0
-                    else:
-                        tbl_dict[table_name]+=1
-                
-                match = re.search(r'SELECT\s+(.*?)\s+FROM', sql_list[i], re.IGNORECASE)
-                
-                if match:
-                    columns_part = match.group(1).strip()
-                    if columns_part=='*':
-                        non_agg_count+=1
-                        warnings.warn(
-                            "Detected SELECT * usage, which may affect performance and result in unnecessary column returns",
-                            category=RuntimeWarning
-                        )
-                    else:
-                        agg_pattern=re.compile(
-                            r'\b(COUNT|SUM|AVG|MAX|MIN|STDDEV|VARIANCE|GROUP_CONCAT)\s*\(.*?\)',
-                            re.IGNORECASE
-                        )
-                    columns = [col.strip() for col in columns_part.split(',')]
-                    for col in columns:
-                        if not agg_pattern.search(col):
-                            non_agg_count+=1
-                    # print(non_agg_count)
+        tokens=""
+        for i in df.index.values:
+            tokens+=i
+            tokens+=" "
     
-                simple_sql_token_list=re.split(r'[\(,;\s\)\n\t]+',sql_list[i])
-                if simple_sql_token_list.__contains__("")==True:
-                    simple_sql_token_list.remove("")
-                # print(simple_sql_token_list)
-                cnt_bool=False
-                #  Query Semantic Features
-                for id,j in enumerate(simple_sql_token_list):
-                    if cnt_bool==False:
-                        if j.upper()=='SELECT':
-                            read_cnt+=1
-                            cnt_bool=True
-                        if j.upper()=='UPDATE' or j.upper()=='INSERT':
-                            write_cnt+=1
-                            cnt_bool=True
-                    
-                    if j.upper()=='AND' or j.upper()=='OR' or j.upper()=="WHERE":
-                        predicate_num+=1
-                    elif j.upper()=='GROUP' and simple_sql_token_list[id+1].upper()=="BY":
-                        group_by_num+=1
-                    elif j.upper()=='ORDER' and simple_sql_token_list[id+1].upper()=="BY":
-                        order_by_num+=1
-                    elif j.upper()=="SUM" or j.upper()=="MIN" or j.upper()=="MAX" or j.upper()=="AVG":
-                        aggr_num+=1
-                    elif j.upper()=="DESC":
-                        desc_num+=1
-                    elif j in predicate_type:
-                        predicate_dict[j]+=1
-                    else:
-                        # if j=='supplier':
-                        #     print(simple_sql_token_list[id-1:id+5])
-                        pass
-                        
-                # Data Access Features
-                for token in simple_sql_token_list:
-                    for tb_tmp in real_tb_used:
-                        for col_tmp in tbl_col_dict[tb_tmp].keys():
-                            if token==col_tmp:
-                                # print("table_name : ",tb_tmp,"col_name : ",col_tmp)
-                                tbl_col_dict[tb_tmp][col_tmp]+=1
-                    tmp_res=re.match(".+\..+",token)
-                    if tmp_res!=None:
-                        # print(tmp_res.group().split("."))
-                        if tmp_res.group().split(".")[0] in real_tb_used:
-                            # print(tmp_res.group().split()[0],tmp_res.group().split()[1])
-                            tbl_col_dict[tmp_res.group().split(".")[0]][tmp_res.group().split(".")[1]]+=1
-        maxi=""
-        maxv=0
-        mini=""
-        minv=100000000    
-        sumv=0            
+        # Using regular expressions to segment
+        sql_list=re.split('[\s]*;[\n]*[\s]*',tokens)
+        sample_sqls=[str(df.iloc[i].name) for i in range(min(2,len(df)))]
+        return sql_list,sample_sqls,tokens.count(";")
 
+    # add the statistics of one SQL statement to feats
+    def analyze_statement(self,sql,feats):
+        import psqlparse
+        if sql=="" or sql==' ':
+            return None
+        tbl_dict=feats.tbl_dict
+        tbl_col_dict=feats.tbl_col_dict
+        predicate_dict=feats.predicate_dict
+        # print("i: ",sql)
+        stmt=psqlparse.parse(sql+";")[0]
+        # utility statements (BEGIN, SET, ...) are parsed into plain dicts without tables
+        if not hasattr(stmt,'tables'):
+            return None
+        real_tb_used=stmt.tables()
+        # statements on tables missing from the schema are not counted at all
+        schema_tables={table_name:self.dbs.getTableByName(table_name) for table_name in real_tb_used}
+        if any(tb is None for tb in schema_tables.values()):
+            return None
+        if feats.access_graph is not None:
+            feats.access_graph.add_statement(stmt)
+        # print(real_tb_used)
+        for table_name in real_tb_used:
+            if table_name not in tbl_dict.keys():
+                tbl_dict[table_name]=1
+                tbl_col_dict[table_name]={}
+                tb_tmp=schema_tables[table_name]
+                # print(table_name)
+                for it in tb_tmp.col:
+                    tbl_col_dict[table_name][it.name]=0
+            else:
+                tbl_dict[table_name]+=1
         
-        for table in self.dbs.tables:
-            if table.name not in tbl_dict.keys():
-                tbl_dict[table.name]=0
-                tbl_col_dict[table.name]={}
-                for it in table.col:
-                    tbl_col_dict[table.name][it.name]=0
+        match = re.search(r'SELECT\s+(.*?)\s+FROM', sql, re.IGNORECASE)
+        
+        if match:
+            columns_part = match.group(1).strip()
+            if columns_part=='*':
+                feats.non_agg_count+=1
+                warnings.warn(
+                    "Detected SELECT * usage, which may affect performance and result in unnecessary column returns",
+                    category=RuntimeWarning
+                )
+            columns = [col.strip() for col in columns_part.split(',')]
+            for col in columns:
+                if not AGG_PATTERN.search(col):
+                    feats.non_agg_count+=1
+            # print(feats.non_agg_count)
+
+        simple_sql_token_list=re.split(r'[\(,;\s\)\n\t]+',sql)
+        if simple_sql_token_list.__contains__("")==True:
+            simple_sql_token_list.remove("")
+        # print(simple_sql_token_list)
+        cnt_bool=False
+        #  Query Semantic Features
+        for id,j in enumerate(simple_sql_token_list):
+            if cnt_bool==False:
+                if j.upper()=='SELECT':
+                    feats.read_cnt+=1
+                    cnt_bool=True
+                if j.upper()=='UPDATE' or j.upper()=='INSERT':
+                    feats.write_cnt+=1
+                    cnt_bool=True
             
-        for i in list(tbl_dict.keys()):
-            sumv+=tbl_dict[i]
-            if tbl_dict[i]>maxv:
-                maxv=tbl_dict[i]
-                maxi=i
-            if tbl_dict[i]<minv:
-                minv=tbl_dict[i]
-                mini=i
+            if j.upper()=='AND' or j.upper()=='OR' or j.upper()=="WHERE":
+                feats.predicate_num+=1
+            elif j.upper()=='GROUP' and simple_sql_token_list[id+1].upper()=="BY":
+                feats.group_by_num+=1
+            elif j.upper()=='ORDER' and simple_sql_token_list[id+1].upper()=="BY":
+                feats.order_by_num+=1
+            elif j.upper()=="SUM" or j.upper()=="MIN" or j.upper()=="MAX" or j.upper()=="AVG":
+                feats.aggr_num+=1
+            elif j.upper()=="DESC":
+                feats.desc_num+=1
+            elif j in PREDICATE_TYPES:
+                predicate_dict[j]+=1
+            else:
+                pass
                 
-        print("type of workload :",workload_path)
-        # print("total token num :",len(token_list))
-        print("sample SQL1:",re.split(r'[,;\s\n\t\(\)]+',str(df.iloc[0].name)))
-        print("sample SQL2:",re.split(r'[,;\s\n\t\(\)]+',str(df.iloc[1].name)))
-        print("size of workload :",tokens.count(";"))
-        print("read write ratio : "+str(read_cnt)+"|"+str(write_cnt)+"  "+str(read_cnt/(write_cnt+read_cnt)))
-        print("group by ratio : "+str(group_by_num/(write_cnt+read_cnt)))
-        print("order by ratio : "+str(order_by_num/(write_cnt+read_cnt)))
-        print("aggregation ratio : "+str(aggr_num/(write_cnt+read_cnt)))
-        print("average predicate num per SQL :",str(predicate_num/(read_cnt+write_cnt)))
-        print("max visited table :",maxi,str(maxv/sumv))
-        print("min visited table :",mini,str(minv/sumv))
-        
-        print("average table access count :",sumv/tokens.count(";"))
-        print("average item returned count per query :",non_agg_count/tokens.count(";"))
-        print("order by logic ratio :",(order_by_num-desc_num)/order_by_num,"(asc):",desc_num/order_by_num,"(desc)")
-        
-        print("where clause comparison condition ratio :")
-        for i in predicate_type:
-            print("\t",i,predicate_dict[i]/sum(predicate_dict.values()))
-        
-        print("table access pattern :")
-        # tbl_dict record the access patterns of each table and column
-        for i in tbl_dict:
-            print("\t",i,str(tbl_dict[i])+"|"+str(sumv),"\t",tbl_dict[i]/sumv)
-            tmp_sum=0
-            for j in tbl_col_dict[i]:
-                tmp_sum+=tbl_col_dict[i][j]
-            if tmp_sum==0:
+        # Data Access Features
+        for token in simple_sql_token_list:
+            for tb_tmp in real_tb_used:
+                if token in tbl_col_dict[tb_tmp]:
+                    # print("table_name : ",tb_tmp,"col_name : ",token)
+                    tbl_col_dict[tb_tmp][token]+=1
+            tmp_res=re.match(".+\..+",token)
+            if tmp_res!=None:
+                # print(tmp_res.group().split("."))
+                tb_name,col_name=tmp_res.group().split(".")[:2]
+                if tb_name in real_tb_used and col_name in tbl_col_dict[tb_name]:
+                    tbl_col_dict[tb_name][col_name]+=1
+        return real_tb_used
+
+    # tables never visited are still reported, with zero counts
+    def finalize_features(self,feats):
+        for table in self.dbs.tables:
+            if table.name not in feats.tbl_dict.keys():
+                feats.tbl_dict[table.name]=0
+                feats.tbl_col_dict[table.name]={}
+                for it in table.col:
+                    feats.tbl_col_dict[table.name][it.name]=0
+        return feats
+
+    # workload analysis function
+    # sample='reservoir'|'stratified' estimates the statistics from a sample, sized by
+    # sample_size, target_error (at the given confidence) or time_budget (seconds)
+    def parse_workload(self,workload_path,verbose=True,access_graph=True,sample=None,sample_size=None,target_error=None,time_budget=None,confidence=0.95,seed=None):
+        if self.dbs==None:
+            print("fatal error: dbs not initialization correctly.")
+            return None
+        if sample:
+            with profiling.scope('sample_workload'):
+                feats=sample_workload(self,workload_path,sample,sample_size,target_error,time_budget,confidence,seed,access_graph)
+        else:
+            with profiling.scope('read_workload'):
+                sql_list,sample_sqls,statement_num=self.read_workload(workload_path)
+            with profiling.scope('analyze_statements'):
+                feats=WorkloadFeatures(workload_path=workload_path,sample_sqls=sample_sqls,statement_num=statement_num,
+                                       access_graph=AccessGraph(self.dbs) if access_graph else None)
+                for sql in sql_list:
+                    # utility statements and statements on unknown tables are skipped; keep the denominator consistent
+                    if self.analyze_statement(sql,feats) is None and sql.strip()!="":
+                        feats.statement_num-=1
+            with profiling.scope('finalize_features'):
+                self.finalize_features(feats)
+        if verbose:
+            with profiling.scope('render_text'):
+                print(feats.render_text(),end="")
+        return feats
+
+    # -----------------------------
+    # Incremental mode
+    # -----------------------------
+
+    # decay: per-statement retention factor in (0,1], older statements fade as decay**age
+    # window: keep only the statistics of the latest `window` statements
+    def start_incremental(self,workload_path="<stream>",decay=None,window=None,access_graph=True):
+        if self.dbs==None:
+            raise ValueError("dbs not initialization correctly, call parse_schema first.")
+        if decay is not None and window is not None:
+            raise ValueError("decay and window are mutually exclusive.")
+        if decay is not None and not 0<decay<=1:
+            raise ValueError(f"decay must be in (0,1], got {decay}")
+        if window is not None and window<=0:
+            raise ValueError(f"window must be positive, got {window}")
+        self.inc_feats=WorkloadFeatures(workload_path=workload_path,access_graph=AccessGraph(self.dbs) if access_graph else None)
+        self.inc_decay=decay
+        self.inc_window=deque() if window else None
+        self.inc_window_size=window
+        # With decay, new statements are added with a growing weight instead of
+        # scaling all counters down on every statement; snapshot() divides it out.
+        self.inc_weight=1.0
+        # statements that could not be parsed or refer to unknown tables
+        self.inc_skipped=0
+        self.inc_errors=0
+
+    # update the running statistics with one SQL statement
+    def feed(self,sql):
+        sql=sql.strip()
+        if sql.endswith(";"):
+            sql=sql[:-1].strip()
+        if sql=="":
+            return
+        feats=self.inc_feats
+        delta=WorkloadFeatures(access_graph=AccessGraph(self.dbs) if feats.access_graph is not None else None)
+        # a live log carries statements the parser or the schema does not know; skip them, keep the stream going
+        try:
+            analyzed=self.analyze_statement(sql,delta)
+        except Exception as e:
+            analyzed=None
+            self.inc_errors+=1
+            if self.inc_errors==1:
+                print(f"Warning: skipping statement that failed to parse ({e}): {sql[:200]}")
+        if analyzed is None:
+            self.inc_skipped+=1
+            return
+        delta.statement_num=1
+        feats.sample_sqls=(feats.sample_sqls+[sql+" ;"])[-2:]
+        if self.inc_decay is not None:
+            self.inc_weight/=self.inc_decay
+            feats.add(delta,self.inc_weight)
+            if self.inc_weight>1e12:
+                feats.scale(1/self.inc_weight)
+                self.inc_weight=1.0
+        else:
+            feats.add(delta)
+            if self.inc_window is not None:
+                self.inc_window.append(delta)
+                if len(self.inc_window)>self.inc_window_size:
+                    feats.add(self.inc_window.popleft(),-1)
+
+    def feed_stream(self,lines,snapshot_every=None,on_snapshot=None):
+        n=0
+        for sql in iter_statements(lines):
+            self.feed(sql)
+            n+=1
+            if snapshot_every and on_snapshot and n%snapshot_every==0:
+                on_snapshot(self.snapshot())
+        return n
+
+    # copy of the current statistics, safe to serialize while feeding continues
+    def snapshot(self):
+        feats=self.inc_feats.copy()
+        if self.inc_decay is not None:
+            # decayed counters are fractional; report them as whole counts like the sampler does
+            feats.scale(1/self.inc_weight).round_counts()
+        return self.finalize_features(feats)
+
+
+# yield lines appended to a file, like `tail -f`
+def follow_file(path,from_start=True,poll_interval=0.5):
+    with open(path,'r',encoding='utf-8',errors='replace') as f:
+        if not from_start:
+            f.seek(0,os.SEEK_END)
+        while True:
+            line=f.readline()
+            if not line:
+                time.sleep(poll_interval)
                 continue
-            for j in tbl_col_dict[i]:
-                # print('\t',j)
-                print("\t\t",j,str(tbl_col_dict[i][j])+"|"+str(tmp_sum),"\t",tbl_col_dict[i][j]/tmp_sum)
-        print()
+            yield line
         
 import psqlparse
 import argparse
@@ -195,7 +268,19 @@ if __name__=='__main__':
     defaults = {
         "workload_file": "./input.json",
         "config_file": "./input.json",
-        "output_file": "./workload_features"
+        "output_file": "./workload_features",
+        "json_output": "",
+        "vector_output": "",
+        "decay": "",
+        "window": "",
+        "snapshot_every": "1000",
+        "sample": "",
+        "sample_size": "",
+        "target_error": "",
+        "time_budget": "",
+        "profile": "off",
+        "profile_dir": "./profile",
+        "profile_top": "25"
     }
     if config.has_section('workload analyzer'):
         defaults.update(config['workload analyzer'])
@@ -204,8 +289,60 @@ if __name__=='__main__':
     parser.add_argument('--workload_file', type=str, default=defaults['workload_file'])
     parser.add_argument('--config_file', type=str, default=defaults['config_file'])
     parser.add_argument('--output', type=str, default=defaults['output_file'])
+    parser.add_argument('--json_output', type=str, default=defaults['json_output'], help='write the statistics as JSON')
+    parser.add_argument('--vector_output', type=str, default=defaults['vector_output'], help='write the numeric feature vector (.npz)')
+    parser.add_argument('--incremental', action='store_true', help="read statements from a stream ('-' for stdin) and keep the statistics up to date")
+    parser.add_argument('--follow', action='store_true', help='tail the workload file for new statements (implies --incremental)')
+    parser.add_argument('--decay', type=float, default=float(defaults['decay']) if defaults['decay'] else None, help='per-statement exponential decay factor in (0,1]')
+    parser.add_argument('--window', type=int, default=int(defaults['window']) if defaults['window'] else None, help='sliding window size in statements')
+    parser.add_argument('--snapshot_every', type=int, default=int(defaults['snapshot_every']), help='rewrite the outputs every N statements')
+    parser.add_argument('--no_access_graph', action='store_true', help='skip the join graph and column co-access extraction')
+    parser.add_argument('--sample', type=str, default=defaults['sample'] or None, choices=['reservoir', 'stratified'], help='estimate the statistics from a sample of the workload')
+    parser.add_argument('--sample_size', type=int, default=int(defaults['sample_size']) if defaults['sample_size'] else None)
+    parser.add_argument('--target_error', type=float, default=float(defaults['target_error']) if defaults['target_error'] else None, help='half-width of the confidence interval of proportion statistics')
+    parser.add_argument('--time_budget', type=float, default=float(defaults['time_budget']) if defaults['time_budget'] else None, help='seconds allowed for analyzing the sample')
+    parser.add_argument('--profile', type=str, default=defaults['profile'] or 'off', choices=list(profiling.MODES), help='profile every stage (full: cProfile + tracemalloc, sample: stack sampling only)')
+    parser.add_argument('--profile_dir', type=str, default=defaults['profile_dir'] or './profile', help='where .pstats files and allocation/sample reports are written')
+    parser.add_argument('--profile_top', type=int, default=int(defaults['profile_top'] or 25), help='lines per allocation/sample report')
     args = parser.parse_args()
     print(args)
+    if profiling.configure(args.profile,args.profile_dir,top_n=args.profile_top):
+        atexit.register(profiling.close)
+    if args.sample and not (args.sample_size or args.target_error or args.time_budget):
+        parser.error('--sample requires --sample_size, --target_error or --time_budget')
+
+    if args.incremental or args.follow:
+        wp=WP2()
+        with profiling.scope('parse_schema'):
+            wp.parse_schema(args.config_file)
+        wp.start_incremental(args.workload_file,decay=args.decay,window=args.window,access_graph=not args.no_access_graph)
+
+        def write_snapshot(feats):
+            with profiling.scope('write_output'):
+                for path,text in [(args.output,feats.render_text()),(args.json_output,feats.to_json(indent=2) if args.json_output else None)]:
+                    if not path:
+                        continue
+                    with open(path+".tmp",'w',encoding='utf-8') as f:
+                        f.write(text)
+                    os.replace(path+".tmp",path)
+                if args.vector_output:
+                    feats.save_vector(args.vector_output)
+
+        if args.workload_file=='-':
+            lines=sys.stdin
+        elif args.follow:
+            lines=follow_file(args.workload_file)
+        else:
+            lines=open(args.workload_file,'r',encoding='utf-8')
+        try:
+            with profiling.scope('feed_stream'):
+                wp.feed_stream(lines,args.snapshot_every,write_snapshot)
+        except KeyboardInterrupt:
+            pass
+        write_snapshot(wp.snapshot())
+        if wp.inc_skipped:
+            print(f"Skipped {wp.inc_skipped} statements (unparseable, utility or on unknown tables)")
+        sys.exit(0)
 
     if args.output:
         sys.stdout = open(args.output, 'w')
@@ -213,10 +350,18 @@ if __name__=='__main__':
     files=[args.workload_file]
     
     wp=WP2()
-    wp.parse_schema(args.config_file)
+    with profiling.scope('parse_schema'):
+        wp.parse_schema(args.config_file)
     # print(wp.dbs.toStr())
     # print(wp.dbs.getTableByName('lineitem'))
     # print(type(wp.dbs.getTableByName('lineitem').col))
     for i in files:
         print(i)
-        wp.parse_workload(i)
\ No newline at end of file
+        feats=wp.parse_workload(i,access_graph=not args.no_access_graph,sample=args.sample,sample_size=args.sample_size,target_error=args.target_error,time_budget=args.time_budget)
+        if feats is None:
+            continue
+        with profiling.scope('write_output'):
+            if args.json_output:
+                feats.to_json(args.json_output, indent=2)
+            if args.vector_output:
+                feats.save_vector(args.vector_output)
\ No newline at end of file
@@ -0,0 +1,255 @@
+from typing import Dict, List, Any, Tuple, Optional
+
+import numpy as np
+
+
+def _walk(node):
+    """Depth-first over a psqlparse expression, without entering sub-selects."""
+    if isinstance(node, list):
+        for item in node:
+            yield from _walk(item)
+        return
+    if node is None or not hasattr(node, '__dict__'):
+        return
+    yield node
+    if type(node).__name__ in ('SelectStmt', 'SubLink'):
+        if type(node).__name__ == 'SubLink':
+            yield from _walk(node.testexpr)
+        return
+    for attr in vars(node).values():
+        if isinstance(attr, list) or hasattr(attr, '__dict__'):
+            yield from _walk(attr)
+
+
+class AccessGraph:
+    """Weighted join graph over tables and column co-access counts.
+
+    Both are built from the psqlparse AST of each statement:
+    - join edge (t1, t2): number of statements with an equi/theta predicate
+      between a column of t1 and a column of t2, with per column-pair counts
+    - co-access (c1, c2): number of statements where both columns appear in
+      predicates or join conditions; (c, c) is the column's own count
+    """
+
+    def __init__(self, dbs=None) -> None:
+        self.dbs = dbs
+        self.join_edges: Dict[Tuple[str, str], float] = {}
+        self.join_columns: Dict[Tuple[str, str], float] = {}
+        self.coaccess: Dict[Tuple[str, str], float] = {}
+
+    # -----------------------------
+    # AST traversal
+    # -----------------------------
+
+    def add_statement(self, stmt, weight=1) -> None:
+        joins = set()
+        cols = set()
+        self._add_query(stmt, {}, joins, cols)
+        for t1, t2 in {(a[0], b[0]) for a, b in joins}:
+            self.join_edges[(t1, t2)] = self.join_edges.get((t1, t2), 0) + weight
+        for a, b in joins:
+            key = (f"{a[0]}.{a[1]}", f"{b[0]}.{b[1]}")
+            self.join_columns[key] = self.join_columns.get(key, 0) + weight
+        names = sorted(f"{t}.{c}" for t, c in cols)
+        for i, a in enumerate(names):
+            for b in names[i:]:
+                self.coaccess[(a, b)] = self.coaccess.get((a, b), 0) + weight
+
+    def _add_range(self, item, scope, preds, joins, cols) -> None:
+        name = type(item).__name__
+        if name == 'RangeVar':
+            scope[item.relname] = item.relname
+            if item.alias is not None and item.alias.aliasname:
+                scope[item.alias.aliasname] = item.relname
+        elif name == 'JoinExpr':
+            self._add_range(item.larg, scope, preds, joins, cols)
+            self._add_range(item.rarg, scope, preds, joins, cols)
+            if item.quals is not None:
+                preds.append(item.quals)
+        elif name == 'RangeSubselect':
+            self._add_query(item.subquery, dict(scope), joins, cols)
+
+    def _add_query(self, stmt, outer_scope, joins, cols) -> None:
+        if stmt is None:
+            return
+        name = type(stmt).__name__
+        with_clause = getattr(stmt, 'with_clause', None)
+        if with_clause is not None:
+            for cte in with_clause.ctes or []:
+                self._add_query(cte.ctequery, dict(outer_scope), joins, cols)
+        if name == 'SelectStmt' and (stmt.larg is not None or stmt.rarg is not None):
+            self._add_query(stmt.larg, dict(outer_scope), joins, cols)
+            self._add_query(stmt.rarg, dict(outer_scope), joins, cols)
+            return
+
+        scope = dict(outer_scope)
+        preds = []
+        relation = getattr(stmt, 'relation', None)
+        if relation is not None:
+            self._add_range(relation, scope, preds, joins, cols)
+        for attr in ('from_clause', 'using_clause'):
+            for item in getattr(stmt, attr, None) or []:
+                self._add_range(item, scope, preds, joins, cols)
+        for attr in ('where_clause', 'having_clause'):
+            if getattr(stmt, attr, None) is not None:
+                preds.append(getattr(stmt, attr))
+
+        for node in _walk(preds):
+            kind = type(node).__name__
+            if kind == 'ColumnRef':
+                ref = self._resolve(node, scope)
+                if ref is not None:
+                    cols.add(ref)
+            elif kind == 'AExpr':
+                left = self._resolve(node.lexpr, scope)
+                right = self._resolve(node.rexpr, scope)
+                if left is not None and right is not None and left[0] != right[0]:
+                    joins.add(tuple(sorted((left, right))))
+            elif kind == 'SubLink':
+                self._add_query(node.subselect, scope, joins, cols)
+
+    def _resolve(self, ref, scope) -> Optional[Tuple[str, str]]:
+        if type(ref).__name__ != 'ColumnRef' or not ref.fields:
+            return None
+        fields = [getattr(f, 'str', None) for f in ref.fields]
+        col = fields[-1]
+        if col is None:
+            return None
+        if len(fields) >= 2:
+            table = scope.get(fields[-2])
+            return (table, col) if table else None
+        tables = set(scope.values())
+        if self.dbs is not None:
+            owners = {t for t in tables if self.dbs.getTableByName(t) is not None and self.dbs.getTableByName(t).hasCol(col)}
+        else:
+            owners = tables
+        return (owners.pop(), col) if len(owners) == 1 else None
+
+    # -----------------------------
+    # Arithmetic (incremental mode)
+    # -----------------------------
+
+    def add(self, other: "AccessGraph", weight=1) -> "AccessGraph":
+        for dst, src in ((self.join_edges, other.join_edges), (self.join_columns, other.join_columns),
+                         (self.coaccess, other.coaccess)):
+            for k, v in src.items():
+                total = dst.get(k, 0) + weight * v
+                # Subtracting an evicted statement (window mode) must not leave dead pairs behind
+                if total <= 1e-9:
+                    dst.pop(k, None)
+                else:
+                    dst[k] = total
+        return self
+
+    def scale(self, factor) -> "AccessGraph":
+        for d in (self.join_edges, self.join_columns, self.coaccess):
+            for k in d:
+                d[k] *= factor
+        return self
+
+    # -----------------------------
+    # Export
+    # -----------------------------
+
+    def column_names(self) -> List[str]:
+        names = []
+        if self.dbs is not None:
+            names = [f"{t.name}.{c.name}" for t in self.dbs.tables for c in t.col]
+        known = set(names)
+        extra = sorted({c for pair in self.coaccess for c in pair} - known)
+        return names + extra
+
+    def coaccess_csr(self) -> Dict[str, np.ndarray]:
+        """Symmetric co-access matrix in CSR form (data, indices, indptr, shape)."""
+        columns = self.column_names()
+        index = {c: i for i, c in enumerate(columns)}
+        rows, cols, data = [], [], []
+        for (a, b), v in self.coaccess.items():
+            i, j = index[a], index[b]
+            rows.append(i)
+            cols.append(j)
+            data.append(v)
+            if i != j:
+                rows.append(j)
+                cols.append(i)
+                data.append(v)
+        rows = np.array(rows, dtype=np.int64)
+        cols = np.array(cols, dtype=np.int64)
+        data = np.array(data, dtype=np.float64)
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(columns)), out=indptr[1:])
+        return {
+            'columns': np.array(columns),
+            'data': data[order],
+            'indices': cols[order],
+            'indptr': indptr,
+            'shape': np.array([len(columns), len(columns)]),
+        }
+
+    def to_scipy(self):
+        """The co-access matrix as scipy.sparse.csr_matrix (scipy is optional)."""
+        from scipy.sparse import csr_matrix
+        m = self.coaccess_csr()
+        return csr_matrix((m['data'], m['indices'], m['indptr']), shape=tuple(m['shape']))
+
+    def join_graph(self) -> Dict[str, Any]:
+        edges = []
+        for (t1, t2), w in sorted(self.join_edges.items(), key=lambda kv: -kv[1]):
+            pairs = [[a, b, v] for (a, b), v in self.join_columns.items()
+                     if a.split('.', 1)[0] == t1 and b.split('.', 1)[0] == t2]
+            edges.append({'tables': [t1, t2], 'weight': w, 'columns': pairs})
+        return {'edges': edges}
+
+    def to_dict(self) -> Dict[str, Any]:
+        m = self.coaccess_csr()
+        return {
+            'join_graph': self.join_graph(),
+            'coaccess': {k: m[k].tolist() for k in ('columns', 'data', 'indices', 'indptr', 'shape')},
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any], dbs=None) -> "AccessGraph":
+        g = cls(dbs)
+        for e in d.get('join_graph', {}).get('edges', []):
+            g.join_edges[tuple(e['tables'])] = e['weight']
+            for a, b, v in e.get('columns', []):
+                g.join_columns[(a, b)] = v
+        m = d.get('coaccess', {})
+        columns = m.get('columns', [])
+        indptr = m.get('indptr', [0])
+        for i in range(len(indptr) - 1):
+            for p in range(indptr[i], indptr[i + 1]):
+                j = m['indices'][p]
+                if i <= j:
+                    g.coaccess[tuple(sorted((columns[i], columns[j])))] = m['data'][p]
+        return g
+
+    def to_vector(self) -> Dict[str, np.ndarray]:
+        m = self.coaccess_csr()
+        tables = sorted({t for e in self.join_edges for t in e})
+        index = {t: i for i, t in enumerate(tables)}
+        edges = sorted(self.join_edges.items())
+        return {
+            'join_tables': np.array(tables),
+            'join_edges': np.array([[index[a], index[b]] for (a, b), _ in edges], dtype=np.int64).reshape(-1, 2),
+            'join_weights': np.array([w for _, w in edges], dtype=np.float64),
+            'coaccess_columns': m['columns'],
+            'coaccess_data': m['data'],
+            'coaccess_indices': m['indices'],
+            'coaccess_indptr': m['indptr'],
+        }
+
+    def render_text(self, top: int = 20) -> List[str]:
+        out = []
+        if self.join_edges:
+            out.append("join graph :")
+            for e in self.join_graph()['edges'][:top]:
+                cols = ", ".join(f"{a}={b}" for a, b, _ in e['columns'])
+                out.append(" ".join(["\t", e['tables'][0], "-", e['tables'][1], str(e['weight']), "\t", cols]))
+        pairs = [(k, v) for k, v in self.coaccess.items() if k[0] != k[1]]
+        if pairs:
+            out.append("column co-access :")
+            for (a, b), v in sorted(pairs, key=lambda kv: -kv[1])[:top]:
+                out.append(" ".join(["\t", a, b, str(v)]))
+        return out
@@ -0,0 +1,169 @@
+"""Benchmark of the workload compression stage.
+
+Times WP2.parse_schema, WP2.parse_workload and feature emission (text
+report, JSON, feature vector) on generated workloads of increasing size,
+and appends one JSON line per (size, stage) to the results file:
+
+    {"commit": ..., "shape": ..., "size": ..., "stage": ..., "seconds": ...,
+     "throughput": ..., "peak_mb": ..., "rss_mb": ...}
+
+Each size runs in a fresh interpreter so rss_mb (ru_maxrss) is not
+inflated by earlier sizes. Use --compare to diff against an earlier file.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from typing import Dict, List, Any
+
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+STAGES = ['parse_schema', 'parse_workload', 'emit_text', 'emit_json', 'emit_vector']
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=_HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _timed(stage: str, size: int, func, trace: bool) -> Dict[str, Any]:
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024) if trace else None
+    if trace:
+        tracemalloc.stop()
+    return {
+        'stage': stage,
+        'size': size,
+        'seconds': round(seconds, 6),
+        'throughput': round(size / seconds, 2) if seconds > 0 and stage != 'parse_schema' else None,
+        'peak_mb': round(peak, 3) if peak is not None else None,
+        'rss_mb': round(_rss_mb(), 3),
+    }, result
+
+
+def run_size(schema_path: str, size: int, shape: str, skew: float, seed: int, trace: bool,
+             sample: str = None, sample_size: int = None) -> List[Dict[str, Any]]:
+    """Benchmark every stage on one generated workload (runs in-process)."""
+    sys.path.insert(0, _HERE)
+    from WorkloadParser import WP2
+    from workload_generator import write_workload
+
+    records = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workload = os.path.join(tmp, 'workload.wg')
+        start = time.perf_counter()
+        write_workload(workload, schema_path, size, shape=shape, skew=skew, seed=seed)
+        gen_seconds = time.perf_counter() - start
+
+        wp = WP2()
+        rec, _ = _timed('parse_schema', size, lambda: wp.parse_schema(schema_path), trace)
+        records.append(rec)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            rec, feats = _timed('parse_workload', size, lambda: wp.parse_workload(
+                workload, verbose=False, sample=sample, sample_size=sample_size, seed=seed), trace)
+        records.append(rec)
+        rec, _ = _timed('emit_text', size, feats.render_text, trace)
+        records.append(rec)
+        rec, _ = _timed('emit_json', size, lambda: feats.to_json(os.path.join(tmp, 'features.json')), trace)
+        records.append(rec)
+        rec, _ = _timed('emit_vector', size, lambda: feats.save_vector(os.path.join(tmp, 'features.npz')), trace)
+        records.append(rec)
+    for rec in records:
+        rec['generate_seconds'] = round(gen_seconds, 6)
+    return records
+
+
+def load_results(path: str) -> Dict[tuple, Dict[str, Any]]:
+    """Latest record per (shape, size, stage, sample) of a results file."""
+    out = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                rec = json.loads(line)
+                out[(rec['shape'], rec['size'], rec['stage'], rec.get('sample'))] = rec
+    return out
+
+
+def compare(base_path: str, new_path: str, threshold: float = 0.1) -> int:
+    """Print seconds of both runs per stage; returns the number of regressions above threshold."""
+    base, new = load_results(base_path), load_results(new_path)
+    regressions = 0
+    print(f"{'shape':<9}{'size':>10}  {'stage':<15}{'base s':>12}{'new s':>12}{'change':>9}")
+    for key in sorted(set(base) & set(new)):
+        b, n = base[key]['seconds'], new[key]['seconds']
+        change = (n - b) / b if b > 0 else 0.0
+        flag = '  REGRESSION' if change > threshold else ''
+        regressions += bool(flag)
+        print(f"{key[0]:<9}{key[1]:>10}  {key[2]:<15}{b:>12.4f}{n:>12.4f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the workload compression stage')
+    parser.add_argument('--config_file', type=str, default=os.path.join(_HERE, 'workloads', 'res.json'))
+    parser.add_argument('--sizes', type=str, default='1000,10000,100000',
+                        help='comma separated statement counts, e.g. 1e3,1e4,1e5,1e6,1e7')
+    parser.add_argument('--shape', type=str, default='sysbench')
+    parser.add_argument('--skew', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tracemalloc', action='store_true', help='record Python peak allocation per stage (slower)')
+    parser.add_argument('--sample', type=str, default=None, choices=['reservoir', 'stratified'])
+    parser.add_argument('--sample_size', type=int, default=None)
+    parser.add_argument('--output', type=str, default=os.path.join(_HERE, '..', 'history', 'bench_results.jsonl'))
+    parser.add_argument('--compare', type=str, nargs=2, metavar=('BASE', 'NEW'), help='compare two result files')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported as regression')
+    parser.add_argument('--worker', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.threshold) else 0)
+
+    if args.worker is not None:
+        records = run_size(args.config_file, args.worker, args.shape, args.skew, args.seed, args.tracemalloc,
+                           args.sample, args.sample_size)
+        print(json.dumps(records))
+        sys.exit(0)
+
+    commit = _git_commit()
+    sizes = [int(float(s)) for s in args.sizes.split(',') if s.strip()]
+    with open(args.output, 'a', encoding='utf-8') as out:
+        for size in sizes:
+            cmd = [sys.executable, os.path.abspath(__file__), '--worker', str(size), '--config_file', args.config_file,
+                   '--shape', args.shape, '--skew', str(args.skew), '--seed', str(args.seed)]
+            if args.tracemalloc:
+                cmd.append('--tracemalloc')
+            if args.sample:
+                cmd += ['--sample', args.sample, '--sample_size', str(args.sample_size)]
+            proc = subprocess.run(cmd, capture_output=True, text=True, cwd=_HERE)
+            if proc.returncode != 0:
+                print(proc.stderr, file=sys.stderr)
+                sys.exit(proc.returncode)
+            for rec in json.loads(proc.stdout.strip().splitlines()[-1]):
+                rec.update({'commit': commit, 'shape': args.shape, 'skew': args.skew, 'seed': args.seed,
+                            'sample': args.sample, 'tracemalloc': args.tracemalloc,
+                            'python': platform.python_version()})
+                out.write(json.dumps(rec, sort_keys=True) + "\n")
+                print(f"{size:>10}  {rec['stage']:<15}{rec['seconds']:>10.4f}s  "
+                      f"{rec['throughput'] or 0:>12.1f} stmt/s  rss {rec['rss_mb']:.1f} MB")
+            out.flush()
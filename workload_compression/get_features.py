@@ -1,6 +1,14 @@
+import atexit
 import psycopg2
 import json
-from typing import Dict, Any, List, Tuple
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
+from psycopg2.pool import ThreadedConnectionPool
+from typing import Callable, Dict, Any, List, Tuple, Iterable, Optional
+
+import profiling
 
 
 # -----------------------------
@@ -38,7 +46,10 @@ def _fetch_db_exec_stats(cur) -> Dict[str, Any]:
     }
 
 
-def _fetch_tables(cur) -> List[Tuple]:
+# Per-relation queries take an optional list of table oids to restrict to;
+# the oid is returned as the last column.
+
+def _fetch_tables(cur, oids: Optional[List[int]] = None) -> List[Tuple]:
     cur.execute(
         """
         SELECT
@@ -46,68 +57,113 @@ def _fetch_tables(cur) -> List[Tuple]:
             c.reltuples::BIGINT AS est_rows,
             c.relpages AS pages,
             pg_total_relation_size(c.oid) AS total_bytes,
-            n.nspname AS schema_name
+            n.nspname AS schema_name,
+            c.oid
         FROM pg_class c
         JOIN pg_namespace n ON n.oid = c.relnamespace
-        WHERE c.relkind = 'r';
-        """
+        WHERE c.relkind = 'r'
+          AND (%(oids)s::oid[] IS NULL OR c.oid = ANY(%(oids)s::oid[]));
+        """,
+        {'oids': oids},
     )
     return cur.fetchall()
 
 
-def _fetch_columns_stats(cur) -> List[Tuple]:
+def _fetch_index_table_features(cur, oids: Optional[List[int]] = None) -> List[Tuple]:
+    # One row per table; column stats, index names and index usage are
+    # aggregated server-side so pg_stats arrays never leave the server
     cur.execute(
         """
         SELECT
-            tablename,
-            attname,
-            null_frac,
-            n_distinct,
-            avg_width,
-            most_common_vals,
-            histogram_bounds
-        FROM pg_stats
-        WHERE schemaname NOT IN ('pg_catalog', 'information_schema');
-        """
+            c.relname AS table_name,
+            c.reltuples::BIGINT AS est_rows,
+            COALESCE(cols.columns, '{}'::json) AS columns,
+            COALESCE(idx.indexes, '[]'::json) AS indexes,
+            COALESCE(u.index_usage, '[]'::json) AS index_usage,
+            c.oid
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN (
+            SELECT
+                schemaname,
+                tablename,
+                json_object_agg(
+                    attname,
+                    json_build_object('n_distinct', n_distinct, 'null_frac', null_frac, 'avg_width', avg_width)
+                ) AS columns
+            FROM pg_stats
+            WHERE schemaname NOT IN ('pg_catalog', 'information_schema')
+            GROUP BY schemaname, tablename
+        ) cols ON cols.schemaname = n.nspname AND cols.tablename = c.relname
+        LEFT JOIN (
+            SELECT ix.indrelid, json_agg(i.relname ORDER BY i.relname) AS indexes
+            FROM pg_index ix
+            JOIN pg_class i ON i.oid = ix.indexrelid
+            GROUP BY ix.indrelid
+        ) idx ON idx.indrelid = c.oid
+        LEFT JOIN (
+            SELECT
+                relid,
+                json_agg(
+                    json_build_object('index', indexrelname, 'idx_scan', idx_scan,
+                                      'idx_tup_read', idx_tup_read, 'idx_tup_fetch', idx_tup_fetch)
+                    ORDER BY indexrelname
+                ) AS index_usage
+            FROM pg_stat_user_indexes
+            GROUP BY relid
+        ) u ON u.relid = c.oid
+        WHERE c.relkind = 'r'
+          AND (%(oids)s::oid[] IS NULL OR c.oid = ANY(%(oids)s::oid[]));
+        """,
+        {'oids': oids},
     )
     return cur.fetchall()
 
 
-def _fetch_indexes(cur) -> List[Tuple]:
+def _fetch_index_usage(cur) -> Dict[int, Any]:
     cur.execute(
         """
         SELECT
-            t.relname AS table_name,
-            i.relname AS index_name,
-            a.attname AS column_name,
-            ix.indisunique,
-            ix.indisprimary
-        FROM pg_class t
-        JOIN pg_index ix ON t.oid = ix.indrelid
-        JOIN pg_class i ON i.oid = ix.indexrelid
-        JOIN pg_attribute a ON a.attrelid = t.oid
-                          AND a.attnum = ANY(ix.indkey)
-        WHERE t.relkind = 'r';
+            relid,
+            json_agg(
+                json_build_object('index', indexrelname, 'idx_scan', idx_scan,
+                                  'idx_tup_read', idx_tup_read, 'idx_tup_fetch', idx_tup_fetch)
+                ORDER BY indexrelname
+            )
+        FROM pg_stat_user_indexes
+        GROUP BY relid;
         """
     )
-    return cur.fetchall()
+    return dict(cur.fetchall())
 
 
-def _fetch_index_usage(cur) -> List[Tuple]:
-    # Optional: index usage stats (standard view)
+def _fetch_relation_versions(cur) -> Dict[int, str]:
+    # Hash of everything the per-relation features depend on: storage and
+    # planner estimates from pg_class, the last (auto)analyze (pg_stats) and
+    # the table's pg_index rows. Key 0 hashes pg_matviews.
     cur.execute(
         """
         SELECT
-            c.relname AS table_name,
-            s.indexrelname AS index_name,
-            s.idx_scan,
-            s.idx_tup_read,
-            s.idx_tup_fetch
-        FROM pg_stat_user_indexes s
-        JOIN pg_class c ON s.relid = c.oid;
+            c.oid,
+            md5(concat_ws('|', c.relname, c.relfilenode, c.reltuples, c.relpages,
+                          pg_stat_get_last_analyze_time(c.oid), pg_stat_get_last_autoanalyze_time(c.oid),
+                          (SELECT string_agg(concat_ws(':', ic.relname, ix.indexrelid, ix.indkey::text,
+                                                       ix.indisvalid, ic.relfilenode), ',' ORDER BY ix.indexrelid)
+                           FROM pg_index ix
+                           JOIN pg_class ic ON ic.oid = ix.indexrelid
+                           WHERE ix.indrelid = c.oid)))
+        FROM pg_class c
+        WHERE c.relkind = 'r'
+        UNION ALL
+        SELECT
+            0,
+            md5(COALESCE(string_agg(concat_ws('|', schemaname, matviewname, definition, ispopulated), ','
+                                    ORDER BY schemaname, matviewname), ''))
+        FROM pg_matviews
+        ORDER BY 1;
         """
     )
-    return cur.fetchall()
+    return dict(cur.fetchall())
 
 
 def _fetch_top_queries(cur, limit: int = 100) -> List[Tuple]:
@@ -123,117 +179,344 @@ def _fetch_top_queries(cur, limit: int = 100) -> List[Tuple]:
     return cur.fetchall()
 
 
-def extract_features_indexes_recommendation(conn_str: str) -> Dict[str, Any]:
-    conn = psycopg2.connect(conn_str)
+# -----------------------------
+# Shared catalog snapshot
+# -----------------------------
+
+_CATALOG_QUERIES = {
+    'db_exec_stats': _fetch_db_exec_stats,
+    'tables': _fetch_tables,
+    'index_table_features': _fetch_index_table_features,
+    # Clustered down to at most 100 entries by the payload builders
+    'top_queries': lambda cur: _fetch_top_queries(cur, limit=1000),
+    'index_usage': _fetch_index_usage,
+    'relation_versions': _fetch_relation_versions,
+}
+
+
+def _run_catalog_queries(conn, names: Iterable[str], snapshot_id: Optional[str] = None, then=None) -> Dict[str, Any]:
+    conn.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
     cur = conn.cursor()
     try:
-        tables = _fetch_tables(cur)
-        cols = _fetch_columns_stats(cur)
-        indexes = _fetch_indexes(cur)
-        usage = _fetch_index_usage(cur)
-
-        # Build per-table summary focused on schema + index signals
-        table_features = []
-        for t in tables:
-            table_name = t[0]
-            est_rows = t[1]
-            table_cols = [c for c in cols if c[0] == table_name]
-            columns = {c[1]: {'n_distinct': c[3], 'null_frac': c[2], 'avg_width': c[4]} for c in table_cols}
-            table_indexes = {idx[1] for idx in indexes if idx[0] == table_name}
-            index_usage = [
-                {
-                    'index': u[1],
-                    'idx_scan': u[2],
-                    'idx_tup_read': u[3],
-                    'idx_tup_fetch': u[4],
-                }
-                for u in usage if u[0] == table_name
-            ]
-            table_features.append({
-                'table': table_name,
-                'est_rows': est_rows,
-                'columns': columns,
-                'indexes': sorted(list(table_indexes)),
-                'index_usage': index_usage,
-            })
-
-        return {
-            'task': 'indexes_recommendation',
-            'tables': table_features,
-        }
+        if snapshot_id:
+            cur.execute("SET TRANSACTION SNAPSHOT %s;", (snapshot_id,))
+        results = {name: _CATALOG_QUERIES[name](cur) for name in names}
+        if then is not None:
+            then(cur, results)
+        return results
     finally:
         cur.close()
-        conn.close()
+        conn.rollback()
+
+
+# One connection pool per database, reused by every refresh of the session
+_POOLS: Dict[str, ThreadedConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _get_pool(conn_str: str, size: int) -> ThreadedConnectionPool:
+    with _POOLS_LOCK:
+        pool = _POOLS.get(conn_str)
+        if pool is not None and pool.maxconn < size:
+            # A refresh with more workers than before; grow by replacing the pool
+            pool.closeall()
+            pool = None
+        if pool is None:
+            # minconn = maxconn: psycopg2 closes returned connections beyond minconn
+            pool = _POOLS[conn_str] = ThreadedConnectionPool(size, size, conn_str)
+        return pool
+
+
+def _getconn(pool: ThreadedConnectionPool):
+    """A pooled connection that is still alive; a server restart (knob changes) kills idle ones."""
+    for _ in range(pool.maxconn + 1):
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.close()
+            conn.rollback()
+            return conn
+        except psycopg2.Error:
+            pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("No usable connection in the catalog connection pool")
+
+
+def close_pools() -> None:
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.closeall()
+        _POOLS.clear()
+
+
+atexit.register(close_pools)
+
+
+def fetch_catalog_snapshot(conn_str: str, names: Iterable[str], workers: int = 4,
+                           then: Optional[Callable[[Any, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Run each named catalog query once, all in the same REPEATABLE READ snapshot.
+
+    With workers > 1 the queries run concurrently on pooled connections that
+    import the snapshot exported by a leader transaction (pg_export_snapshot).
+    Connections come from a per-database pool kept across calls.
+    then(cursor, results), if given, runs after the queries in the same
+    snapshot, for reads that depend on their results.
+    """
+    names = list(dict.fromkeys(names))
+    unknown = [n for n in names if n not in _CATALOG_QUERIES]
+    if unknown:
+        raise ValueError(f"Unknown catalog queries {unknown}. Supported: {sorted(_CATALOG_QUERIES.keys())}")
+    workers = min(workers, len(names))
+    pool = _get_pool(conn_str, max(workers, 1) + 1)
+    if workers <= 1:
+        conn = _getconn(pool)
+        try:
+            return _run_catalog_queries(conn, names, then=then)
+        finally:
+            pool.putconn(conn)
+
+    leader = _getconn(pool)
+    try:
+        leader.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+        cur = leader.cursor()
+        cur.execute("SELECT pg_export_snapshot();")
+        snapshot_id = cur.fetchone()[0]
+
+        def run(name):
+            conn = _getconn(pool)
+            try:
+                return _run_catalog_queries(conn, [name], snapshot_id)[name]
+            finally:
+                pool.putconn(conn)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(zip(names, executor.map(run, names)))
+        if then is not None:
+            # The leader's transaction still holds the exported snapshot
+            then(cur, results)
+        cur.close()
+        return results
+    finally:
+        leader.rollback()
+        pool.putconn(leader)
 
 
-def extract_features_materialised_views_recommendation(conn_str: str) -> Dict[str, Any]:
-    conn = psycopg2.connect(conn_str)
-    cur = conn.cursor()
-    try:
-        tables = _fetch_tables(cur)
-        queries = _fetch_top_queries(cur, limit=100)
-
-        tables_overview = [
-            {
-                'table': t[0],
-                'est_rows': t[1],
-                'pages': t[2],
-                'total_bytes': t[3],
-                'schema': t[4],
+# -----------------------------
+# Top-query clustering
+# -----------------------------
+
+_SQL_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\$\d+|\b\d+(?:\.\d+)?\b")
+_FROM_CLAUSE = re.compile(r"\b(?:from|update|into)\s+([^();]+?)(?=\bwhere\b|\bgroup\s+by\b|\border\s+by\b|\bhaving\b|"
+                          r"\blimit\b|\bunion\b|\bset\b|\bvalues\b|\breturning\b|\bon\s+conflict\b|[();]|$)")
+_TABLE_REF = re.compile(r"^\s*(?:only\s+)?([a-z_][\w$]*(?:\.[a-z_][\w$]*)?)(?:\s+(?:as\s+)?(?!on\b|using\b)([a-z_][\w$]*))?")
+_JOIN_SPLIT = re.compile(r",|\b(?:natural\s+)?(?:(?:left|right|full|inner|cross)\s+)?(?:outer\s+)?join\b")
+_JOIN_PRED = re.compile(r"\b([a-z_][\w$]*)\.([a-z_][\w$]*)\s*=\s*([a-z_][\w$]*)\.([a-z_][\w$]*)")
+_GROUP_BY = re.compile(r"\bgroup\s+by\s+(.+?)(?=\bhaving\b|\border\s+by\b|\blimit\b|\bunion\b|[);]|$)")
+
+# Additive pg_stat_statements fields summed per cluster
+_ADDITIVE = ('calls', 'rows', 'total_exec_time_ms', 'shared_blks_read', 'shared_blks_hit', 'temp_blks_written')
+
+
+def query_skeleton(query: str) -> Tuple[str, Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]:
+    """Structural skeleton of a statement: (kind, tables, join predicates, grouping keys).
+
+    Filters, projections and literal values are ignored, so statements
+    that touch the same tables the same way fall into one cluster.
+    """
+    sql = _SQL_LITERAL.sub('?', _SQL_COMMENT.sub(' ', query)).lower()
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    kind = sql.split(' ', 1)[0] if sql else ''
+    aliases: Dict[str, str] = {}
+    for clause in _FROM_CLAUSE.findall(sql):
+        for ref in _JOIN_SPLIT.split(clause):
+            ref = re.split(r"\b(?:on|using)\b", ref, 1)[0]
+            m = _TABLE_REF.match(ref)
+            if m and m.group(1) not in ('select', 'lateral'):
+                table = m.group(1).split('.')[-1]
+                aliases[table] = table
+                if m.group(2):
+                    aliases[m.group(2)] = table
+    joins = set()
+    for a, ca, b, cb in _JOIN_PRED.findall(sql):
+        ta, tb = aliases.get(a, a), aliases.get(b, b)
+        if ta != tb:
+            joins.add('='.join(sorted((f"{ta}.{ca}", f"{tb}.{cb}"))))
+    group_by = []
+    for clause in _GROUP_BY.findall(sql):
+        for key in clause.split(','):
+            key = key.strip()
+            if '.' in key:
+                alias, col = key.split('.', 1)
+                key = f"{aliases.get(alias, alias)}.{col}"
+            group_by.append(key)
+    return kind, tuple(sorted(set(aliases.values()))), tuple(sorted(joins)), tuple(group_by)
+
+
+def cluster_queries(queries: List[Dict[str, Any]], limit: int = 100) -> List[Dict[str, Any]]:
+    """Group statements by query_skeleton and keep one representative per cluster.
+
+    The representative is the most expensive member; additive counters are
+    summed over the cluster and 'statements' is the number of members.
+    Clusters are returned by total_exec_time_ms, at most `limit`.
+    """
+    clusters: Dict[Tuple, Dict[str, Any]] = {}
+    for q in queries:
+        kind, tables, joins, group_by = query_skeleton(q['query'])
+        c = clusters.get((kind, tables, joins, group_by))
+        if c is None:
+            c = clusters[(kind, tables, joins, group_by)] = {
+                'query': q['query'], 'statements': 0, 'tables': list(tables), 'joins': list(joins),
+                'group_by': list(group_by), '_top': -1.0,
             }
-            for t in tables
-        ]
-
-        top_queries = [
-            {'query': q[0], 'calls': q[1], 'rows': q[2], 'total_exec_time_ms': q[3]}
-            for q in queries
-        ]
-
-        return {
-            'task': 'materialised_views_recommendation',
-            'tables_overview': tables_overview,
-            'top_queries': top_queries,
+            c.update({k: 0 for k in _ADDITIVE if k in q})
+        c['statements'] += 1
+        for k in _ADDITIVE:
+            if k in q:
+                c[k] = c.get(k, 0) + (q[k] or 0)
+        if (q.get('total_exec_time_ms') or 0) > c['_top']:
+            c['_top'] = q.get('total_exec_time_ms') or 0
+            c['query'] = q['query']
+    out = sorted(clusters.values(), key=lambda c: -(c.get('total_exec_time_ms') or 0))[:limit]
+    for c in out:
+        del c['_top']
+        if c.get('calls'):
+            c['mean_exec_time_ms'] = c.get('total_exec_time_ms', 0) / c['calls']
+    return out
+
+
+def shared_joins(clusters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Join predicates that occur in more than one cluster (candidate matview subexpressions)."""
+    shared: Dict[str, Dict[str, Any]] = {}
+    for c in clusters:
+        for j in c['joins']:
+            e = shared.setdefault(j, {'join': j, 'clusters': 0, 'calls': 0, 'total_exec_time_ms': 0})
+            e['clusters'] += 1
+            e['calls'] += c.get('calls', 0)
+            e['total_exec_time_ms'] += c.get('total_exec_time_ms', 0)
+    return sorted((e for e in shared.values() if e['clusters'] > 1), key=lambda e: -e['total_exec_time_ms'])
+
+
+# -----------------------------
+# Task payloads
+# -----------------------------
+
+def _build_indexes_recommendation(r: Dict[str, Any]) -> Dict[str, Any]:
+    # Rows are already grouped per table by _fetch_index_table_features
+    table_features = [
+        {
+            'table': row[0],
+            'est_rows': row[1],
+            'columns': row[2],
+            'indexes': row[3],
+            'index_usage': row[4],
         }
-    finally:
-        cur.close()
-        conn.close()
+        for row in r['index_table_features']
+    ]
 
+    return {
+        'task': 'indexes_recommendation',
+        'tables': table_features,
+    }
 
-def extract_features_knob_tuning(conn_str: str) -> Dict[str, Any]:
-    conn = psycopg2.connect(conn_str)
-    cur = conn.cursor()
-    try:
-        exec_stats = _fetch_db_exec_stats(cur)
-        return {
-            'task': 'knob_tuning',
-            'execution': exec_stats,
+
+def _build_materialised_views_recommendation(r: Dict[str, Any]) -> Dict[str, Any]:
+    tables_overview = [
+        {
+            'table': t[0],
+            'est_rows': t[1],
+            'pages': t[2],
+            'total_bytes': t[3],
+            'schema': t[4],
         }
-    finally:
-        cur.close()
-        conn.close()
+        for t in r['tables']
+    ]
 
+    top_queries = cluster_queries([
+        {'query': q[0], 'calls': q[1], 'rows': q[2], 'total_exec_time_ms': q[3]}
+        for q in r['top_queries']
+    ])
 
-def extract_features_optimization_plan_review(conn_str: str) -> Dict[str, Any]:
-    conn = psycopg2.connect(conn_str)
-    cur = conn.cursor()
-    try:
-        queries = _fetch_top_queries(cur, limit=100)
-        top_queries = [
-            {
-                'query': q[0],
-                'calls': q[1],
-                'rows': q[2],
-                'total_exec_time_ms': q[3],
-            }
-            for q in queries
-        ]
-        return {
-            'task': 'optimization_plan_review',
-            'top_queries': top_queries,
+    return {
+        'task': 'materialised_views_recommendation',
+        'tables_overview': tables_overview,
+        'top_queries': top_queries,
+        'shared_joins': shared_joins(top_queries),
+    }
+
+
+def _build_knob_tuning(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'task': 'knob_tuning',
+        'execution': r['db_exec_stats'],
+    }
+
+
+def _build_optimization_plan_review(r: Dict[str, Any]) -> Dict[str, Any]:
+    top_queries = cluster_queries([
+        {
+            'query': q[0],
+            'calls': q[1],
+            'rows': q[2],
+            'total_exec_time_ms': q[3],
         }
-    finally:
-        cur.close()
-        conn.close()
+        for q in r['top_queries']
+    ])
+    return {
+        'task': 'optimization_plan_review',
+        'top_queries': top_queries,
+    }
+
+
+def _attach_round_delta(task: str, payload: Dict[str, Any], delta: Dict[str, Any]) -> None:
+    """Add the counters of the last benchmark round (see stat_snapshots.compute_delta).
+
+    delta['run_metrics'] (metrics_sampler summary) goes to the knob and
+    review payloads.
+    """
+    if task == 'knob_tuning' and 'database' in delta:
+        payload['execution_last_round'] = {'elapsed_s': delta['elapsed_s'], **delta['database']}
+    elif task == 'indexes_recommendation' and 'index_usage' in delta:
+        per_table: Dict[str, List[Dict[str, Any]]] = {}
+        for idx in delta['index_usage']:
+            per_table.setdefault(idx['table'], []).append(
+                {k: v for k, v in idx.items() if k != 'table'})
+        for entry in payload['tables']:
+            entry['index_usage_last_round'] = per_table.get(entry['table'], [])
+    elif task in ('materialised_views_recommendation', 'optimization_plan_review') and 'top_queries' in delta:
+        payload['top_queries_last_round'] = cluster_queries(delta['top_queries'])
+    if task in ('knob_tuning', 'optimization_plan_review') and delta.get('run_metrics'):
+        payload['metrics_during_last_round'] = delta['run_metrics']
+
+
+# task -> (catalog queries it needs, payload builder)
+_TASK_BUILD = {
+    'indexes_recommendation': (('index_table_features',), _build_indexes_recommendation),
+    'materialised_views_recommendation': (('tables', 'top_queries'), _build_materialised_views_recommendation),
+    'knob_tuning': (('db_exec_stats',), _build_knob_tuning),
+    'optimization_plan_review': (('top_queries',), _build_optimization_plan_review),
+}
+
+
+def _extract_single(conn_str: str, task: str) -> Dict[str, Any]:
+    names, build = _TASK_BUILD[task]
+    return build(fetch_catalog_snapshot(conn_str, names, workers=1))
+
+
+def extract_features_indexes_recommendation(conn_str: str) -> Dict[str, Any]:
+    return _extract_single(conn_str, 'indexes_recommendation')
+
+
+def extract_features_materialised_views_recommendation(conn_str: str) -> Dict[str, Any]:
+    return _extract_single(conn_str, 'materialised_views_recommendation')
+
+
+def extract_features_knob_tuning(conn_str: str) -> Dict[str, Any]:
+    return _extract_single(conn_str, 'knob_tuning')
+
+
+def extract_features_optimization_plan_review(conn_str: str) -> Dict[str, Any]:
+    return _extract_single(conn_str, 'optimization_plan_review')
 
 
 # -----------------------------
@@ -260,6 +543,112 @@ def extract_features(conn_str: str, task: str) -> Dict[str, Any]:
     return func(conn_str)
 
 
+def _canonical_tasks(tasks: Optional[List[str]]) -> List[str]:
+    canonical = []
+    for task in tasks or list(_TASK_BUILD.keys()):
+        key = task.strip().lower().replace(' ', '_')
+        if key not in _TASK_BUILD:
+            raise ValueError(f"Unknown task '{task}'. Supported: {sorted(_TASK_IMPL.keys())}")
+        canonical.append(key)
+    return canonical
+
+
+def _build_payloads(canonical: List[str], results: Dict[str, Any],
+                    round_delta: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    with profiling.scope('feature_build'):
+        payloads = {task: _TASK_BUILD[task][1](results) for task in canonical}
+        if round_delta:
+            for task, payload in payloads.items():
+                _attach_round_delta(task, payload, round_delta)
+    return payloads
+
+
+def extract_all_features(conn_str: str, tasks: Optional[List[str]] = None, workers: int = 4,
+                         round_delta: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+    """Build the payloads of several tasks from one shared catalog snapshot.
+
+    Every catalog query needed by any of the tasks runs exactly once.
+    round_delta, when given, adds the counters of the last benchmark round
+    next to the cumulative ones. Returns {canonical task name: payload}.
+    """
+    canonical = _canonical_tasks(tasks)
+    names = [n for task in canonical for n in _TASK_BUILD[task][0]]
+    results = fetch_catalog_snapshot(conn_str, names, workers=workers)
+    return _build_payloads(canonical, results, round_delta)
+
+
+# -----------------------------
+# Feature cache
+# -----------------------------
+
+# Per-relation catalog queries whose rows are cached; index usage counters
+# change every round and are re-read and merged into the cached rows
+_CACHED_QUERIES = {
+    'tables': _fetch_tables,
+    'index_table_features': _fetch_index_table_features,
+}
+
+
+class FeatureCache:
+    """Per-relation features cached across rounds, keyed by catalog state.
+
+    extract() behaves like extract_all_features, but rows of the per-table
+    queries are only re-read for relations whose relation_versions hash
+    changed (new indexes, rewrites, ANALYZE, ...). Any change to pg_matviews
+    drops the whole cache. Dynamic queries (execution stats, top queries,
+    index usage) are always read.
+    """
+
+    def __init__(self) -> None:
+        # query name -> {table oid: (version hash, row)}
+        self.entries: Dict[str, Dict[int, Tuple[str, Tuple]]] = {name: {} for name in _CACHED_QUERIES}
+        self.matviews_version: Optional[str] = None
+        self.last_refetched: List[int] = []
+
+    def _refresh(self, cur, versions: Dict[int, str], cached: List[str]) -> None:
+        versions = dict(versions)
+        matviews_version = versions.pop(0, None)
+        if matviews_version != self.matviews_version:
+            for entries in self.entries.values():
+                entries.clear()
+            self.matviews_version = matviews_version
+
+        stale = {}
+        for name in cached:
+            entries = self.entries[name]
+            for oid in set(entries) - set(versions):
+                del entries[oid]
+            stale[name] = [oid for oid, h in versions.items() if entries.get(oid, (None,))[0] != h]
+        self.last_refetched = sorted({oid for oids in stale.values() for oid in oids})
+
+        for name, oids in stale.items():
+            if oids:
+                for row in _CACHED_QUERIES[name](cur, oids):
+                    self.entries[name][row[-1]] = (versions[row[-1]], row)
+
+    def extract(self, conn_str: str, tasks: Optional[List[str]] = None, workers: int = 4,
+                round_delta: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        canonical = _canonical_tasks(tasks)
+        names = list(dict.fromkeys(n for task in canonical for n in _TASK_BUILD[task][0]))
+        cached = [n for n in names if n in _CACHED_QUERIES]
+        dynamic = [n for n in names if n not in _CACHED_QUERIES] + ['relation_versions']
+        if 'index_table_features' in cached:
+            dynamic.append('index_usage')
+        # Stale rows are re-read in the snapshot of the dynamic queries
+        results = fetch_catalog_snapshot(conn_str, dynamic, workers=workers,
+                                         then=lambda cur, r: self._refresh(cur, r['relation_versions'], cached))
+        versions = results.pop('relation_versions')
+        versions.pop(0, None)
+
+        for name in cached:
+            rows = [self.entries[name][oid][1] for oid in versions if oid in self.entries[name]]
+            if name == 'index_table_features':
+                usage = results['index_usage']
+                rows = [row[:4] + (usage.get(row[-1], []), row[-1]) for row in rows]
+            results[name] = rows
+        return _build_payloads(canonical, results, round_delta)
+
+
 def reset_pgstat_statements(conn_str: str) -> None:
     conn = psycopg2.connect(conn_str)
     cur = conn.cursor()
@@ -278,8 +667,9 @@ if __name__ == "__main__":
         "knob_tuning",
         "optimization_plan_review",
     ]
+    all_feats = extract_all_features(conn_str, tasks)
     for t in tasks:
-        feats = extract_features(conn_str, t)
+        feats = all_feats[t]
         outfile = f"{t.replace(' ', '_')}_features.json"
         with open(outfile, "w", encoding="utf-8") as f:
             json.dump(feats, f, ensure_ascii=False, indent=2)
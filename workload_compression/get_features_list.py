@@ -1,6 +1,10 @@
+import argparse
+import hashlib
 import json
 import os
 import configparser
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 
 # Load configuration
@@ -15,16 +19,59 @@ with open(prompt_template_path, 'r', encoding='utf-8') as f:
 messages1 = prompt_templates["system"]
 messages2_template = prompt_templates["user"]
 
+DOWNSTREAM_TASKS = ["indexes recommendation", "materialised views recommendation", "knob tuning", "optimization plan review"]
+# Selection results keyed by a hash of model, prompts and inputs
+CACHE_PATH = os.path.join(os.path.dirname(__file__), ".features_selected_cache.json")
 
-def get_features_list(model, messages1, message2, task):
-    messages = [  
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    # One client (and connection pool) shared by all selection calls
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenAI(
+                api_key=config['LLM']['api_key'],
+                base_url=config['LLM']['base_url']
+            )
+    return _client
+
+
+def _output_path(task):
+    return os.path.join(os.path.dirname(__file__), f"features_selected_{task}.json")
+
+
+def _cache_key(model, messages1, message2):
+    digest = hashlib.sha256()
+    for part in (model, messages1, message2):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _load_cache():
+    try:
+        with open(CACHE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_cache(cache):
+    tmp_path = CACHE_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, CACHE_PATH)
+
+
+def get_features_list(model, messages1, message2, task, client=None):
+    messages = [
         {"role": "system", "content": messages1},
         {"role": "user", "content": message2}
     ]
-    client = OpenAI(
-        api_key=config['LLM']['api_key'], 
-        base_url=config['LLM']['base_url']
-    )
+    client = client or _get_client()
 
     completion = client.chat.completions.create(
         model=model,
@@ -34,24 +81,92 @@ def get_features_list(model, messages1, message2, task):
 
     for choice in completion.choices:
         print(choice.message.content)
-    
-    output_path = os.path.join(os.path.dirname(__file__), f"features_selected_{task}.json")
-    with open(output_path, "w", encoding="utf-8") as f:
+
+    with open(_output_path(task), "w", encoding="utf-8") as f:
         f.write(choice.message.content)
+    return choice.message.content
+
+
+def select_features(model, features_all, tasks=DOWNSTREAM_TASKS, mode="parallel", use_cache=True):
+    """Run feature selection for every downstream task; returns {task: selection text}.
+
+    mode: 'parallel' issues the task calls concurrently over one client,
+    'sequential' one after another, 'offline' reuses the existing
+    features_selected_*.json files without calling the LLM. Outside offline
+    mode, tasks whose prompt (template, inputs, model) is unchanged since the
+    last run are answered from the cache.
+    """
+    if mode not in ("parallel", "sequential", "offline"):
+        raise ValueError(f"Unknown mode '{mode}'. Supported: ['parallel', 'sequential', 'offline']")
+    results = {}
+    if mode == "offline":
+        for task in tasks:
+            path = _output_path(task)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Offline mode needs {path}; run once with the LLM first")
+            with open(path, "r", encoding="utf-8") as f:
+                results[task] = f.read()
+            print(f"Reusing {os.path.basename(path)}")
+        return results
+
+    cache = _load_cache() if use_cache else {}
+    pending = {}
+    for task in tasks:
+        message2 = messages2_template.format(downstream_task=task, features_all=features_all)
+        key = _cache_key(model, messages1, message2)
+        if key in cache:
+            print(f"Cache hit for {task}")
+            results[task] = cache[key]["content"]
+            with open(_output_path(task), "w", encoding="utf-8") as f:
+                f.write(results[task])
+        else:
+            pending[task] = (key, message2)
+
+    if pending:
+        client = _get_client()
+        workers = len(pending) if mode == "parallel" else 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {task: pool.submit(get_features_list, model, messages1, message2, task, client)
+                       for task, (_, message2) in pending.items()}
+        failed = {}
+        for task, future in futures.items():
+            try:
+                results[task] = future.result()
+            except Exception as e:
+                failed[task] = e
+                continue
+            cache[pending[task][0]] = {"task": task, "model": model, "content": results[task]}
+        # Keep the successful selections even if another task failed
+        if use_cache:
+            _save_cache(cache)
+        if failed:
+            raise RuntimeError(f"Feature selection failed for {sorted(failed)}: {next(iter(failed.values()))}")
+    return {task: results[task] for task in tasks}
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['parallel', 'sequential', 'offline'], default='parallel',
+                        help="offline reuses the existing features_selected_*.json files")
+    parser.add_argument('--no_cache', action='store_true', help='always call the LLM')
+    parser.add_argument('--stat_json', action='store_true',
+                        help='read the workload statistics from features_stat.json (WorkloadParser.py --json_output)')
+    args = parser.parse_args()
+
     model = config['LLM'].get('model', 'gpt-4.1')
-    downstream_task = ["indexes recommendation", "materialised views recommendation", "knob tuning", "optimization plan review"]
-    
+
     features_detail_path = os.path.join(os.path.dirname(__file__), "features_detail")
     features_stat_path = os.path.join(os.path.dirname(__file__), "features_stat")
-    
+    features_stat_json_path = features_stat_path + ".json"
+
     with open(features_detail_path, "r", encoding="utf-8") as f:
         features_all = f.read()
-    
-    with open(features_stat_path, "r", encoding="utf-8") as f:
-        features_all += "\n" + f.read()
 
-    for task in downstream_task:
-        message2 = messages2_template.format(downstream_task=task, features_all=features_all)
-        get_features_list(model, messages1, message2, task)
+    if args.stat_json:
+        from workload_features import WorkloadFeatures
+        features_all += "\n" + WorkloadFeatures.load(features_stat_json_path).render_text()
+    else:
+        with open(features_stat_path, "r", encoding="utf-8") as f:
+            features_all += "\n" + f.read()
+
+    select_features(model, features_all, mode=args.mode, use_cache=not args.no_cache)
@@ -0,0 +1,319 @@
+import cProfile
+import functools
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional, Tuple
+
+MODES = ('off', 'full', 'sample')
+
+# Returned by scope() while profiling is off; reusable, so the off path allocates nothing
+_NULL = nullcontext()
+# Deepest stack kept per sample
+_MAX_SAMPLE_DEPTH = 128
+
+
+def _file_name(stage: str) -> str:
+    return re.sub(r'[^\w.-]+', '_', stage).strip('_') or 'stage'
+
+
+class _Entry:
+    __slots__ = ('name', 'start', 'profile', 'snapshot')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = time.perf_counter()
+        self.profile = None
+        self.snapshot = None
+
+
+class _Scope:
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._exit()
+        return False
+
+
+class Profiler:
+    """Per-stage CPU and allocation profiles of one process.
+
+    Code marks stages with `with profiler.scope(name):`. Scopes nest and may
+    be opened from any thread; each thread keeps its own scope stack.
+
+    mode 'full': every stage has a cProfile profile (per thread, merged when
+    written) that only runs while the stage is the innermost open scope of
+    its thread, so a stage's profile excludes its nested stages. tracemalloc
+    snapshots taken at scope entry and exit give the memory each stage left
+    allocated; they include nested stages, and since tracemalloc is process
+    wide, allocations of other threads running at the same time.
+
+    mode 'sample': no tracing at all. A background thread looks at the stacks
+    of the threads inside a scope (and of the main thread) every `interval`
+    seconds and counts them per innermost stage. Cheap enough for sessions
+    of many hours.
+
+    dump() writes to out_dir:
+      full:   <stage>.pstats (load with pstats / snakeviz), <stage>.alloc.txt
+      sample: <stage>.samples.txt (top functions), samples.collapsed
+              (flamegraph.pl / speedscope input)
+      both:   summary.txt (calls and wall time per stage)
+    """
+
+    def __init__(self, mode: str = 'full', out_dir: str = 'profile', top_n: int = 25,
+                 interval: float = 0.005, alloc_frames: int = 1) -> None:
+        if mode not in ('full', 'sample'):
+            raise ValueError(f"Unknown profile mode '{mode}'. Supported: ['full', 'sample']")
+        self.mode = mode
+        self.out_dir = out_dir
+        self.top_n = top_n
+        self.interval = interval
+        self._stacks: Dict[int, List[_Entry]] = {}
+        self._lock = threading.Lock()
+        self.calls: Counter = Counter()
+        self.wall_s: Dict[str, float] = defaultdict(float)
+        # full: (stage, thread name) -> profile; stage -> location -> [bytes, blocks]
+        self._profiles: Dict[Tuple[str, str], cProfile.Profile] = {}
+        self._allocs: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        # sample: stage -> collapsed stack (root first) -> samples
+        self._samples: Dict[str, Counter] = defaultdict(Counter)
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started_tracemalloc = False
+        os.makedirs(out_dir, exist_ok=True)
+        if mode == 'full':
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(alloc_frames)
+                self._started_tracemalloc = True
+            self._alloc_filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                                   tracemalloc.Filter(False, __file__),
+                                   tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                                   tracemalloc.Filter(False, '<unknown>')]
+        else:
+            self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+            self._sampler.start()
+
+    def scope(self, name: str) -> _Scope:
+        return _Scope(self, name)
+
+    def _stack(self) -> List[_Entry]:
+        return self._stacks.setdefault(threading.get_ident(), [])
+
+    # -----------------------------
+    # Scopes
+    # -----------------------------
+
+    def _enter(self, name: str) -> None:
+        stack = self._stack()
+        entry = _Entry(name)
+        if self.mode == 'full':
+            if stack and stack[-1].profile is not None:
+                stack[-1].profile.disable()
+            entry.snapshot = tracemalloc.take_snapshot()
+            key = (name, threading.current_thread().name)
+            with self._lock:
+                profile = self._profiles.get(key)
+                if profile is None:
+                    profile = self._profiles[key] = cProfile.Profile()
+            try:
+                profile.enable()
+                entry.profile = profile
+            except ValueError:
+                # Another profiler (e.g. an outer cProfile run) owns this thread
+                pass
+            entry.start = time.perf_counter()
+        stack.append(entry)
+
+    def _exit(self) -> None:
+        stack = self._stack()
+        entry = stack[-1]
+        wall = time.perf_counter() - entry.start
+        if entry.profile is not None:
+            entry.profile.disable()
+        if entry.snapshot is not None:
+            self._add_allocs(entry.name, entry.snapshot, tracemalloc.take_snapshot())
+        stack.pop()
+        with self._lock:
+            self.calls[entry.name] += 1
+            self.wall_s[entry.name] += wall
+        if stack and stack[-1].profile is not None:
+            stack[-1].profile.enable()
+
+    def _add_allocs(self, stage: str, before, after) -> None:
+        diff = after.filter_traces(self._alloc_filters).compare_to(before.filter_traces(self._alloc_filters), 'lineno')
+        with self._lock:
+            allocs = self._allocs[stage]
+            for stat in diff:
+                if stat.size_diff or stat.count_diff:
+                    totals = allocs[str(stat.traceback)]
+                    totals[0] += stat.size_diff
+                    totals[1] += stat.count_diff
+
+    # -----------------------------
+    # Sampling
+    # -----------------------------
+
+    def _sample_loop(self) -> None:
+        me = threading.get_ident()
+        main = threading.main_thread().ident
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for tid, frame in frames.items():
+                if tid == me:
+                    continue
+                try:
+                    stage = self._stacks[tid][-1].name
+                except (KeyError, IndexError):
+                    if tid != main:
+                        continue
+                    stage = 'unscoped'
+                names = []
+                while frame is not None and len(names) < _MAX_SAMPLE_DEPTH:
+                    code = frame.f_code
+                    names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                with self._lock:
+                    self._samples[stage][tuple(reversed(names))] += 1
+            frames = frame = None
+
+    # -----------------------------
+    # Reports
+    # -----------------------------
+
+    def dump(self) -> None:
+        """Write the reports of everything profiled so far (safe to call repeatedly)."""
+        with self._lock:
+            active = {id(e.profile) for stack in list(self._stacks.values()) for e in list(stack)}
+            profiles = defaultdict(list)
+            for (stage, _), profile in self._profiles.items():
+                # A running profile cannot be snapshotted; it is written by a later dump
+                if id(profile) not in active:
+                    profiles[stage].append(profile)
+            allocs = {stage: dict(v) for stage, v in self._allocs.items()}
+            samples = {stage: Counter(v) for stage, v in self._samples.items()}
+            calls = dict(self.calls)
+            wall_s = dict(self.wall_s)
+
+        for stage, group in profiles.items():
+            stats = pstats.Stats(group[0])
+            for profile in group[1:]:
+                stats.add(profile)
+            stats.dump_stats(os.path.join(self.out_dir, f'{_file_name(stage)}.pstats'))
+        for stage, locations in allocs.items():
+            self._write(f'{_file_name(stage)}.alloc.txt', self._alloc_report(stage, locations, calls.get(stage, 0)))
+        if samples:
+            self._write('samples.collapsed', ''.join(
+                f"{';'.join((stage,) + stack)} {n}\n" for stage, counter in sorted(samples.items())
+                for stack, n in counter.items()))
+            for stage, counter in samples.items():
+                self._write(f'{_file_name(stage)}.samples.txt', self._sample_report(stage, counter))
+
+        lines = [f"{'stage':<40}{'calls':>8}{'wall s':>10}{'mean s':>10}"]
+        for stage in sorted(wall_s, key=lambda s: -wall_s[s]):
+            lines.append(f"{stage[:39]:<40}{calls[stage]:>8}{wall_s[stage]:>10.2f}{wall_s[stage] / calls[stage]:>10.4f}")
+        if samples:
+            lines += ['', f"{'stage':<40}{'samples':>8}{'share':>10}"]
+            n_all = sum(sum(c.values()) for c in samples.values()) or 1
+            for stage, counter in sorted(samples.items(), key=lambda kv: -sum(kv[1].values())):
+                n = sum(counter.values())
+                lines.append(f"{stage[:39]:<40}{n:>8}{n / n_all:>10.1%}")
+        self._write('summary.txt', '\n'.join(lines) + '\n')
+
+    def _alloc_report(self, stage: str, locations: Dict[str, List[int]], calls: int) -> str:
+        net = sum(size for size, _ in locations.values())
+        top = sorted(locations.items(), key=lambda kv: -kv[1][0])[:self.top_n]
+        lines = [f'# {stage}: {calls} calls, {net / 1024:.1f} KiB net allocated at scope exit',
+                 f'# top {len(top)} lines by retained size (nested stages included)',
+                 f"{'KiB':>12}{'blocks':>10}  location"]
+        lines += [f'{size / 1024:>12.1f}{blocks:>10}  {where}' for where, (size, blocks) in top]
+        return '\n'.join(lines) + '\n'
+
+    def _sample_report(self, stage: str, counter: Counter) -> str:
+        n = sum(counter.values())
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, k in counter.items():
+            if stack:
+                own[stack[-1]] += k
+            for name in set(stack):
+                inclusive[name] += k
+        lines = [f'# {stage}: {n} samples (~{n * self.interval:.1f}s at {self.interval * 1000:g} ms)',
+                 f"{'self':>8}{'self %':>8}{'total':>8}{'total %':>9}  function"]
+        for name, k in own.most_common(self.top_n):
+            lines.append(f'{k:>8}{k / n:>8.1%}{inclusive[name]:>8}{inclusive[name] / n:>9.1%}  {name}')
+        return '\n'.join(lines) + '\n'
+
+    def _write(self, name: str, text: str) -> None:
+        path = os.path.join(self.out_dir, name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    def close(self) -> None:
+        """Stop sampling/tracing and write the final reports."""
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+        self.dump()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        print(f"Profile ({self.mode}) written to {os.path.abspath(self.out_dir)}", file=sys.stderr)
+
+
+_active: Optional[Profiler] = None
+
+
+def configure(mode: str = 'off', out_dir: str = 'profile', **kwargs: Any) -> Optional[Profiler]:
+    """Install the process-wide profiler used by scope(); mode 'off' installs none."""
+    global _active
+    mode = (mode or 'off').strip().lower()
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode '{mode}'. Supported: {list(MODES)}")
+    if _active is not None:
+        _active.close()
+    _active = Profiler(mode, out_dir, **kwargs) if mode != 'off' else None
+    return _active
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _active
+
+
+def scope(name: str):
+    """Profile the enclosed block as stage `name`; a no-op unless configure() enabled a mode."""
+    profiler = _active
+    return profiler.scope(name) if profiler is not None else _NULL
+
+
+def scoped(name: str):
+    """Decorator form of scope()."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with scope(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def close() -> None:
+    global _active
+    if _active is not None:
+        _active.close()
+        _active = None
@@ -0,0 +1,286 @@
+import copy
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Tuple, Optional
+
+import numpy as np
+
+from access_graph import AccessGraph
+
+
+PREDICATE_TYPES = ["=", ">", "<", ">=", "<="]
+
+
+def _ratio(num, den) -> float:
+    return num / den if den else 0.0
+
+
+def _line(*parts) -> str:
+    # Same spacing as print(*parts)
+    return " ".join(str(p) for p in parts)
+
+
+@dataclass
+class WorkloadFeatures:
+    """Statistics collected by WP2.parse_workload.
+
+    Raw counters are kept as plain ints/dicts so the object can be
+    serialized to JSON; the derived ratios are computed on demand.
+    """
+    workload_path: str = ""
+    sample_sqls: List[str] = field(default_factory=list)
+    statement_num: int = 0
+    read_cnt: int = 0
+    write_cnt: int = 0
+    predicate_num: int = 0
+    group_by_num: int = 0
+    order_by_num: int = 0
+    aggr_num: int = 0
+    desc_num: int = 0
+    non_agg_count: int = 0
+    predicate_dict: Dict[str, int] = field(default_factory=lambda: {p: 0 for p in PREDICATE_TYPES})
+    tbl_dict: Dict[str, int] = field(default_factory=dict)
+    tbl_col_dict: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    # Only set for sampled workloads, see workload_sampler.sample_workload
+    intervals: Dict[str, List[float]] = field(default_factory=dict)
+    sample_info: Dict[str, Any] = field(default_factory=dict)
+    # Join graph and column co-access, see access_graph.AccessGraph
+    access_graph: Optional[AccessGraph] = None
+
+    # -----------------------------
+    # Derived statistics
+    # -----------------------------
+
+    @property
+    def query_num(self) -> int:
+        return self.read_cnt + self.write_cnt
+
+    @property
+    def table_access_sum(self) -> int:
+        return sum(self.tbl_dict.values())
+
+    def max_min_tables(self) -> Tuple[str, int, str, int]:
+        maxi, maxv, mini, minv = "", 0, "", 100000000
+        for name, cnt in self.tbl_dict.items():
+            if cnt > maxv:
+                maxv, maxi = cnt, name
+            if cnt < minv:
+                minv, mini = cnt, name
+        return maxi, maxv, mini, minv
+
+    def summary(self) -> Dict[str, Any]:
+        n = self.query_num
+        sumv = self.table_access_sum
+        maxi, maxv, mini, minv = self.max_min_tables()
+        pred_sum = sum(self.predicate_dict.values())
+        return {
+            'size_of_workload': self.statement_num,
+            'read_write_ratio': _ratio(self.read_cnt, n),
+            'group_by_ratio': _ratio(self.group_by_num, n),
+            'order_by_ratio': _ratio(self.order_by_num, n),
+            'aggregation_ratio': _ratio(self.aggr_num, n),
+            'average_predicate_num': _ratio(self.predicate_num, n),
+            'max_visited_table': [maxi, _ratio(maxv, sumv)],
+            'min_visited_table': [mini, _ratio(minv, sumv)],
+            'average_table_access_count': _ratio(sumv, self.statement_num),
+            'average_item_returned_count': _ratio(self.non_agg_count, self.statement_num),
+            'order_by_asc_ratio': _ratio(self.order_by_num - self.desc_num, self.order_by_num),
+            'order_by_desc_ratio': _ratio(self.desc_num, self.order_by_num),
+            'predicate_ratio': {p: _ratio(c, pred_sum) for p, c in self.predicate_dict.items()},
+        }
+
+    # -----------------------------
+    # Arithmetic (incremental mode)
+    # -----------------------------
+
+    def add(self, other: "WorkloadFeatures", weight=1) -> "WorkloadFeatures":
+        """Add weight * other to the counters in place."""
+        for k in self._COUNTERS:
+            setattr(self, k, getattr(self, k) + weight * getattr(other, k))
+        for p, c in other.predicate_dict.items():
+            self.predicate_dict[p] = self.predicate_dict.get(p, 0) + weight * c
+        for t, c in other.tbl_dict.items():
+            self.tbl_dict[t] = self.tbl_dict.get(t, 0) + weight * c
+        for t, cols in other.tbl_col_dict.items():
+            dst = self.tbl_col_dict.setdefault(t, {})
+            for c, v in cols.items():
+                dst[c] = dst.get(c, 0) + weight * v
+        if self.access_graph is not None and other.access_graph is not None:
+            self.access_graph.add(other.access_graph, weight)
+        return self
+
+    def scale(self, factor) -> "WorkloadFeatures":
+        """Multiply every counter by factor in place."""
+        for k in self._COUNTERS:
+            setattr(self, k, getattr(self, k) * factor)
+        for p in self.predicate_dict:
+            self.predicate_dict[p] *= factor
+        for t in self.tbl_dict:
+            self.tbl_dict[t] *= factor
+        for cols in self.tbl_col_dict.values():
+            for c in cols:
+                cols[c] *= factor
+        if self.access_graph is not None:
+            self.access_graph.scale(factor)
+        return self
+
+    def round_counts(self) -> "WorkloadFeatures":
+        """Round every counter to the nearest integer in place (after weighted adds)."""
+        for k in self._COUNTERS:
+            setattr(self, k, int(round(getattr(self, k))))
+        for p in self.predicate_dict:
+            self.predicate_dict[p] = int(round(self.predicate_dict[p]))
+        for t in self.tbl_dict:
+            self.tbl_dict[t] = int(round(self.tbl_dict[t]))
+        for cols in self.tbl_col_dict.values():
+            for c in cols:
+                cols[c] = int(round(cols[c]))
+        return self
+
+    def copy(self) -> "WorkloadFeatures":
+        # The schema referenced by access_graph is shared, not copied
+        memo = {id(self.access_graph.dbs): self.access_graph.dbs} if self.access_graph is not None else {}
+        return copy.deepcopy(self, memo)
+
+    # -----------------------------
+    # Serialization
+    # -----------------------------
+
+    _COUNTERS = ('statement_num', 'read_cnt', 'write_cnt', 'predicate_num', 'group_by_num',
+                 'order_by_num', 'aggr_num', 'desc_num', 'non_agg_count')
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {
+            'workload_path': self.workload_path,
+            'sample_sqls': list(self.sample_sqls),
+            'counters': {k: getattr(self, k) for k in self._COUNTERS},
+            'predicate_dict': dict(self.predicate_dict),
+            'tbl_dict': dict(self.tbl_dict),
+            'tbl_col_dict': {t: dict(c) for t, c in self.tbl_col_dict.items()},
+            'summary': self.summary(),
+        }
+        if self.sample_info:
+            out['sample_info'] = dict(self.sample_info)
+            out['intervals'] = dict(self.intervals)
+        if self.access_graph is not None:
+            out.update(self.access_graph.to_dict())
+        return out
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "WorkloadFeatures":
+        feats = cls(workload_path=d.get('workload_path', ''), sample_sqls=list(d.get('sample_sqls', [])))
+        for k, v in d.get('counters', {}).items():
+            if k in cls._COUNTERS:
+                setattr(feats, k, v)
+        feats.predicate_dict.update(d.get('predicate_dict', {}))
+        feats.tbl_dict = dict(d.get('tbl_dict', {}))
+        feats.tbl_col_dict = {t: dict(c) for t, c in d.get('tbl_col_dict', {}).items()}
+        feats.intervals = dict(d.get('intervals', {}))
+        feats.sample_info = dict(d.get('sample_info', {}))
+        if 'join_graph' in d or 'coaccess' in d:
+            feats.access_graph = AccessGraph.from_dict(d)
+        return feats
+
+    def to_json(self, path: str = None, indent: int = None) -> str:
+        text = json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+    @classmethod
+    def load(cls, path: str) -> "WorkloadFeatures":
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def to_vector(self) -> Dict[str, np.ndarray]:
+        """Compact numeric form: global ratios plus per-table and per-column access fractions.
+
+        Per-column fractions are normalized within their table, the same way
+        the text report prints them.
+        """
+        s = self.summary()
+        scalar_names = ['read_write_ratio', 'group_by_ratio', 'order_by_ratio', 'aggregation_ratio',
+                        'average_predicate_num', 'average_table_access_count',
+                        'average_item_returned_count', 'order_by_desc_ratio']
+        scalars = [s[k] for k in scalar_names]
+        scalar_names += [f'predicate_ratio[{p}]' for p in PREDICATE_TYPES]
+        scalars += [s['predicate_ratio'].get(p, 0.0) for p in PREDICATE_TYPES]
+
+        tables = list(self.tbl_dict.keys())
+        table_cnt = np.array([self.tbl_dict[t] for t in tables], dtype=np.float64)
+        columns = []
+        column_cnt = []
+        column_freq = []
+        for t in tables:
+            cols = self.tbl_col_dict.get(t, {})
+            tmp_sum = sum(cols.values())
+            for c, v in cols.items():
+                columns.append(f"{t}.{c}")
+                column_cnt.append(v)
+                column_freq.append(_ratio(v, tmp_sum))
+        out = {
+            'scalar_names': np.array(scalar_names),
+            'scalars': np.array(scalars, dtype=np.float64),
+            'tables': np.array(tables),
+            'table_cnt': table_cnt,
+            'table_freq': table_cnt / table_cnt.sum() if table_cnt.sum() else table_cnt,
+            'columns': np.array(columns),
+            'column_cnt': np.array(column_cnt, dtype=np.float64),
+            'column_freq': np.array(column_freq, dtype=np.float64),
+        }
+        if self.access_graph is not None:
+            out.update(self.access_graph.to_vector())
+        return out
+
+    def save_vector(self, path: str) -> None:
+        np.savez_compressed(path, **self.to_vector())
+
+    # -----------------------------
+    # Text report (features_stat)
+    # -----------------------------
+
+    def render_text(self) -> str:
+        n = self.query_num
+        sumv = self.table_access_sum
+        maxi, maxv, mini, minv = self.max_min_tables()
+        pred_sum = sum(self.predicate_dict.values())
+        out = [_line("type of workload :", self.workload_path)]
+        for i, sql in enumerate(self.sample_sqls[:2]):
+            out.append(_line(f"sample SQL{i + 1}:", re.split(r'[,;\s\n\t\(\)]+', sql)))
+        out.append(_line("size of workload :", self.statement_num))
+        out.append("read write ratio : " + str(self.read_cnt) + "|" + str(self.write_cnt) + "  " + str(_ratio(self.read_cnt, n)))
+        out.append("group by ratio : " + str(_ratio(self.group_by_num, n)))
+        out.append("order by ratio : " + str(_ratio(self.order_by_num, n)))
+        out.append("aggregation ratio : " + str(_ratio(self.aggr_num, n)))
+        out.append(_line("average predicate num per SQL :", str(_ratio(self.predicate_num, n))))
+        out.append(_line("max visited table :", maxi, str(_ratio(maxv, sumv))))
+        out.append(_line("min visited table :", mini, str(_ratio(minv, sumv))))
+        out.append(_line("average table access count :", _ratio(sumv, self.statement_num)))
+        out.append(_line("average item returned count per query :", _ratio(self.non_agg_count, self.statement_num)))
+        out.append(_line("order by logic ratio :", _ratio(self.order_by_num - self.desc_num, self.order_by_num),
+                         "(asc):", _ratio(self.desc_num, self.order_by_num), "(desc)"))
+        out.append("where clause comparison condition ratio :")
+        for p in PREDICATE_TYPES:
+            out.append(_line("\t", p, _ratio(self.predicate_dict.get(p, 0), pred_sum)))
+        out.append("table access pattern :")
+        for t in self.tbl_dict:
+            out.append(_line("\t", t, str(self.tbl_dict[t]) + "|" + str(sumv), "\t", _ratio(self.tbl_dict[t], sumv)))
+            cols = self.tbl_col_dict.get(t, {})
+            tmp_sum = sum(cols.values())
+            if tmp_sum == 0:
+                continue
+            for c, v in cols.items():
+                out.append(_line("\t\t", c, str(v) + "|" + str(tmp_sum), "\t", v / tmp_sum))
+        if self.sample_info:
+            info = self.sample_info
+            out.append(_line("sampling :", info['method'], str(info['sample_size']) + "|" + str(info['population_size']),
+                             f"({info['confidence']:.0%} confidence intervals)"))
+            for k, (est, lo, hi) in self.intervals.items():
+                if not k.startswith('column['):
+                    out.append(_line("\t", k, f"{est:.4f}", f"[{lo:.4f}, {hi:.4f}]"))
+        if self.access_graph is not None:
+            out += self.access_graph.render_text()
+        out.append("")
+        return "\n".join(out) + "\n"
@@ -0,0 +1,237 @@
+import argparse
+import json
+import string
+import sys
+from typing import Dict, List, Any, Iterator
+
+import numpy as np
+
+
+# -----------------------------
+# Schema helpers
+# -----------------------------
+
+_INT_TYPES = {'int', 'int2', 'int4', 'int8', 'integer', 'bigint', 'smallint', 'serial', 'bigserial', 'numeric', 'float4', 'float8'}
+
+
+def load_schema(schema_path: str) -> List[Dict[str, Any]]:
+    """Tables of a schema JSON in the workloads/res.json format, reduced to what the generator needs."""
+    with open(schema_path, 'r', encoding='utf-8') as f:
+        schema = json.load(f)
+    tables = []
+    for table in schema['Tables']:
+        cols = []
+        for col in table['Table Columns']:
+            dist = col.get('Data Distribution') or [0, 1000000]
+            cols.append({
+                'name': col['Column Name'],
+                'numeric': col['Data Type'].lower() in _INT_TYPES,
+                'lo': dist[0],
+                'hi': dist[1],
+                'width': col.get('Data Type Mod') or dist[1] or 16,
+            })
+        key = table.get('Primary Key', {}).get('Name') or cols[0]['name']
+        fks = [fk for fk in table.get('Foreign Key', []) if fk.get('Referenced Table')]
+        tables.append({'name': table['Table Name'], 'cols': cols, 'key': key, 'fks': fks})
+    return tables
+
+
+def zipf_weights(n: int, skew: float) -> np.ndarray:
+    """P(i) proportional to 1/(i+1)**skew; skew=0 is uniform."""
+    w = 1.0 / np.arange(1, n + 1) ** skew
+    return w / w.sum()
+
+
+class _Literals:
+    """Pre-drawn literal pools, so generating 10^7 statements is not dominated by RNG calls."""
+
+    def __init__(self, rng: np.random.Generator, pool: int = 4096) -> None:
+        self.rng = rng
+        alphabet = np.array(list(string.ascii_letters + string.digits))
+        self.strings = [''.join(rng.choice(alphabet, 120)) for _ in range(64)]
+        self.pool = pool
+        self._ints = rng.random(pool)
+        self._pos = 0
+
+    def unit(self) -> float:
+        if self._pos >= self.pool:
+            self._ints = self.rng.random(self.pool)
+            self._pos = 0
+        self._pos += 1
+        return self._ints[self._pos - 1]
+
+    def value(self, col: Dict[str, Any]) -> str:
+        if col['numeric']:
+            return str(int(col['lo'] + self.unit() * (col['hi'] - col['lo'])))
+        s = self.strings[int(self.unit() * len(self.strings))]
+        return "'" + s[:max(1, min(int(col['width']), 120))] + "'"
+
+    def range(self, col: Dict[str, Any], width: float = 0.01):
+        lo, hi = col['lo'], col['hi']
+        a = int(lo + self.unit() * (hi - lo) * (1 - width))
+        return a, a + max(1, int((hi - lo) * width))
+
+
+# -----------------------------
+# Statement templates
+# -----------------------------
+# Each template takes (lit, tables) and returns one statement; tables[0] is
+# the driving table, the rest are join partners.
+
+def _key(t):
+    for c in t['cols']:
+        if c['name'] == t['key']:
+            return c
+    return t['cols'][0]
+
+
+def _num_col(t, i=1):
+    nums = [c for c in t['cols'] if c['numeric']]
+    return nums[min(i, len(nums) - 1)] if nums else t['cols'][0]
+
+
+def _other_col(t, i=2):
+    return t['cols'][min(i, len(t['cols']) - 1)]
+
+
+def _point_select(lit, tables):
+    t = tables[0]
+    k = _key(t)
+    return f"SELECT {_other_col(t)['name']} FROM {t['name']} WHERE {t['name']}.{k['name']} = {lit.value(k)} ;"
+
+
+def _range_select(lit, tables):
+    t = tables[0]
+    k = _key(t)
+    a, b = lit.range(k)
+    return f"SELECT {_other_col(t)['name']} FROM {t['name']} WHERE {t['name']}.{k['name']} > {a} and {t['name']}.{k['name']} < {b} ;"
+
+
+def _sum_range(lit, tables):
+    t = tables[0]
+    k = _key(t)
+    n = _num_col(t)
+    a, b = lit.range(k)
+    return f"SELECT sum({t['name']}.{n['name']}) as sum_value_{n['name']} FROM {t['name']} WHERE {t['name']}.{k['name']} > {a} and {t['name']}.{k['name']} < {b} ;"
+
+
+def _order_range(lit, tables):
+    t = tables[0]
+    k = _key(t)
+    c = _other_col(t)
+    a, b = lit.range(k)
+    return f"SELECT {c['name']} FROM {t['name']} WHERE {t['name']}.{k['name']} > {a} and {t['name']}.{k['name']} < {b} ORDER BY {c['name']} DESC LIMIT 10 ;"
+
+
+def _group_select(lit, tables):
+    t = tables[0]
+    k = _key(t)
+    c = _other_col(t, 3)
+    return (f"SELECT {c['name']},{k['name']},min({k['name']}) as minimum_value_{k['name']} FROM {t['name']} "
+            f"WHERE {t['name']}.{k['name']} > {lit.value(k)} GROUP BY {c['name']},{k['name']} LIMIT 10 ;")
+
+
+def _update_index(lit, tables):
+    t = tables[0]
+    k = _key(t)
+    n = _num_col(t)
+    return f"UPDATE {t['name']} SET {n['name']} = {n['name']} + 1 WHERE {k['name']} = {lit.value(k)} ;"
+
+
+def _insert(lit, tables):
+    t = tables[0]
+    names = ", ".join(c['name'] for c in t['cols'])
+    values = ", ".join(lit.value(c) for c in t['cols'])
+    return f"INSERT INTO {t['name']} ({names}) VALUES ({values}) ;"
+
+
+def _join(lit, tables):
+    # JOB-shaped: aggregate over a chain of 2-4 tables joined on their keys
+    # (or declared foreign keys) with a selective filter on the first table
+    first = tables[0]
+    proj = ",".join(f"min({t['name']}.{_other_col(t)['name']}) as min_{i}" for i, t in enumerate(tables))
+    preds = []
+    for left, right in zip(tables, tables[1:]):
+        fk = next((fk for fk in left['fks'] if fk['Referenced Table'] == right['name']), None)
+        if fk:
+            preds.append(f"{left['name']}.{fk['Foreign Key Name']} = {right['name']}.{fk['Referenced Primary Key']}")
+        else:
+            preds.append(f"{left['name']}.{_key(left)['name']} = {right['name']}.{_key(right)['name']}")
+    n = _num_col(first)
+    preds.append(f"{first['name']}.{n['name']} < {lit.value(n)}")
+    return f"SELECT {proj} FROM {','.join(t['name'] for t in tables)} WHERE {' and '.join(preds)} ;"
+
+
+# (template, number of tables) in descending default popularity
+SHAPES = {
+    'sysbench': [
+        (_point_select, 1), (_range_select, 1), (_sum_range, 1), (_order_range, 1),
+        (_update_index, 1), (_group_select, 1), (_insert, 1), (_join, 2),
+    ],
+    'job': [
+        (_join, 3), (_join, 2), (_join, 4), (_group_select, 1), (_sum_range, 1),
+    ],
+}
+
+
+def generate_workload(schema_path: str, n: int, shape: str = 'sysbench', skew: float = 1.0,
+                      table_skew: float = 0.5, seed: int = 0) -> Iterator[str]:
+    """Yield n synthetic statements shaped like sysbench or JOB over the given schema.
+
+    skew controls how strongly the first templates dominate and table_skew
+    how strongly the first tables dominate (Zipf exponents, 0 = uniform).
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown shape '{shape}'. Supported: {sorted(SHAPES)}")
+    tables = load_schema(schema_path)
+    templates = SHAPES[shape]
+    rng = np.random.default_rng(seed)
+    lit = _Literals(rng)
+    tpl_w = zipf_weights(len(templates), skew)
+    tbl_w = zipf_weights(len(tables), table_skew)
+    batch = 65536
+    done = 0
+    while done < n:
+        m = min(batch, n - done)
+        tpl_idx = rng.choice(len(templates), m, p=tpl_w)
+        tbl_idx = rng.choice(len(tables), (m, 4), p=tbl_w)
+        for i in range(m):
+            func, width = templates[tpl_idx[i]]
+            picked = []
+            for j in tbl_idx[i]:
+                if tables[j] not in picked:
+                    picked.append(tables[j])
+                if len(picked) == width:
+                    break
+            if len(picked) < width and len(tables) >= width:
+                picked += [t for t in tables if t not in picked][:width - len(picked)]
+            yield func(lit, picked)
+        done += m
+
+
+def write_workload(path: str, schema_path: str, n: int, **kwargs) -> int:
+    """Write a generated workload, one statement per line (the res.wg format)."""
+    cnt = 0
+    out = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8')
+    try:
+        for sql in generate_workload(schema_path, n, **kwargs):
+            out.write(sql + "\n")
+            cnt += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return cnt
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic workload from a schema JSON')
+    parser.add_argument('--config_file', type=str, default='./workloads/res.json', help='schema JSON (workloads/res.json format)')
+    parser.add_argument('--output', type=str, default='-', help="output workload file, '-' for stdout")
+    parser.add_argument('-n', '--size', type=int, default=1000, help='number of statements')
+    parser.add_argument('--shape', type=str, default='sysbench', choices=sorted(SHAPES))
+    parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent of the template mix')
+    parser.add_argument('--table_skew', type=float, default=0.5, help='Zipf exponent of the table mix')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_workload(args.output, args.config_file, args.size, shape=args.shape, skew=args.skew,
+                   table_skew=args.table_skew, seed=args.seed)
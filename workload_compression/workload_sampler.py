@@ -0,0 +1,311 @@
+import random
+import re
+import time
+from collections import Counter
+from statistics import NormalDist
+from typing import Dict, List, Tuple, Iterable, Optional
+
+import numpy as np
+
+from Parserbase import iter_statements
+from workload_features import WorkloadFeatures, PREDICATE_TYPES
+from access_graph import AccessGraph
+
+
+_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LIST_PATTERN = re.compile(r"\?(?:\s*,\s*\?)+")
+
+# Statements timed before the reservoir is sized from a time budget
+PILOT_SIZE = 100
+
+
+def statement_template(sql: str) -> str:
+    """Structural template of a statement: literals replaced by '?', whitespace collapsed."""
+    t = _LITERAL_PATTERN.sub('?', sql)
+    t = _LIST_PATTERN.sub('?', t)
+    return re.sub(r'\s+', ' ', t).strip().upper()
+
+
+def z_value(confidence: float) -> float:
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def sample_size_for_error(target_error: float, confidence: float = 0.95, population: Optional[int] = None) -> int:
+    """Sample size so that a proportion is within +-target_error at the given confidence.
+
+    Uses the worst-case variance p(1-p) = 0.25 and the finite population
+    correction when the population size is known.
+    """
+    if not 0 < target_error < 1:
+        raise ValueError(f"target_error must be in (0,1), got {target_error}")
+    n0 = z_value(confidence) ** 2 * 0.25 / target_error ** 2
+    if population:
+        n0 = n0 / (1 + (n0 - 1) / population)
+    return max(1, int(np.ceil(n0)))
+
+
+def reservoir_sample(statements: Iterable[str], k: int, rng: random.Random) -> Tuple[List[str], int]:
+    """Algorithm R. Returns (sample, population size)."""
+    reservoir = []
+    n = 0
+    for sql in statements:
+        if n < k:
+            reservoir.append(sql)
+        else:
+            j = rng.randint(0, n)
+            if j < k:
+                reservoir[j] = sql
+        n += 1
+    return reservoir, n
+
+
+def _pilot_cost(wp, statements: List[str]) -> float:
+    """Average seconds spent in analyze_statement per statement."""
+    if not statements:
+        return 0.0
+    scratch = WorkloadFeatures()
+    start = time.perf_counter()
+    for sql in statements:
+        wp.analyze_statement(sql, scratch)
+    return (time.perf_counter() - start) / len(statements)
+
+
+def _resolve_size(wp, head: List[str], sample_size, target_error, time_budget, confidence) -> int:
+    sizes = []
+    if sample_size:
+        sizes.append(int(sample_size))
+    if target_error:
+        sizes.append(sample_size_for_error(target_error, confidence))
+    if time_budget:
+        cost = _pilot_cost(wp, head)
+        sizes.append(max(len(head), int(time_budget / cost)) if cost > 0 else len(head))
+    if not sizes:
+        raise ValueError("one of sample_size, target_error or time_budget is required")
+    # Every given constraint must hold
+    return max(1, min(sizes))
+
+
+def _open_statements(workload_path):
+    with open(workload_path, 'r', encoding='utf-8', errors='replace') as f:
+        yield from iter_statements(f)
+
+
+def _draw_reservoir(wp, workload_path, sample_size, target_error, time_budget, confidence, rng):
+    stream = _open_statements(workload_path)
+    head = []
+    for sql in stream:
+        head.append(sql)
+        if len(head) >= PILOT_SIZE:
+            break
+    k = _resolve_size(wp, head, sample_size, target_error, time_budget, confidence)
+
+    def replay():
+        yield from head
+        yield from stream
+    sample, population = reservoir_sample(replay(), k, rng)
+    strata = {'*': (population, sample)}
+    return strata, head[:2]
+
+
+def _allocate(counts: Counter, k: int) -> Dict[str, int]:
+    """Proportional allocation of exactly k statements, at least one per stratum.
+
+    Largest-remainder rounding of k * n / population; strata left empty take
+    their statement from the largest allocations, so the total stays k.
+    Requires len(counts) <= k <= population.
+    """
+    population = sum(counts.values())
+    quota = {t: k * n / population for t, n in counts.items()}
+    alloc = {t: int(q) for t, q in quota.items()}
+    for t in sorted(quota, key=lambda t: alloc[t] - quota[t])[:k - sum(alloc.values())]:
+        alloc[t] += 1
+    for t in [t for t, a in alloc.items() if a == 0]:
+        alloc[max(alloc, key=alloc.get)] -= 1
+        alloc[t] = 1
+    return alloc
+
+
+def _draw_stratified(wp, workload_path, sample_size, target_error, time_budget, confidence, rng):
+    # Pass 1: template counts
+    counts = Counter()
+    head = []
+    for sql in _open_statements(workload_path):
+        counts[statement_template(sql)] += 1
+        if len(head) < PILOT_SIZE:
+            head.append(sql)
+    population = sum(counts.values())
+    k = _resolve_size(wp, head, sample_size, target_error, time_budget, confidence)
+
+    # Too many templates for the sample: keep the largest ones as strata and
+    # pool the long tail into a single '*' stratum
+    max_strata = max(1, k // 2)
+    if len(counts) > max_strata:
+        kept = dict(counts.most_common(max_strata - 1))
+        kept['*'] = population - sum(kept.values())
+        counts = Counter(kept)
+
+    def stratum(sql):
+        t = statement_template(sql)
+        return t if t in counts else '*'
+
+    alloc = _allocate(counts, min(k, population))
+
+    # Pass 2: one reservoir per template
+    reservoirs = {t: [] for t in counts}
+    seen = Counter()
+    for sql in _open_statements(workload_path):
+        t = stratum(sql)
+        res, cap = reservoirs[t], alloc[t]
+        if seen[t] < cap:
+            res.append(sql)
+        else:
+            j = rng.randint(0, seen[t])
+            if j < cap:
+                res[j] = sql
+        seen[t] += 1
+    strata = {t: (counts[t], reservoirs[t]) for t in counts}
+    return strata, head[:2]
+
+
+def _ratio_stats(delta: WorkloadFeatures, names: Dict[str, int], table_idx: np.ndarray, y: np.ndarray, x: np.ndarray) -> None:
+    """Fill numerator y and denominator x of every ratio statistic for one statement."""
+    q = delta.read_cnt + delta.write_cnt
+    pred_sum = sum(delta.predicate_dict.values())
+    tbl_sum = sum(delta.tbl_dict.values())
+    scalar = {
+        'read_write_ratio': (delta.read_cnt, q),
+        'group_by_ratio': (delta.group_by_num, q),
+        'order_by_ratio': (delta.order_by_num, q),
+        'aggregation_ratio': (delta.aggr_num, q),
+        'average_predicate_num': (delta.predicate_num, q),
+    }
+    for p in PREDICATE_TYPES:
+        scalar[f'predicate_ratio[{p}]'] = (delta.predicate_dict.get(p, 0), pred_sum)
+    for k, (num, den) in scalar.items():
+        y[names[k]] = num
+        x[names[k]] = den
+    for t, cnt in delta.tbl_dict.items():
+        i = names.get(f'table[{t}]')
+        if i is not None:
+            y[i] = cnt
+    x[table_idx] = tbl_sum
+    for t, cols in delta.tbl_col_dict.items():
+        col_sum = sum(cols.values())
+        for c, v in cols.items():
+            i = names.get(f'column[{t}.{c}]')
+            if i is not None:
+                y[i] = v
+                x[i] = col_sum
+
+
+# Ratio statistics that are per-statement averages rather than shares of a total
+_COUNT_RATIOS = ('group_by_ratio', 'order_by_ratio', 'aggregation_ratio', 'average_predicate_num')
+
+
+def _ratio_variance(rows, R: np.ndarray) -> np.ndarray:
+    """Stratified variance of the linearized residuals y - R*x.
+
+    A stratum sampled once has no variance estimate of its own. Such strata
+    are collapsed into one group whose variance is the larger of the spread
+    of their estimated residual totals and the pooled within-stratum variance.
+    """
+    var = np.zeros(len(R))
+    ss = np.zeros(len(R))
+    dof = 0
+    singles = []
+    for n_pop, n, ys, xs in rows:
+        e = ys - R * xs
+        if n >= 2:
+            s2 = e.var(axis=0, ddof=1)
+            var += n_pop ** 2 * (1 - n / n_pop) * s2 / n
+            ss += (n - 1) * s2
+            dof += n - 1
+        elif n_pop > 1:
+            singles.append((n_pop, e[0]))
+    if singles:
+        pooled = sum(n_pop ** 2 * (1 - 1 / n_pop) for n_pop, _ in singles) * (ss / dof if dof else 0.0)
+        if len(singles) >= 2:
+            totals = np.array([n_pop * np.sqrt(1 - 1 / n_pop) * e for n_pop, e in singles])
+            collapsed = len(singles) / (len(singles) - 1) * ((totals - totals.mean(axis=0)) ** 2).sum(axis=0)
+            pooled = np.maximum(pooled, collapsed)
+        var += pooled
+    return var
+
+
+def sample_workload(wp, workload_path: str, method: str = 'reservoir', sample_size: Optional[int] = None,
+                    target_error: Optional[float] = None, time_budget: Optional[float] = None,
+                    confidence: float = 0.95, seed: Optional[int] = None, access_graph: bool = True) -> WorkloadFeatures:
+    """Estimate WP2.parse_workload statistics from a sample of the trace.
+
+    Counters of the returned WorkloadFeatures are weighted population
+    estimates rounded to integers; feats.intervals maps every ratio statistic (global ratios,
+    table[...] and column[...] access fractions) to [estimate, low, high].
+    """
+    if method not in ('reservoir', 'stratified'):
+        raise ValueError(f"Unknown sampling method '{method}'. Supported: ['reservoir', 'stratified']")
+    rng = random.Random(seed)
+    draw = _draw_reservoir if method == 'reservoir' else _draw_stratified
+    strata, head = draw(wp, workload_path, sample_size, target_error, time_budget, confidence, rng)
+
+    names = ['read_write_ratio', 'group_by_ratio', 'order_by_ratio', 'aggregation_ratio', 'average_predicate_num']
+    names += [f'predicate_ratio[{p}]' for p in PREDICATE_TYPES]
+    for table in wp.dbs.tables:
+        names.append(f'table[{table.name}]')
+    for table in wp.dbs.tables:
+        names += [f'column[{table.name}.{c.name}]' for c in table.col]
+    index = {k: i for i, k in enumerate(names)}
+    table_idx = np.array([i for k, i in index.items() if k.startswith('table[')], dtype=np.intp)
+
+    feats = WorkloadFeatures(workload_path=workload_path, sample_sqls=[s + " ;" for s in head],
+                             access_graph=AccessGraph(wp.dbs) if access_graph else None)
+    # Per-stratum (population, sample size, numerators, denominators)
+    rows = []
+    population = 0
+    sampled = 0
+    for t, (n_pop, sample) in strata.items():
+        population += n_pop
+        if not sample:
+            continue
+        w = n_pop / len(sample)
+        ys = np.zeros((len(sample), len(names)))
+        xs = np.zeros((len(sample), len(names)))
+        for r, sql in enumerate(sample):
+            delta = WorkloadFeatures(access_graph=AccessGraph(wp.dbs) if access_graph else None)
+            if wp.analyze_statement(sql, delta) is None:
+                continue
+            delta.statement_num = 1
+            feats.add(delta, w)
+            _ratio_stats(delta, index, table_idx, ys[r], xs[r])
+        rows.append((n_pop, len(sample), ys, xs))
+        sampled += len(sample)
+    wp.finalize_features(feats.round_counts())
+
+    # Linearized variance of the ratio estimator R = Y/X, summed over strata
+    Y = sum(n_pop / n * ys.sum(axis=0) for n_pop, n, ys, xs in rows)
+    X = sum(n_pop / n * xs.sum(axis=0) for n_pop, n, ys, xs in rows)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        R = np.where(X > 0, Y / X, 0.0)
+    se = np.sqrt(_ratio_variance(rows, R)) / np.where(X > 0, X, np.inf)
+    # A sample where every statement agrees (p = 0 or 1, or the same count) has no
+    # spread; bound the error of share statistics by the binomial one with p kept
+    # off the edges, and of per-statement counts by the Poisson one with the mean kept off 0
+    proportion = np.array([k not in _COUNT_RATIOS for k in names])
+    n_eff = sum((xs > 0).sum(axis=0) for n_pop, n, ys, xs in rows)
+    fpc = 1 - sampled / population if population else 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = np.clip(R, 0.5 / n_eff, 1 - 0.5 / n_eff)
+        unit_var = np.where(proportion, p * (1 - p), np.maximum(R, 0.5 / n_eff))
+        floor = np.where(n_eff > 0, np.sqrt(unit_var / n_eff * max(fpc, 0.0)), 0.0)
+    se = np.maximum(se, floor)
+    z = z_value(confidence)
+    low = np.maximum(R - z * se, 0.0)
+    high = np.where(proportion, np.minimum(R + z * se, 1.0), R + z * se)
+    feats.intervals = {k: [float(R[i]), float(low[i]), float(high[i])] for k, i in index.items()}
+    feats.sample_info = {
+        'method': method,
+        'population_size': population,
+        'sample_size': sampled,
+        'strata': len(strata),
+        'confidence': confidence,
+    }
+    return feats